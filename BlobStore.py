@@ -0,0 +1,250 @@
+"""Content-addressed, deduplicated storage for attachments and images.
+
+A blob is identified by the SHA-256 of its content and stored as a manifest
+listing fixed-size chunks, each itself stored once under its own hash:
+
+    <root>/chunks/<aa>/<chunk hash>
+    <root>/blobs/<aa>/<blob hash>.json   {"size": ..., "chunks": [...], "refs": ...}
+
+Attaching the same file to many pages only bumps the blob's reference
+count, and files that share whole chunks share their storage. Chunks are
+read through mmap. collect_garbage() drops blobs nobody references any more
+and then every chunk no remaining blob uses.
+
+Imports, reference changes and garbage collection take an exclusive lock on
+<root>/lock, so the app and maintenance.py running in another process never
+interleave. Chunk files modified within GRACE_PERIOD are left alone by
+garbage collection all the same, in case a writer doesn't take the lock.
+
+Fixed-size chunks are used rather than content-defined ones: computing a
+rolling hash byte by byte in Python would make imports far slower than the
+extra sharing is worth for typical attachments.
+"""
+
+import fcntl
+import hashlib
+import io
+import json
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+CHUNK_SIZE = 1 << 20
+GRACE_PERIOD = 3600  # seconds
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(root, "chunks"), exist_ok=True)
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+
+    def put_file(self, path):
+        """Stores a file (or adds a reference if it is already stored); returns its hash."""
+        with open(path, "rb") as f:
+            return self.put_stream(f)
+
+    def put_bytes(self, data):
+        return self.put_stream(io.BytesIO(data))
+
+    def put_stream(self, stream):
+        # Held for the whole import so garbage collection can't remove chunks
+        # that were just written but aren't referenced by a manifest yet
+        with self._locked():
+            digest = hashlib.sha256()
+            chunks, size = [], 0
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                size += len(chunk)
+                chunks.append(self._put_chunk(chunk))
+            key = digest.hexdigest()
+
+            manifest = self._manifest(key)
+            if manifest is None:
+                manifest = {"size": size, "chunks": chunks, "refs": 0}
+            manifest["refs"] += 1
+            self._write_manifest(key, manifest)
+        return key
+
+    def add_ref(self, key):
+        self._change_refs(key, 1)
+
+    def release(self, key):
+        """Drops one reference; the data goes away at the next collect_garbage()."""
+        self._change_refs(key, -1)
+
+    def exists(self, key):
+        return os.path.exists(self._manifest_path(key))
+
+    def size(self, key):
+        return self._require(key)["size"]
+
+    def refs(self, key):
+        return self._require(key)["refs"]
+
+    def open(self, key):
+        """Returns a seekable, read-only file object over the blob's memory-mapped chunks."""
+        manifest = self._require(key)
+        return io.BufferedReader(BlobReader([self._chunk_path(c) for c in manifest["chunks"]], manifest["size"]))
+
+    def read(self, key):
+        with self.open(key) as f:
+            return f.read()
+
+    def export(self, key, path):
+        """Writes the blob to a regular file, e.g. to open it in another application."""
+        with self.open(key) as src, open(path, "wb") as dst:
+            for block in iter(lambda: src.read(CHUNK_SIZE), b""):
+                dst.write(block)
+
+    def keys(self):
+        blobs = os.path.join(self.root, "blobs")
+        for prefix in os.listdir(blobs):
+            for name in os.listdir(os.path.join(blobs, prefix)):
+                if name.endswith(".json"):
+                    yield name[:-len(".json")]
+
+    def collect_garbage(self):
+        """Removes unreferenced blobs and orphaned chunks; returns (blobs, chunks, bytes) freed."""
+        cutoff = time.time() - GRACE_PERIOD
+        with self._locked():
+            live_chunks, blobs_removed = set(), 0
+            for key in list(self.keys()):
+                manifest = self._manifest(key)
+                if manifest["refs"] <= 0:
+                    os.remove(self._manifest_path(key))
+                    blobs_removed += 1
+                else:
+                    live_chunks.update(manifest["chunks"])
+
+            chunks_removed = bytes_freed = 0
+            chunks = os.path.join(self.root, "chunks")
+            for prefix in os.listdir(chunks):
+                for name in os.listdir(os.path.join(chunks, prefix)):
+                    path = os.path.join(chunks, prefix, name)
+                    if name not in live_chunks and os.path.getmtime(path) < cutoff:
+                        bytes_freed += os.path.getsize(path)
+                        os.remove(path)
+                        chunks_removed += 1
+        return blobs_removed, chunks_removed, bytes_freed
+
+    def verify(self, key):
+        """Re-hashes a blob's content; returns True if it is intact."""
+        digest = hashlib.sha256()
+        try:
+            with self.open(key) as f:
+                for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(block)
+        except OSError:
+            return False
+        return digest.hexdigest() == key
+
+    def _put_chunk(self, data):
+        key = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return key
+
+    @contextmanager
+    def _locked(self):
+        """Excludes other threads of this process and, through flock, other processes."""
+        with self.lock, open(os.path.join(self.root, "lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _change_refs(self, key, delta):
+        with self._locked():
+            manifest = self._require(key)
+            manifest["refs"] += delta
+            self._write_manifest(key, manifest)
+
+    def _chunk_path(self, key):
+        return os.path.join(self.root, "chunks", key[:2], key)
+
+    def _manifest_path(self, key):
+        return os.path.join(self.root, "blobs", key[:2], key + ".json")
+
+    def _manifest(self, key):
+        try:
+            with open(self._manifest_path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _require(self, key):
+        manifest = self._manifest(key)
+        if manifest is None:
+            raise KeyError(key)
+        return manifest
+
+    def _write_manifest(self, key, manifest):
+        path = self._manifest_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+
+
+class BlobReader(io.RawIOBase):
+    """Raw reader over a sequence of chunk files, each mapped into memory on first use."""
+
+    def __init__(self, chunk_paths, size):
+        super().__init__()
+        self.chunk_paths = chunk_paths
+        self.size = size
+        self.pos = 0
+        self.maps = {}
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        written = 0
+        while written < len(view) and self.pos < self.size:
+            index, offset = divmod(self.pos, CHUNK_SIZE)
+            chunk = self._map(index)
+            count = min(len(view) - written, len(chunk) - offset)
+            view[written:written + count] = chunk[offset:offset + count]
+            written += count
+            self.pos += count
+        return written
+
+    def close(self):
+        for mapped in self.maps.values():
+            mapped.close()
+        self.maps.clear()
+        super().close()
+
+    def _map(self, index):
+        mapped = self.maps.get(index)
+        if mapped is None:
+            with open(self.chunk_paths[index], "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[index] = mapped
+        return mapped
@@ -0,0 +1,123 @@
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Stroke import Stroke
+from StrokeLog import PageReplica, SocketTransport, DirectoryTransport, encode_ops, sync
+
+
+def stroke(x, y, length=20):
+    return Stroke.from_points([(x + i, y + i / 2) for i in range(length)], 0xFF000000, 2.0)
+
+
+def state(replica):
+    return replica.strokes(), replica.shapes(), replica.texts()
+
+
+def concurrent_edits():
+    """Two replicas that share a page, then edit it concurrently without syncing."""
+    a, b = PageReplica("laptop"), PageReplica("tablet")
+    shared = a.add_stroke(stroke(10, 10))
+    kept = a.add_stroke(stroke(50, 10))
+    a.set_text("title", "Meeting")
+    b.apply(a.ops_since(b.version_vector()))
+
+    # laptop erases a stroke the tablet moves; both add strokes and retitle the page
+    a.erase_stroke(shared)
+    a.add_stroke(stroke(100, 100))
+    a.set_text("title", "Meeting notes")
+    b.move_stroke(shared, 5, 5)
+    b.move_stroke(kept, -3, 2)
+    tablet_stroke = b.add_stroke(stroke(200, 50))
+    b.set_text("title", "Standup")
+    # the tablet also erases a stroke of its own the laptop has never seen
+    b.erase_stroke(tablet_stroke)
+    return a, b
+
+
+def run_sync(a, b, transports, a_initiates):
+    """Runs one sync between a and b, each on its own thread, over a pair of transports."""
+    results = {}
+
+    def side(name, replica, transport, initiator):
+        results[name] = sync(replica, transport, initiator)
+
+    threads = [threading.Thread(target=side, args=("a", a, transports[0], a_initiates)),
+               threading.Thread(target=side, args=("b", b, transports[1], not a_initiates))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for transport in transports:
+        transport.close()
+    return results["a"], results["b"]
+
+
+def socket_transports():
+    left, right = socket.socketpair()
+    return SocketTransport(left), SocketTransport(right)
+
+
+def directory_transports(path):
+    return (DirectoryTransport(path, "laptop", "tablet", timeout=5.0),
+            DirectoryTransport(path, "tablet", "laptop", timeout=5.0))
+
+
+def check(name, a, b):
+    assert state(a) == state(b), f"{name}: replicas differ after sync"
+    assert a.version_vector() == b.version_vector(), f"{name}: version vectors differ"
+    print(f"{name}: converged on {len(a.strokes())} strokes, texts {a.texts()}")
+
+
+def main():
+    reference = None
+    with tempfile.TemporaryDirectory() as directory:
+        for a_initiates in (True, False):
+            for kind in ("socket", "directory"):
+                a, b = concurrent_edits()
+                transports = socket_transports() if kind == "socket" else \
+                    directory_transports(os.path.join(directory, f"{kind}-{a_initiates}"))
+                received = run_sync(a, b, transports, a_initiates)
+                name = f"{kind}, {'laptop' if a_initiates else 'tablet'} initiates"
+                check(name, a, b)
+                assert received == (5, 3), f"{name}: expected only the missing operations, got {received}"
+
+                # Every order of sync must end in the same page
+                if reference is None:
+                    reference = state(a)
+                assert state(a) == reference, f"{name}: differs from the other sync orders"
+
+                # A second sync has nothing left to send
+                assert run_sync(a, b, socket_transports(), a_initiates) == (0, 0), f"{name}: resync not empty"
+
+    # Applying the same operations one by one, in opposite orders, gives the same page
+    a, b = concurrent_edits()
+    c = PageReplica("phone")
+    for op in a.ops_since({}) + b.ops_since({}):
+        c.apply([op])
+    d = PageReplica("desktop")
+    for op in reversed(b.ops_since({}) + a.ops_since({})):
+        d.apply([op])
+    check("operation order", c, d)
+    assert state(c) == reference, "operation order: differs from sync result"
+
+    # Compacting drops the erased strokes but changes neither the page nor what peers end up with
+    a, b = concurrent_edits()
+    run_sync(a, b, socket_transports(), True)
+    size = len(encode_ops(a.ops_since({})))
+    folded = a.compact()
+    assert folded and state(a) == reference, "compact: changed the page"
+    assert len(encode_ops(a.ops_since({}))) < size, "compact: log did not shrink"
+    for peer in (PageReplica("phone"), b):
+        run_sync(a, peer, socket_transports(), True)
+        check(f"compacted to {peer.device_id}", a, peer)
+    print(f"compact: {folded} operations folded, log {size} -> {len(encode_ops(a.ops_since({})))} bytes")
+    print("All sync checks passed")
+
+
+if __name__ == "__main__":
+    main()
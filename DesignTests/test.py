@@ -1,18 +1,212 @@
+import os
+import re
 import sys
-
-from PySide6.QtCore import Qt, QSize, QPoint
-from PySide6.QtGui import QIcon, QPainter, QPixmap, QPen, QFont
+import tempfile
+from bisect import bisect_right
+from collections import OrderedDict
+
+from PySide6.QtCore import (Qt, QSize, QPoint, QPointF, QRect, QRectF, QTimer, QThread, QUrl, Signal,
+                            QBuffer, QByteArray, QEvent, QIODevice)
+from PySide6.QtGui import (QIcon, QPainter, QPainterPath, QPainterPathStroker, QPixmap, QPen, QFont, QColor, QImage, QImageIOHandler,
+                           QImageReader, QDesktopServices, QPolygonF)
 from PySide6.QtWidgets import (QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout,
                                QHBoxLayout, QTreeWidget, QTreeWidgetItem,
                                QSplitter, QLabel, QPushButton, QComboBox,
-                               QScrollArea, QFrame, QLineEdit)
+                               QScrollArea, QFrame, QLineEdit, QMenu, QFileDialog,
+                               QProgressDialog, QInputDialog)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import NotebookStore
+import PageExporter
+import PenBindings
+import ShapeRecognizer
+import TableObject
+import Theme
+from BlobStore import BlobStore
+from ExportJob import ExportJob
+from ImagePyramid import ImagePyramid, PyramidBuilder, TileCache, TileFiles, paint_pyramid
+from RenderProfiler import profiler as renderProfiler, traced
+from StartupProfiler import StartupProfiler
+from Stroke import Stroke
+from TitleFilter import ItemFilter, FRAME_BUDGET
+
+try:
+    from PenButtonListener import PenButtonListener
+except ImportError:  # evdev is only available on Linux
+    PenButtonListener = None
+
+
+class CanvasPicture:
+    """A picture placed on the canvas; pyramid is None until it has been built."""
+
+    def __init__(self, source, rect):
+        self.source = source
+        self.rect = rect
+        self.key = None
+        self.pyramid = None
+
+
+class CanvasShape:
+    """A drawn or recognized shape, kept as a vector path instead of ink pixels."""
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.path = ShapeRecognizer.painter_path(shape)
+        margin = shape.width / 2 + 1
+        self.rect = self.path.boundingRect().adjusted(-margin, -margin, margin, margin)
+
+
+class CanvasTable:
+    """A table on the canvas; rect is its frame, scroll how far its rows are scrolled within it."""
+
+    def __init__(self, model, rect):
+        self.model = model
+        self.rect = rect
+        self.scroll = 0
+
+    def cellRect(self, row, column):
+        """Returns a cell's rectangle in canvas coordinates."""
+        return self.model.cell_rect(row, column).translated(self.rect.left(), self.rect.top() - self.scroll)
+
+    def rowRect(self, row):
+        return QRectF(self.rect.left(), self.rect.top() + row * TableObject.ROW_HEIGHT - self.scroll,
+                      self.rect.width(), TableObject.ROW_HEIGHT).intersected(self.rect)
+
+
+class CanvasAttachment:
+    """A file attached to the page, stored in the blob store under key."""
+
+    def __init__(self, name, key, rect):
+        self.name = name
+        self.key = key
+        self.rect = rect
+
+
+class AttachmentImport(QThread):
+    """Copies a file into the blob store off the GUI thread."""
+
+    imported = Signal(str, str)  # path, key
+    failed = Signal(str, str)  # path, error
+
+    def __init__(self, blobStore, path, parent=None):
+        super().__init__(parent)
+        self.blobStore = blobStore
+        self.path = path
+
+    def run(self):
+        try:
+            self.imported.emit(self.path, self.blobStore.put_file(self.path))
+        except OSError as e:
+            self.failed.emit(self.path, str(e))
+
+
+class PageExport(QThread):
+    """Writes one page, its ink and objects as they are now, to PNG, SVG or PDF off the GUI thread."""
+
+    exported = Signal(str)  # path
+    failed = Signal(str, str)  # path, error
+
+    def __init__(self, content, ink, width, path, fmt, parent=None):
+        """ink is the page's ink as a QImage, or as PNG data, or None when blank."""
+        super().__init__(parent)
+        self.ink = ink
+        self.size = (width, content.height)
+        # Copies of the lists, so objects added or removed meanwhile don't change what's drawn
+        self.objects = (list(content.shapes), list(content.pictures), list(content.tables),
+                        list(content.attachments))
+        self.path = path
+        self.fmt = fmt
+
+    def run(self):
+        ink = QImage.fromData(self.ink, "PNG") if isinstance(self.ink, QByteArray) else self.ink
+
+        def paint(painter):
+            if ink is not None:
+                painter.drawImage(0, 0, ink)
+            paintPageObjects(painter, *self.objects, TileFiles(), QRect(0, 0, *self.size))
+
+        try:
+            PageExporter.write_page(self.path, self.fmt, *self.size, paint)
+        except OSError as e:
+            self.failed.emit(self.path, str(e))
+        else:
+            self.exported.emit(self.path)
+
+
+class PageContent:
+    """Everything on one page; it outlives the Canvas showing it, since canvases are recycled."""
+
+    def __init__(self, height=600):
+        self.height = height
+        self.inkPng = None  # the ink as PNG, saved when the page leaves its canvas; None while blank
+        self.pictures = []
+        self.attachments = []
+        self.tables = []
+        self.shapes = []
+        # (rect, ink in rect, shapes) as they were before each edit; kept here
+        # so undo survives the page moving to another canvas
+        self.undoStack = []
+        self.redoStack = []
+
+    def blobKeys(self):
+        """Keys of the stored files the page holds a reference to, one per object."""
+        return [o.key for o in self.pictures + self.attachments if o.key is not None]
+
+
+def paintPageObjects(painter, shapes, pictures, tables, attachments, tileCache, exposed):
+    """Draws a page's shapes, pictures, tables and attachments, in page coordinates, where exposed."""
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.setBrush(Qt.NoBrush)
+    for item in shapes:
+        if item.rect.intersects(QRectF(exposed)):
+            painter.setPen(QPen(QColor.fromRgba(item.shape.color), item.shape.width,
+                                Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
+            painter.drawPath(item.path)
+            renderProfiler.count_items("shape")
+    for picture in pictures:
+        if not picture.rect.intersects(QRectF(exposed)):
+            continue
+        renderProfiler.count_items("picture")
+        if picture.pyramid is None:
+            painter.fillRect(picture.rect, QColor(235, 235, 235))
+        else:
+            paint_pyramid(painter, picture.pyramid, tileCache, picture.rect, exposed)
+    for table in tables:
+        if table.rect.intersects(QRectF(exposed)):
+            renderProfiler.count_items("table")
+            TableObject.paint_table(painter, table.model, table.rect, table.scroll, exposed)
+    for attachment in attachments:
+        if not attachment.rect.intersects(QRectF(exposed)):
+            continue
+        renderProfiler.count_items("attachment")
+        painter.setPen(QColor(200, 200, 200))
+        painter.setBrush(QColor(245, 245, 245))
+        painter.drawRoundedRect(attachment.rect, 4, 4)
+        painter.setPen(Qt.black)
+        painter.drawText(attachment.rect.adjusted(10, 0, -10, 0), Qt.AlignVCenter | Qt.AlignLeft,
+                         "\U0001F4CE " + attachment.name)
 
 
 class Canvas(QWidget):
-    def __init__(self, parent=None):
+    PICTURE_MAX_WIDTH = 600
+    PICTURE_SPACING = 20
+    ATTACHMENT_SIZE = (220, 36)
+    UNDO_LIMIT = 50  # edits per page
+    HIGHLIGHTER = (QColor(255, 241, 118), 14)
+    ERASER_WIDTH = 16
+    BACKUP_MARGIN = 64  # pixels the ink kept for undo grows by at a time, so a stroke rarely regrows it
+
+    pageHeightChanged = Signal(int)
+    pictureFailed = Signal(str, str)  # source, error
+
+    def __init__(self, blobStore=None, parent=None, tileCache=None, pyramidBuilder=None):
+        """Canvases that show pages of one section share its tile cache and pyramid builder."""
         super().__init__(parent)
+        self.blobStore = blobStore
         self.setMinimumSize(800, 600)
         self.setAttribute(Qt.WA_StaticContents)
+        self.setFocusPolicy(Qt.ClickFocus)
         self.modified = False
         self.scribbling = False
         self.myPenWidth = 1
@@ -21,39 +215,481 @@ class Canvas(QWidget):
         self.image.fill(Qt.white)
         self.lastPoint = QPoint()
 
+        # Pictures are decoded into tile pyramids on a worker thread and drawn from a tile cache
+        self.tileCache = tileCache or TileCache(parent=self)
+        self.tileCache.tileReady.connect(self.update)
+        if pyramidBuilder is None:
+            pyramidBuilder = PyramidBuilder(blob_store=blobStore, parent=self)
+            pyramidBuilder.built.connect(self.onPyramidBuilt)
+            pyramidBuilder.failed.connect(self.onPyramidFailed)
+            QApplication.instance().aboutToQuit.connect(pyramidBuilder.stop)
+            # Nothing on a canvas is saved yet, so its stored files are let go on exit
+            QApplication.instance().aboutToQuit.connect(lambda: self.releaseBlobs(self.content.blobKeys()))
+        self.pyramidBuilder = pyramidBuilder
+
+        self.cellEditor = None
+        self.editingCell = None  # (table, row, column) while a cell is being edited
+
+        # With a shape tool selected a drag draws that shape; with recognition
+        # on, freehand strokes that fit a shape are replaced by it on pen-up
+        self.shapeTool = None
+        self.recognizeShapes = False
+        self.previewShape = None
+        self.strokePoints = []
+        # The ink the stroke has drawn over, as it was before, and where; None until it draws
+        self.inkBeforeStroke = None
+        self.inkBeforeStrokeRect = None
+        self.shapesBeforeStroke = None
+
+        # One of PenBindings.TOOLS; the lasso selects, and Delete removes the selection
+        self.tool = "pen"
+        self.strokeTool = self.tool
+        self.selection = None
+
+        self.setContent(PageContent())
+
+    def setContent(self, content):
+        """Shows a page. Its object lists are used in place, so edits go straight into content."""
+        self.content = content
+        self.pictures = content.pictures
+        self.attachments = content.attachments
+        self.tables = content.tables
+        self.shapes = content.shapes
+        self.selection = None
+        self.setMinimumHeight(content.height)
+        self.image = QPixmap()
+        if content.inkPng is None or not self.image.loadFromData(content.inkPng, "PNG"):
+            self.image = QPixmap(max(self.width(), 800), max(self.height(), content.height))
+            self.image.fill(Qt.white)
+        self.inkChanged = False
+        self.update()
+
+    def takeContent(self):
+        """Lets go of the page, saving its ink if it changed, so the canvas can show another."""
+        self.commitCell()
+        self.scribbling = False
+        self.previewShape = None
+        self.inkBeforeStroke = self.inkBeforeStrokeRect = None
+        if self.inkChanged:
+            data = QByteArray()
+            buffer = QBuffer(data)
+            buffer.open(QIODevice.WriteOnly)
+            self.image.save(buffer, "PNG")
+            self.content.inkPng = data
+        self.content.height = max(self.content.height, self.minimumHeight())
+        return self.content
+
+    def nextFreeTop(self):
+        objects = self.pictures + self.attachments + self.tables
+        return max((o.rect.bottom() for o in objects), default=0) + self.PICTURE_SPACING
+
+    def placeObject(self, rect):
+        height = max(self.minimumHeight(), int(rect.bottom()) + self.PICTURE_SPACING)
+        if height != self.minimumHeight():
+            self.setMinimumHeight(height)
+            self.content.height = height
+            self.pageHeightChanged.emit(height)
+        self.update(rect.toAlignedRect())
+
+    def addPicture(self, path):
+        """Places a picture below the existing ones; it shows up once its pyramid is ready."""
+        reader = QImageReader(path)
+        # The pyramid is built upright, so size the picture as it will be drawn
+        reader.setAutoTransform(True)
+        size = reader.size()  # reads the header only
+        if reader.transformation() & QImageIOHandler.TransformationRotate90:
+            size.transpose()
+        if not size.isValid():
+            return False
+        width = min(self.PICTURE_MAX_WIDTH, size.width())
+        height = size.height() * width / size.width()
+        picture = CanvasPicture(path, QRectF(self.PICTURE_SPACING, self.nextFreeTop(), width, height))
+        self.pictures.append(picture)
+        self.placeObject(picture.rect)
+        self.pyramidBuilder.enqueue(path)
+        return True
+
+    def onPyramidBuilt(self, source, key):
+        pyramid = ImagePyramid.load(key)
+        for picture in self.pictures:
+            if picture.source == source and picture.pyramid is None:
+                picture.key = key
+                picture.pyramid = pyramid
+                self.update(picture.rect.toAlignedRect())
+                return
+        # The picture was removed while its pyramid was being built
+        self.releaseBlobs([key])
+
+    def releaseBlobs(self, keys):
+        if self.blobStore is not None:
+            for key in keys:
+                self.blobStore.release(key)
+
+    def objectAt(self, pos):
+        for objects in (self.tables, self.attachments, self.pictures):
+            for obj in reversed(objects):
+                if obj.rect.contains(pos):
+                    return obj
+        return None
+
+    def removeObject(self, obj):
+        """Takes a picture, attachment or table off the page, releasing its stored file."""
+        if self.editingCell is not None and self.editingCell[0] is obj:
+            self.editingCell = None
+            self.cellEditor.hide()
+        for objects in (self.pictures, self.attachments, self.tables):
+            if obj in objects:
+                objects.remove(obj)
+        key = getattr(obj, "key", None)
+        if key is not None:
+            self.releaseBlobs([key])
+        self.modified = True
+        self.update(obj.rect.toAlignedRect())
+
+    def contextMenuEvent(self, event):
+        obj = self.objectAt(QPointF(event.pos()))
+        if obj is None:
+            super().contextMenuEvent(event)
+            return
+        menu = QMenu(self)
+        menu.addAction("Remove", lambda: self.removeObject(obj))
+        menu.exec(event.globalPos())
+
+    def addAttachment(self, name, key):
+        """Shows a stored attachment as a chip; double-click opens it."""
+        width, height = self.ATTACHMENT_SIZE
+        attachment = CanvasAttachment(name, key, QRectF(self.PICTURE_SPACING, self.nextFreeTop(), width, height))
+        self.attachments.append(attachment)
+        self.placeObject(attachment.rect)
+
+    def addTable(self, columns, rows):
+        model = TableObject.TableModel(columns, rows, self.font())
+        table = CanvasTable(model, QRectF(self.PICTURE_SPACING, self.nextFreeTop(),
+                                          model.width(), TableObject.frame_height(model)))
+        self.tables.append(table)
+        self.placeObject(table.rect)
+        self.editCell(table, 0, 0)
+
+    def tableAt(self, pos):
+        for table in self.tables:
+            if table.rect.contains(pos):
+                return table
+        return None
+
+    def scrollTable(self, table, scroll):
+        limit = max(0, table.model.height() - table.rect.height())
+        scroll = max(0, min(limit, scroll))
+        if scroll != table.scroll:
+            table.scroll = scroll
+            self.update(table.rect.toAlignedRect())
+
+    def editCell(self, table, row, column):
+        """Opens an editor over one cell, scrolling the table so the cell is in view."""
+        if self.editingCell is not None:
+            self.commitCell()
+        top = row * TableObject.ROW_HEIGHT
+        if top < table.scroll:
+            self.scrollTable(table, top)
+        elif top + TableObject.ROW_HEIGHT > table.scroll + table.rect.height():
+            self.scrollTable(table, top + TableObject.ROW_HEIGHT - table.rect.height())
+
+        if self.cellEditor is None:
+            self.cellEditor = QLineEdit(self)
+            self.cellEditor.setFrame(False)
+            self.cellEditor.returnPressed.connect(self.editNextRow)
+            self.cellEditor.editingFinished.connect(self.commitCell)
+        self.editingCell = (table, row, column)
+        self.cellEditor.setGeometry(table.cellRect(row, column).toAlignedRect())
+        self.cellEditor.setText(table.model.text(row, column))
+        self.cellEditor.show()
+        self.cellEditor.setFocus()
+
+    def commitCell(self):
+        if self.editingCell is None:
+            return
+        table, row, column = self.editingCell
+        self.editingCell = None
+        self.cellEditor.hide()
+        text = self.cellEditor.text()
+        if text == table.model.text(row, column):
+            return
+        if table.model.set_cell(row, column, text):
+            # A column got wider or narrower: everything right of it moves
+            old = table.rect.toAlignedRect()
+            table.rect.setWidth(table.model.width())
+            self.update(old.united(table.rect.toAlignedRect()))
+        else:
+            self.update(table.rowRect(row).toAlignedRect())
+        self.modified = True
+
+    def editNextRow(self):
+        """Enter moves down a row, adding one at the end of the table."""
+        table, row, column = self.editingCell
+        self.commitCell()
+        if row + 1 == table.model.rows:
+            table.model.insert_row(row + 1)
+            if TableObject.frame_height(table.model) > table.rect.height() and table is self.tables[-1]:
+                table.rect.setHeight(TableObject.frame_height(table.model))
+                self.placeObject(table.rect)
+        # After the editor's editingFinished, which follows returnPressed
+        QTimer.singleShot(0, lambda: self.editCell(table, row + 1, column))
+
+    def wheelEvent(self, event):
+        table = self.tableAt(event.position())
+        if table is not None and table.model.height() > table.rect.height():
+            if self.editingCell is not None:
+                self.commitCell()
+            self.scrollTable(table, table.scroll - event.angleDelta().y() / 120 * 3 * TableObject.ROW_HEIGHT)
+            event.accept()
+            return
+        super().wheelEvent(event)
+
+    def openAttachment(self, attachment):
+        folder = os.path.join(tempfile.gettempdir(), "pynote-attachments", attachment.key)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, attachment.name)
+        if not os.path.exists(path):
+            self.blobStore.export(attachment.key, path)
+        QDesktopServices.openUrl(QUrl.fromLocalFile(path))
+
+    def mouseDoubleClickEvent(self, event):
+        table = self.tableAt(event.position())
+        if table is not None:
+            cell = table.model.cell_at(event.position().x() - table.rect.left(),
+                                       event.position().y() - table.rect.top() + table.scroll)
+            if cell is not None:
+                self.editCell(table, *cell)
+            return
+        for attachment in self.attachments:
+            if attachment.rect.contains(event.position()):
+                self.openAttachment(attachment)
+                return
+        super().mouseDoubleClickEvent(event)
+
+    def onPyramidFailed(self, source, error):
+        self.pictures[:] = [p for p in self.pictures if p.source != source]
+        self.pictureFailed.emit(source, error)
+        self.update()
+
     def setPenColor(self, color):
         self.myPenColor = color
 
     def setPenWidth(self, width):
         self.myPenWidth = width
 
+    def setShapeTool(self, kind):
+        self.shapeTool = kind
+
+    def setShapeRecognition(self, enabled):
+        self.recognizeShapes = enabled
+
+    def setTool(self, tool):
+        self.tool = tool
+        if tool != "lasso" and self.selection is not None:
+            self.selection = None
+            self.update()
+
+    def strokePen(self, tool):
+        if tool == "highlighter":
+            color, width = self.HIGHLIGHTER
+            return QPen(color, width, Qt.SolidLine, Qt.FlatCap, Qt.RoundJoin)
+        if tool == "eraser":
+            return QPen(Qt.white, self.ERASER_WIDTH, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+        return QPen(self.myPenColor, self.myPenWidth, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+
+    def recordEdit(self, rect, patch, shapes):
+        """Pushes the state before an edit: the ink in rect (None if no ink changed) and the shapes."""
+        undo = self.content.undoStack
+        undo.append((rect, patch, shapes))
+        del undo[:-self.UNDO_LIMIT]
+        self.content.redoStack.clear()
+
+    def undo(self):
+        self.swapEdit(self.content.undoStack, self.content.redoStack)
+
+    def redo(self):
+        self.swapEdit(self.content.redoStack, self.content.undoStack)
+
+    def swapEdit(self, source, target):
+        if not source:
+            return
+        rect, patch, shapes = source.pop()
+        target.append((rect, self.image.copy(rect) if patch is not None else None, list(self.shapes)))
+        if patch is not None:
+            painter = QPainter(self.image)
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            painter.drawPixmap(rect.topLeft(), patch)
+            painter.end()
+            self.inkChanged = True
+        self.shapes[:] = shapes
+        self.selection = None
+        self.modified = True
+        self.update()
+
+    def deleteSelection(self):
+        """Removes the ink and shapes inside the lasso selection."""
+        path, self.selection = self.selection, None
+        rect = path.boundingRect().toAlignedRect().adjusted(-1, -1, 1, 1).intersected(self.image.rect())
+        self.recordEdit(rect, self.image.copy(rect), list(self.shapes))
+        painter = QPainter(self.image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.fillPath(path, Qt.white)
+        painter.end()
+        self.shapes[:] = [item for item in self.shapes if not path.contains(item.rect)]
+        self.inkChanged = True
+        self.modified = True
+        self.update()
+
+    def keyPressEvent(self, event):
+        if self.selection is not None and event.key() in (Qt.Key_Delete, Qt.Key_Backspace):
+            self.deleteSelection()
+        elif self.selection is not None and event.key() == Qt.Key_Escape:
+            self.selection = None
+            self.update()
+        else:
+            super().keyPressEvent(event)
+
+    def backUpInk(self, rect):
+        """Keeps the ink in rect as it was before the stroke, for undo and for taking the stroke back."""
+        rect = rect.intersected(self.image.rect())
+        kept = self.inkBeforeStrokeRect
+        if kept is not None and kept.contains(rect):
+            return
+        margin = self.BACKUP_MARGIN
+        grown = rect.adjusted(-margin, -margin, margin, margin).intersected(self.image.rect())
+        if kept is not None:
+            grown = grown.united(kept)
+        # Outside the kept part the stroke hasn't drawn yet, so the image there is still as it was
+        patch = self.image.copy(grown)
+        if kept is not None:
+            painter = QPainter(patch)
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            painter.drawPixmap(kept.topLeft() - grown.topLeft(), self.inkBeforeStroke)
+            painter.end()
+        self.inkBeforeStroke, self.inkBeforeStrokeRect = patch, grown
+
+    def eraseShapes(self, start, end):
+        """Removes the shapes the eraser touches between start and end; they are drawn over the ink, not in it."""
+        path = QPainterPath(QPointF(start))
+        path.lineTo(QPointF(end))
+        stroker = QPainterPathStroker()
+        stroker.setWidth(self.ERASER_WIDTH)
+        stroker.setCapStyle(Qt.RoundCap)
+        swept = stroker.createStroke(path)
+        bounds = swept.boundingRect()
+        for item in [item for item in self.shapes if item.rect.intersects(bounds)]:
+            stroker.setWidth(item.shape.width)
+            if stroker.createStroke(item.path).intersects(swept):
+                self.shapes.remove(item)
+                self.update(item.rect.toAlignedRect())
+
+    def addShape(self, shape):
+        item = CanvasShape(shape)
+        self.shapes.append(item)
+        self.modified = True
+        self.update(item.rect.toAlignedRect())
+
     def clearImage(self):
         self.image.fill(Qt.white)
+        self.shapes.clear()
         self.modified = True
+        self.inkChanged = True
         self.update()
 
+    @traced("event", name="Canvas.mousePressEvent")
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
             self.lastPoint = event.position().toPoint()
             self.scribbling = True
-
+            # The whole stroke is drawn with the tool it started with, even if a pen button changes it meanwhile
+            self.strokeTool = self.tool
+            self.strokePoints = [(self.lastPoint.x(), self.lastPoint.y())]
+            if self.selection is not None:
+                self.selection = None
+                self.update()
+            if self.strokeTool != "lasso":
+                self.shapesBeforeStroke = list(self.shapes)
+
+    @traced("event", name="Canvas.mouseMoveEvent")
     def mouseMoveEvent(self, event):
         if (event.buttons() & Qt.LeftButton) and self.scribbling:
+            if self.strokeTool == "lasso":
+                self.strokePoints.append((event.position().x(), event.position().y()))
+                self.update()
+                return
+            if self.shapeTool is not None and self.strokeTool == "pen":
+                start, end = self.strokePoints[0], event.position()
+                self.previewShape = ShapeRecognizer.shape_from_drag(
+                    self.shapeTool, start[0], start[1], end.x(), end.y(),
+                    QColor(self.myPenColor).rgba(), self.myPenWidth)
+                self.update()
+                return
+            end = event.position().toPoint()
+            pen = self.strokePen(self.strokeTool)
+            margin = int(pen.widthF()) + 2
+            self.backUpInk(QRect(self.lastPoint, end).normalized().adjusted(-margin, -margin, margin, margin))
+            if self.strokeTool == "eraser":
+                self.eraseShapes(self.lastPoint, end)
             painter = QPainter(self.image)
-            painter.setPen(QPen(self.myPenColor, self.myPenWidth,
-                                Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
-            painter.drawLine(self.lastPoint, event.position().toPoint())
+            if self.strokeTool == "highlighter":
+                # Darken leaves ink showing through and doesn't build up where segments overlap
+                painter.setCompositionMode(QPainter.CompositionMode_Darken)
+            painter.setPen(pen)
+            painter.drawLine(self.lastPoint, end)
             self.modified = True
+            self.inkChanged = True
             self.lastPoint = event.position().toPoint()
+            self.strokePoints.append((self.lastPoint.x(), self.lastPoint.y()))
             self.update()
 
+    @traced("event", name="Canvas.mouseReleaseEvent")
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.LeftButton and self.scribbling:
             self.scribbling = False
-
+            if self.strokeTool == "lasso":
+                if len(self.strokePoints) > 2:
+                    self.selection = QPainterPath()
+                    self.selection.addPolygon(QPolygonF([QPointF(x, y) for x, y in self.strokePoints]))
+                    self.selection.closeSubpath()
+                self.strokePoints = []
+                self.update()
+                return
+            inkRect, patch = self.inkBeforeStrokeRect, self.inkBeforeStroke
+            if self.previewShape is not None:
+                self.addShape(self.previewShape)
+                self.previewShape = None
+            elif self.recognizeShapes and self.shapeTool is None and self.strokeTool == "pen" and patch is not None:
+                stroke = Stroke.from_points(self.strokePoints, QColor(self.myPenColor).rgba(), self.myPenWidth)
+                shape = ShapeRecognizer.recognize(stroke)
+                if shape is not None:
+                    # Take the freehand ink back; the shape replaces it
+                    painter = QPainter(self.image)
+                    painter.setCompositionMode(QPainter.CompositionMode_Source)
+                    painter.drawPixmap(inkRect.topLeft(), patch)
+                    painter.end()
+                    self.addShape(shape)
+                    inkRect = patch = None
+                    self.update()
+            if patch is not None or self.shapes != self.shapesBeforeStroke:
+                self.recordEdit(inkRect, patch, self.shapesBeforeStroke)
+            self.inkBeforeStroke = self.inkBeforeStrokeRect = None
+            self.shapesBeforeStroke = None
+            self.strokePoints = []
+
+    @traced("frame", name="Canvas.paintEvent", frame=True)
     def paintEvent(self, event):
         painter = QPainter(self)
         painter.drawPixmap(0, 0, self.image)
+        shapes = self.shapes + ([CanvasShape(self.previewShape)] if self.previewShape else [])
+        paintPageObjects(painter, shapes, self.pictures, self.tables, self.attachments, self.tileCache,
+                         event.rect())
+        if self.selection is not None or (self.strokeTool == "lasso" and self.scribbling):
+            painter.setBrush(Qt.NoBrush)
+            painter.setPen(QPen(QColor(30, 120, 220), 1, Qt.DashLine))
+            if self.selection is not None:
+                painter.drawPath(self.selection)
+            else:
+                painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in self.strokePoints]))
 
     def resizeEvent(self, event):
         if self.width() > self.image.width() or self.height() > self.image.height():
@@ -66,35 +702,321 @@ class Canvas(QWidget):
             self.image = newImage
 
 
+class PageStack(QWidget):
+    """A section's pages one below another, to be put in a QScrollArea.
+
+    Only the pages within a screen of the viewport are on live Canvases.
+    Canvases are recycled as pages scroll in and out of that range. The
+    pages outside it are painted here: their ink from small cached previews,
+    their objects straight from PageContent. So memory and frame time stay
+    the same however long the section is.
+    """
+    PAGE_WIDTH = 800
+    PAGE_HEIGHT = 1100
+    PAGE_GAP = 24
+    PREVIEW_SCALE = 0.5
+    PREVIEW_CACHE = 24  # pages
+
+    pictureFailed = Signal(str, str)  # source, error
+    pageExported = Signal(str)  # path
+    pageExportFailed = Signal(str, str)  # path, error
+
+    def __init__(self, scrollArea, blobStore=None, pageCount=1, parent=None):
+        super().__init__(parent)
+        self.scrollArea = scrollArea
+        self.blobStore = blobStore
+        self.pages = [PageContent(self.PAGE_HEIGHT) for _ in range(pageCount)]
+        self.tops = []
+        self.live = {}  # page -> Canvas showing it
+        self.spare = []  # canvases not showing a page
+        self.previews = OrderedDict()  # page -> preview of its ink, least recently painted first
+        self.currentPage = 0
+        self.requestedPage = None  # kept bound until scrolled to; see canvasForPage()
+        self.shapeTool = None
+        self.recognizeShapes = False
+        self.tool = "pen"
+
+        # Shared by all canvases; a picture's pyramid may finish after its page was recycled
+        self.tileCache = TileCache(parent=self)
+        self.tileCache.tileReady.connect(self.update)
+        self.pyramidBuilder = PyramidBuilder(blob_store=blobStore, parent=self)
+        self.pyramidBuilder.built.connect(self.onPyramidBuilt)
+        self.pyramidBuilder.failed.connect(self.onPyramidFailed)
+        QApplication.instance().aboutToQuit.connect(self.pyramidBuilder.stop)
+        # Nothing on the pages is saved yet, so their stored files are let go on exit
+        QApplication.instance().aboutToQuit.connect(self.releaseAllBlobs)
+
+        scrollArea.verticalScrollBar().valueChanged.connect(self.updateLivePages)
+        self.relayout()
+
+    def relayout(self):
+        tops, y = [], self.PAGE_GAP
+        for content in self.pages:
+            tops.append(y)
+            y += content.height + self.PAGE_GAP
+        self.tops = tops
+        self.setMinimumSize(self.PAGE_WIDTH + 2 * self.PAGE_GAP, y)
+        for page, canvas in self.live.items():
+            canvas.setGeometry(self.pageRect(page))
+        self.updateLivePages()
+        self.update()
+
+    def pageRect(self, page):
+        return QRect(self.PAGE_GAP, self.tops[page], self.PAGE_WIDTH, self.pages[page].height)
+
+    def pagesBetween(self, top, bottom):
+        first = max(0, bisect_right(self.tops, top) - 1)
+        pages = []
+        for page in range(first, len(self.pages)):
+            if self.tops[page] >= bottom:
+                break
+            if self.tops[page] + self.pages[page].height > top:
+                pages.append(page)
+        return pages
+
+    def pageAt(self, pos):
+        """Returns the page under pos, or None between pages."""
+        for page in self.pagesBetween(pos.y(), pos.y() + 1):
+            if self.pageRect(page).contains(pos):
+                return page
+        return None
+
+    def addPage(self):
+        self.pages.append(PageContent(self.PAGE_HEIGHT))
+        self.relayout()
+        return len(self.pages) - 1
+
+    def removePage(self, page):
+        """Discards a page and everything on it."""
+        if page in self.live:
+            self.release(page)
+        content = self.pages.pop(page)
+        if self.blobStore is not None:
+            for key in content.blobKeys():
+                self.blobStore.release(key)
+        self.live = {p - (p > page): canvas for p, canvas in self.live.items()}
+        self.previews = OrderedDict((p - (p > page), preview) for p, preview in self.previews.items() if p != page)
+        if self.requestedPage == page:
+            self.requestedPage = None
+        elif self.requestedPage is not None:
+            self.requestedPage -= self.requestedPage > page
+        if not self.pages:
+            self.pages.append(PageContent(self.PAGE_HEIGHT))
+        self.currentPage = min(self.currentPage - (self.currentPage > page), len(self.pages) - 1)
+        self.relayout()
+
+    def releaseAllBlobs(self):
+        if self.blobStore is not None:
+            for content in self.pages:
+                for key in content.blobKeys():
+                    self.blobStore.release(key)
+
+    def updateLivePages(self):
+        top = self.scrollArea.verticalScrollBar().value()
+        height = self.scrollArea.viewport().height()
+        wanted = self.pagesBetween(top - height, top + 2 * height)
+        if self.requestedPage is not None and self.requestedPage not in wanted:
+            wanted.append(self.requestedPage)
+        for page in [p for p in self.live if p not in wanted]:
+            self.release(page)
+        for page in wanted:
+            if page not in self.live:
+                self.bind(page)
+        if self.currentPage not in self.live:
+            # The page last worked on scrolled away; follow the middle of the viewport
+            middle = self.pagesBetween(top + height // 2, top + height // 2 + 1)
+            self.currentPage = middle[0] if middle else min(self.live, default=0)
+
+    def bind(self, page):
+        canvas = self.spare.pop() if self.spare else self.newCanvas()
+        canvas.setContent(self.pages[page])
+        canvas.setShapeTool(self.shapeTool)
+        canvas.setShapeRecognition(self.recognizeShapes)
+        canvas.setTool(self.tool)
+        canvas.setGeometry(self.pageRect(page))
+        canvas.show()
+        self.live[page] = canvas
+        self.previews.pop(page, None)  # stale once the page can be edited
+
+    def release(self, page):
+        canvas = self.live.pop(page)
+        content = canvas.takeContent()
+        # Only the ink: objects are painted from the content, so they show even once this is evicted
+        if content.inkPng is not None:
+            self.cachePreview(page, canvas.image.copy(0, 0, self.PAGE_WIDTH, content.height).scaled(
+                int(self.PAGE_WIDTH * self.PREVIEW_SCALE), int(content.height * self.PREVIEW_SCALE),
+                Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+        canvas.hide()
+        self.spare.append(canvas)
+
+    def contextMenuEvent(self, event):
+        # Also gets the right clicks on a canvas that aren't on one of its objects
+        page = self.pageAt(event.pos())
+        if page is None:
+            return
+        menu = QMenu(self)
+        for fmt in PageExporter.FORMATS:
+            menu.addAction(f"Export page as {fmt.upper()}...", lambda fmt=fmt: self.exportPage(page, fmt))
+        menu.addSeparator()
+        menu.addAction("Delete page", lambda: self.removePage(page))
+        menu.exec(event.globalPos())
+
+    def exportPage(self, page, fmt):
+        """Asks where to, then writes the page as it is now in the background."""
+        path, _ = QFileDialog.getSaveFileName(self, "Export page", f"Page {page + 1}.{fmt}",
+                                              f"{fmt.upper()} (*.{fmt})")
+        if not path:
+            return
+        # A live page's ink is on its canvas; the saved PNG is only updated when the canvas lets go
+        ink = self.live[page].image.toImage() if page in self.live else self.pages[page].inkPng
+        job = PageExport(self.pages[page], ink, self.PAGE_WIDTH, path, fmt, self)
+        job.exported.connect(self.pageExported)
+        job.failed.connect(self.pageExportFailed)
+        job.finished.connect(job.deleteLater)
+        job.start()
+
+    def newCanvas(self):
+        canvas = Canvas(self.blobStore, self, self.tileCache, self.pyramidBuilder)
+        canvas.pageHeightChanged.connect(lambda height, c=canvas: self.onPageHeightChanged(c, height))
+        canvas.pictureFailed.connect(self.pictureFailed)
+        canvas.installEventFilter(self)
+        return canvas
+
+    def pageOf(self, canvas):
+        return next((page for page, c in self.live.items() if c is canvas), None)
+
+    def currentCanvas(self):
+        return self.canvasForPage(self.currentPage)
+
+    def canvasForPage(self, page):
+        """Scrolls page into view if it has no canvas; returns its canvas."""
+        if page not in self.live:
+            # Wanted from now on, so it is bound here and its canvas isn't recycled before the
+            # scroll reaches it: the scroll range takes in a page just added only on the next layout
+            self.requestedPage = page
+            self.scrollTo(page)
+            QTimer.singleShot(0, lambda: self.finishScrollTo(page))
+        self.currentPage = page
+        return self.live[page]
+
+    def finishScrollTo(self, page):
+        if self.requestedPage == page:
+            self.requestedPage = None
+            self.scrollTo(page)
+
+    def scrollTo(self, page):
+        self.scrollArea.verticalScrollBar().setValue(self.tops[page] - self.PAGE_GAP)
+        self.updateLivePages()
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.MouseButtonPress:
+            page = self.pageOf(obj)
+            if page is not None:
+                self.currentPage = page
+        return False
+
+    def onPageHeightChanged(self, canvas, height):
+        page = self.pageOf(canvas)
+        if page is not None:
+            self.pages[page].height = height
+            self.relayout()
+
+    def onPyramidBuilt(self, source, key):
+        for page, content in enumerate(self.pages):
+            for picture in content.pictures:
+                if picture.source == source and picture.pyramid is None:
+                    picture.key = key
+                    picture.pyramid = ImagePyramid.load(key)
+                    if page in self.live:
+                        self.live[page].update(picture.rect.toAlignedRect())
+                    return
+        # The picture was removed while its pyramid was being built
+        if self.blobStore is not None:
+            self.blobStore.release(key)
+
+    def onPyramidFailed(self, source, error):
+        for page, content in enumerate(self.pages):
+            content.pictures[:] = [p for p in content.pictures if p.source != source]
+            if page in self.live:
+                self.live[page].update()
+        self.pictureFailed.emit(source, error)
+
+    def setShapeTool(self, kind):
+        self.shapeTool = kind
+        for canvas in list(self.live.values()) + self.spare:
+            canvas.setShapeTool(kind)
+
+    def setShapeRecognition(self, enabled):
+        self.recognizeShapes = enabled
+        for canvas in list(self.live.values()) + self.spare:
+            canvas.setShapeRecognition(enabled)
+
+    def setTool(self, tool):
+        self.tool = tool
+        for canvas in list(self.live.values()) + self.spare:
+            canvas.setTool(tool)
+
+    def cachePreview(self, page, preview):
+        self.previews[page] = preview
+        self.previews.move_to_end(page)
+        while len(self.previews) > self.PREVIEW_CACHE:
+            self.previews.popitem(last=False)
+
+    def preview(self, page):
+        """Returns a preview of a page's ink, decoding a small one from the saved ink when it isn't cached."""
+        preview = self.previews.get(page)
+        if preview is not None:
+            self.previews.move_to_end(page)
+            return preview
+        content = self.pages[page]
+        if content.inkPng is None:
+            return None
+        buffer = QBuffer(content.inkPng)
+        reader = QImageReader(buffer, b"png")
+        reader.setScaledSize(QSize(int(self.PAGE_WIDTH * self.PREVIEW_SCALE),
+                                   int(content.height * self.PREVIEW_SCALE)))
+        preview = QPixmap.fromImage(reader.read())
+        self.cachePreview(page, preview)
+        return preview
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.updateLivePages()
+
+    @traced("frame", name="PageStack.paintEvent", frame=True)
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        exposed = event.rect()
+        for page in self.pagesBetween(exposed.top(), exposed.bottom() + 1):
+            rect = self.pageRect(page)
+            painter.fillRect(rect.translated(2, 2), QColor(0, 0, 0, 40))
+            if page in self.live:
+                continue
+            renderProfiler.count_items("page preview")
+            painter.fillRect(rect, Qt.white)
+            preview = self.preview(page)
+            if preview is not None:
+                painter.drawPixmap(rect, preview)
+            content = self.pages[page]
+            painter.save()
+            painter.translate(rect.topLeft())
+            painter.setClipRect(QRect(QPoint(0, 0), rect.size()))
+            paintPageObjects(painter, content.shapes, content.pictures, content.tables, content.attachments,
+                             self.tileCache, exposed.translated(-rect.topLeft()))
+            painter.restore()
+
+
 class RibbonButton(QPushButton):
     def __init__(self, text="", icon_path=None, parent=None):
         super().__init__(text, parent)
         self.setMinimumSize(64, 64)
         self.setMaximumSize(80, 80)
-        self.setStyleSheet("""
-            QPushButton {
-                border: none;
-                border-radius: 4px;
-                padding: 5px;
-                text-align: center;
-                font-size: 11px;
-            }
-            QPushButton:hover {
-                background-color: #E5F3FF;
-            }
-            QPushButton:pressed {
-                background-color: #CCE4F7;
-            }
-        """)
         self.setCursor(Qt.PointingHandCursor)
 
         if icon_path:
             self.setIcon(QIcon(icon_path))
             self.setIconSize(QSize(32, 32))
 
-        # Set text alignment to bottom
-        self.setStyleSheet(self.styleSheet() + "QPushButton { text-align: bottom; }")
-
 
 class RibbonGroup(QFrame):
     def __init__(self, title, parent=None):
@@ -112,18 +1034,9 @@ class RibbonGroup(QFrame):
 
         titleLabel = QLabel(title)
         titleLabel.setAlignment(Qt.AlignBottom | Qt.AlignHCenter)
-        titleLabel.setStyleSheet("color: #707070; font-size: 10px;")
+        titleLabel.setObjectName("ribbonGroupTitle")
         layout.addWidget(titleLabel)
 
-        self.setStyleSheet("""
-            RibbonGroup {
-                background-color: transparent;
-                border-right: 1px solid #E0E0E0;
-                padding-right: 8px;
-                margin-right: 2px;
-            }
-        """)
-
     def addButton(self, text, icon_path=None):
         button = RibbonButton(text, icon_path)
         self.buttonsLayout.addWidget(button)
@@ -131,78 +1044,20 @@ class RibbonGroup(QFrame):
 
 
 class OneNoteApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, profiler=None):
         super().__init__()
+        self.profiler = profiler or StartupProfiler(enabled=False)
+        self.notebookRoot = NotebookStore.default_root()
+        self.blobStore = BlobStore(NotebookStore.blob_root(self.notebookRoot))
         self.setWindowTitle("OneNote Clone")
         self.resize(1200, 800)
 
         # Set application-wide font
         self.setupFonts()
 
-        # Apply app-wide stylesheet
-        self.setStyleSheet("""
-            QMainWindow {
-                background-color: #FFFFFF;
-            }
-            QSplitter::handle {
-                background-color: #F0F0F0;
-            }
-            QTreeWidget {
-                border: none;
-                background-color: #F9F9F9;
-                selection-background-color: #E6F2FA;
-                selection-color: #333333;
-            }
-            QTabWidget::pane {
-                border-top: 1px solid #DDDDDD;
-                background-color: #FAFAFA;
-            }
-            QTabBar::tab {
-                background-color: #F0F0F0;
-                border: 1px solid #DDDDDD;
-                border-bottom: none;
-                min-width: 80px;
-                padding: 5px 10px;
-                margin-right: 2px;
-                border-top-left-radius: 4px;
-                border-top-right-radius: 4px;
-            }
-            QTabBar::tab:selected {
-                background-color: #FFFFFF;
-                border-bottom: 1px solid #FFFFFF;
-            }
-            QScrollBar:vertical {
-                border: none;
-                background: #F0F0F0;
-                width: 10px;
-                margin: 0px;
-            }
-            QScrollBar::handle:vertical {
-                background: #CDCDCD;
-                min-height: 20px;
-                border-radius: 5px;
-            }
-            QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {
-                height: 0px;
-            }
-            QLineEdit {
-                padding: 5px;
-                border: 1px solid #DDDDDD;
-                border-radius: 4px;
-            }
-            QPushButton {
-                background-color: #F0F0F0;
-                border: 1px solid #DDDDDD;
-                border-radius: 4px;
-                padding: 5px 10px;
-            }
-            QPushButton:hover {
-                background-color: #E8E8E8;
-            }
-            QPushButton:pressed {
-                background-color: #D8D8D8;
-            }
-        """)
+        # Apply the application-wide theme
+        with self.profiler.phase("theme"):
+            Theme.apply_theme(Theme.current_theme())
 
         # Create central widget and layout
         self.centralWidget = QWidget()
@@ -212,23 +1067,75 @@ class OneNoteApp(QMainWindow):
         self.mainLayout.setSpacing(0)
 
         # Create and set up the ribbon
-        self.setupRibbon()
+        with self.profiler.phase("ribbon"):
+            self.setupRibbon()
 
         # Create main content area
         self.contentSplitter = QSplitter(Qt.Horizontal)
 
         # Create notebook navigation panel
-        self.setupNotebookPanel()
+        with self.profiler.phase("notebook panel"):
+            self.setupNotebookPanel()
 
         # Create main content area with canvas
-        self.setupContentArea()
+        with self.profiler.phase("content area"):
+            self.setupContentArea()
 
         # Add the splitter to the main layout
         self.mainLayout.addWidget(self.contentSplitter)
 
         # Set up status bar
         self.statusBar().showMessage("Ready")
-        self.statusBar().setStyleSheet("QStatusBar { background-color: #F5F5F5; border-top: 1px solid #DDDDDD; }")
+
+        self.deferredSetupStarted = False
+        self.pendingStartupWork = {"notebook tree", "tree filter index", "ribbon tabs"}
+        self.penTools = PenBindings.ToolState()
+        self.penListener = None
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        # Started from the first paint rather than from showEvent: the window
+        # is exposed asynchronously, so a timer started on show can fire first
+        if not self.deferredSetupStarted:
+            self.deferredSetupStarted = True
+            QTimer.singleShot(0, self.populateNotebookTree)
+            QTimer.singleShot(0, self.buildPendingRibbonTabs)
+            QTimer.singleShot(0, self.startPenListener)
+
+    def startPenListener(self):
+        """Listens to the pen's buttons, if there is a pen, and applies the gestures bound to them."""
+        if PenButtonListener is None:
+            return
+        try:
+            self.penListener = PenButtonListener(parent=self)
+        except OSError:  # input devices not readable by this user
+            return
+        if self.penListener.device_path is None:
+            self.penListener = None
+            return
+        self.penListener.command_ready.connect(self.onPenCommand)
+        QApplication.instance().aboutToQuit.connect(self.penListener.stop)
+        self.penListener.start()
+
+    def onPenCommand(self, command):
+        if command.action == "undo":
+            self.canvas.undo()
+        elif command.action == "redo":
+            self.canvas.redo()
+        else:
+            self.pageStack.setTool(self.penTools.apply(command))
+
+    def selectTool(self, tool):
+        self.penTools.selected = tool
+        self.pageStack.setTool(self.penTools.tool)
+
+    def startupWorkDone(self, name):
+        """Marks a piece of deferred startup work done; the profile is reported after the last."""
+        if name in self.pendingStartupWork:
+            self.pendingStartupWork.discard(name)
+            self.profiler.mark(f"{name} ready")
+            if not self.pendingStartupWork:
+                self.profiler.finish()
 
     def setupFonts(self):
         # Use system font or load custom ones
@@ -242,17 +1149,51 @@ class OneNoteApp(QMainWindow):
         self.ribbon.setTabPosition(QTabWidget.North)
         self.ribbon.setDocumentMode(True)
 
+        # Tabs are added as empty pages and filled in on first use or when idle,
+        # so only the Home tab is built before the first frame
+        self.ribbonBuilders = {}
+        for title, builder in (("File", self.buildFileTab),
+                               ("Home", self.buildHomeTab),
+                               ("Insert", self.buildInsertTab),
+                               ("Draw", self.buildDrawTab),
+                               ("View", self.buildViewTab)):
+            index = self.ribbon.addTab(QWidget(), title)
+            self.ribbonBuilders[index] = builder
+
+        # Select Home tab by default
+        self.ensureRibbonTab(1)
+        self.ribbon.setCurrentIndex(1)
+        self.ribbon.currentChanged.connect(self.ensureRibbonTab)
+
+        # Add ribbon to main layout
+        self.mainLayout.addWidget(self.ribbon)
+
+    def ensureRibbonTab(self, index):
+        """Builds the contents of a ribbon tab if that hasn't happened yet."""
+        builder = self.ribbonBuilders.pop(index, None)
+        if builder is None:
+            return
+        with self.profiler.phase(f"ribbon tab {self.ribbon.tabText(index)}"):
+            builder(self.ribbon.widget(index))
+
+    def buildPendingRibbonTabs(self):
+        """Builds one remaining ribbon tab per idle cycle."""
+        if not self.ribbonBuilders:
+            self.startupWorkDone("ribbon tabs")
+            return
+        self.ensureRibbonTab(next(iter(self.ribbonBuilders)))
+        QTimer.singleShot(0, self.buildPendingRibbonTabs)
+
+    def buildFileTab(self, fileTab):
         # File tab (styled differently)
-        fileTab = QWidget()
         fileLayout = QHBoxLayout(fileTab)
-        fileTab.setStyleSheet("background-color: #7719AA;")
+        fileTab.setObjectName("fileTab")
         fileBtn = QPushButton("File")
-        fileBtn.setStyleSheet("color: white; font-size: 14px; background-color: transparent; border: none;")
+        fileBtn.setObjectName("fileButton")
         fileLayout.addWidget(fileBtn)
         fileLayout.addStretch()
 
-        # Home tab
-        homeTab = QWidget()
+    def buildHomeTab(self, homeTab):
         homeLayout = QHBoxLayout(homeTab)
         homeLayout.setContentsMargins(10, 5, 10, 5)
         homeLayout.setSpacing(0)
@@ -277,21 +1218,13 @@ class OneNoteApp(QMainWindow):
 
         # Create pen tools group
         penGroup = RibbonGroup("Pens")
-        penGroup.addButton("Pen")
-        penGroup.addButton("Highlighter")
-        penGroup.addButton("Eraser")
+        for name in ("Pen", "Highlighter", "Eraser"):
+            penGroup.addButton(name).clicked.connect(lambda checked=False, tool=name.lower(): self.selectTool(tool))
 
         # Add color selector
         colorCombo = QComboBox()
         colorCombo.addItems(["Black", "Blue", "Red", "Green"])
         colorCombo.setFixedWidth(80)
-        colorCombo.setStyleSheet("""
-            QComboBox {
-                border: 1px solid #DDDDDD;
-                border-radius: 3px;
-                padding: 3px;
-            }
-        """)
         penGroup.layout().addWidget(colorCombo)
 
         # Add groups to Home tab
@@ -301,48 +1234,67 @@ class OneNoteApp(QMainWindow):
         homeLayout.addWidget(penGroup)
         homeLayout.addStretch()
 
-        # Insert tab
-        insertTab = QWidget()
+    def buildInsertTab(self, insertTab):
         insertLayout = QHBoxLayout(insertTab)
 
         tablesGroup = RibbonGroup("Tables")
-        tablesGroup.addButton("Table")
+        tableBtn = tablesGroup.addButton("Table")
+        tableBtn.clicked.connect(self.insertTable)
 
         imagesGroup = RibbonGroup("Images")
-        imagesGroup.addButton("Picture")
+        pictureBtn = imagesGroup.addButton("Picture")
+        pictureBtn.clicked.connect(self.insertPicture)
         imagesGroup.addButton("Online Picture")
 
         linksGroup = RibbonGroup("Links")
         linksGroup.addButton("Link")
-        linksGroup.addButton("Attachment")
+        attachmentBtn = linksGroup.addButton("Attachment")
+        attachmentBtn.clicked.connect(self.insertAttachment)
 
         insertLayout.addWidget(tablesGroup)
         insertLayout.addWidget(imagesGroup)
         insertLayout.addWidget(linksGroup)
         insertLayout.addStretch()
 
-        # Draw tab
-        drawTab = QWidget()
+    def buildDrawTab(self, drawTab):
         drawLayout = QHBoxLayout(drawTab)
 
         toolsGroup = RibbonGroup("Tools")
-        toolsGroup.addButton("Pen")
-        toolsGroup.addButton("Marker")
-        toolsGroup.addButton("Highlighter")
-        toolsGroup.addButton("Eraser")
+        for name, tool in (("Pen", "pen"), ("Marker", None), ("Highlighter", "highlighter"),
+                           ("Eraser", "eraser"), ("Lasso", "lasso")):
+            button = toolsGroup.addButton(name)
+            if tool is not None:
+                button.clicked.connect(lambda checked=False, tool=tool: self.selectTool(tool))
 
         shapesGroup = RibbonGroup("Shapes")
-        shapesGroup.addButton("Rectangle")
-        shapesGroup.addButton("Circle")
-        shapesGroup.addButton("Line")
-        shapesGroup.addButton("Arrow")
+        self.shapeButtons = {}
+        for name in ShapeRecognizer.TOOLS:
+            button = shapesGroup.addButton(name)
+            button.setCheckable(True)
+            button.toggled.connect(lambda checked, name=name: self.selectShapeTool(name, checked))
+            self.shapeButtons[name] = button
+        inkToShapeBtn = shapesGroup.addButton("Ink to Shape")
+        inkToShapeBtn.setCheckable(True)
+        inkToShapeBtn.toggled.connect(lambda checked: self.pageStack.setShapeRecognition(checked))
 
         drawLayout.addWidget(toolsGroup)
         drawLayout.addWidget(shapesGroup)
         drawLayout.addStretch()
 
-        # View tab
-        viewTab = QWidget()
+    def selectShapeTool(self, name, checked):
+        """Shape buttons act like radio buttons that can also be switched off."""
+        kind = ShapeRecognizer.TOOLS[name]
+        if checked:
+            for other, button in self.shapeButtons.items():
+                if other != name:
+                    button.blockSignals(True)
+                    button.setChecked(False)
+                    button.blockSignals(False)
+            self.pageStack.setShapeTool(kind)
+        elif self.pageStack.shapeTool == kind:
+            self.pageStack.setShapeTool(None)
+
+    def buildViewTab(self, viewTab):
         viewLayout = QHBoxLayout(viewTab)
 
         viewsGroup = RibbonGroup("Views")
@@ -355,33 +1307,21 @@ class OneNoteApp(QMainWindow):
         zoomGroup.addButton("Zoom Out")
         zoomGroup.addButton("100%")
 
+        themeGroup = RibbonGroup("Theme")
+        darkModeBtn = themeGroup.addButton("Dark Mode")
+        darkModeBtn.clicked.connect(lambda: Theme.toggle_theme())
+
         viewLayout.addWidget(viewsGroup)
         viewLayout.addWidget(zoomGroup)
+        viewLayout.addWidget(themeGroup)
         viewLayout.addStretch()
 
-        # Add tabs to ribbon
-        self.ribbon.addTab(fileTab, "File")
-        self.ribbon.addTab(homeTab, "Home")
-        self.ribbon.addTab(insertTab, "Insert")
-        self.ribbon.addTab(drawTab, "Draw")
-        self.ribbon.addTab(viewTab, "View")
-
-        # Style the selected tab differently
-        self.ribbon.setCurrentIndex(1)  # Select Home tab by default
-
-        # Add ribbon to main layout
-        self.mainLayout.addWidget(self.ribbon)
-
     def setupNotebookPanel(self):
         # Create notebook panel
         self.notebookPanel = QWidget()
         self.notebookPanel.setMinimumWidth(250)
         self.notebookPanel.setMaximumWidth(350)
-        self.notebookPanel.setStyleSheet("""
-            QWidget {
-                background-color: #F5F5F5;
-            }
-        """)
+        self.notebookPanel.setObjectName("notebookPanel")
 
         notebookLayout = QVBoxLayout(self.notebookPanel)
         notebookLayout.setContentsMargins(10, 10, 10, 10)
@@ -390,90 +1330,191 @@ class OneNoteApp(QMainWindow):
         # Search bar
         searchBox = QLineEdit()
         searchBox.setPlaceholderText("Search all notebooks")
-        searchBox.setStyleSheet("""
-            QLineEdit {
-                padding: 8px;
-                border: 1px solid #DDDDDD;
-                border-radius: 4px;
-                background-color: white;
-            }
-        """)
+        searchBox.setObjectName("searchBox")
+        searchBox.textChanged.connect(self.filterNotebookTree)
         notebookLayout.addWidget(searchBox)
+        self.searchBox = searchBox
+        self.treeFilter = None
+        # Filtering runs a frame's budget at a time; the index is rebuilt once tree changes stop
+        self.treeFilterTimer = QTimer(self)
+        self.treeFilterTimer.setSingleShot(True)
+        self.treeFilterTimer.timeout.connect(self.runTreeFilter)
+        self.treeIndexTimer = QTimer(self)
+        self.treeIndexTimer.setSingleShot(True)
+        self.treeIndexTimer.timeout.connect(self.buildTreeFilter)
 
         # Create notebook tree
         self.notebookTree = QTreeWidget()
         self.notebookTree.setHeaderHidden(True)
         self.notebookTree.setAnimated(True)
         self.notebookTree.setIndentation(20)
-        self.notebookTree.setStyleSheet("""
-            QTreeWidget {
-                border: none;
-                background-color: #F5F5F5;
-                selection-background-color: #E1EFFA;
-                selection-color: #333333;
-                font-size: 12px;
-            }
-            QTreeWidget::item {
-                height: 28px;
-                padding-left: 4px;
-                border-radius: 4px;
-            }
-            QTreeWidget::item:hover {
-                background-color: #EAF6FF;
-            }
-            QTreeWidget::item:selected {
-                background-color: #CCE8FF;
-            }
-        """)
-
-        # Add sample notebooks with icons
-        notebooks = {
-            "Personal": ["Daily Notes", "Ideas", "Projects"],
-            "Work": ["Meetings", "Tasks", "Research"],
-            "School": ["Physics", "Math", "Biology"]
-        }
-
-        for notebook, sections in notebooks.items():
-            notebookItem = QTreeWidgetItem([notebook])
-            # notebookItem.setIcon(0, self.style().standardIcon(QApplication.style().SP_DirIcon))
-            self.notebookTree.addTopLevelItem(notebookItem)
-
-            # Add sections to notebooks
-            for section in sections:
-                sectionItem = QTreeWidgetItem([section])
-                # sectionItem.setIcon(0, self.style().standardIcon(QApplication.style().SP_FileDialogDetailView))
-                notebookItem.addChild(sectionItem)
-
-                # Add pages to sections
-                for i in range(1, 4):
-                    pageItem = QTreeWidgetItem([f"Page {i}"])
-                    # pageItem.setIcon(0, self.style().standardIcon(QApplication.style().SP_FileDialogContentsView))
-                    sectionItem.addChild(pageItem)
-
-        self.notebookTree.expandAll()
+        # Lets the view lay out a large tree without measuring every row
+        self.notebookTree.setUniformRowHeights(True)
+        self.notebookTree.setObjectName("notebookTree")
+        self.notebookTree.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.notebookTree.customContextMenuRequested.connect(self.showNotebookTreeMenu)
+
         notebookLayout.addWidget(self.notebookTree)
 
         # Add "+ Add page" button
         addPageBtn = QPushButton("+ Add page")
-        addPageBtn.setStyleSheet("""
-            QPushButton {
-                background-color: #FFFFFF;
-                color: #7719AA;
-                border: 1px solid #E0E0E0;
-                border-radius: 4px;
-                padding: 8px;
-                font-weight: bold;
-                text-align: left;
-            }
-            QPushButton:hover {
-                background-color: #F9F9F9;
-            }
-        """)
+        addPageBtn.setObjectName("addPageButton")
+        addPageBtn.clicked.connect(lambda: self.pageStack.canvasForPage(self.pageStack.addPage()))
         notebookLayout.addWidget(addPageBtn)
 
         # Add to splitter
         self.contentSplitter.addWidget(self.notebookPanel)
 
+    def populateNotebookTree(self):
+        """Fills the notebook tree; called once the window has been shown."""
+        with self.profiler.phase("notebook tree"):
+            # The notebooks on disk; sample notebooks (which can't be exported) when there are none
+            notebooks = NotebookStore.notebook_tree(self.notebookRoot)
+            if not notebooks:
+                notebooks = [(notebook, [(section, [f"Page {i}" for i in range(1, 4)]) for section in sections])
+                             for notebook, sections in (("Personal", ["Daily Notes", "Ideas", "Projects"]),
+                                                        ("Work", ["Meetings", "Tasks", "Research"]),
+                                                        ("School", ["Physics", "Math", "Biology"]))]
+
+            self.notebookTree.setUpdatesEnabled(False)
+            for notebook, sections in notebooks:
+                notebookItem = QTreeWidgetItem([notebook])
+                # notebookItem.setIcon(0, self.style().standardIcon(QApplication.style().SP_DirIcon))
+                self.notebookTree.addTopLevelItem(notebookItem)
+
+                # Add sections to notebooks
+                for section, pages in sections:
+                    sectionItem = QTreeWidgetItem([section])
+                    # sectionItem.setIcon(0, self.style().standardIcon(QApplication.style().SP_FileDialogDetailView))
+                    notebookItem.addChild(sectionItem)
+
+                    # Add pages to sections
+                    for page in pages:
+                        pageItem = QTreeWidgetItem([page])
+                        # pageItem.setIcon(0, self.style().standardIcon(QApplication.style().SP_FileDialogContentsView))
+                        sectionItem.addChild(pageItem)
+
+            self.notebookTree.expandAll()
+            self.notebookTree.setUpdatesEnabled(True)
+        self.startupWorkDone("notebook tree")
+        model = self.notebookTree.model()
+        for signal in (model.rowsInserted, model.rowsRemoved, model.dataChanged, model.modelReset):
+            signal.connect(self.notebookTreeChanged)
+        self.treeIndexTimer.start()
+
+    def notebookTreeChanged(self):
+        """Drops the title index, which no longer matches the items; it's rebuilt when idle."""
+        self.treeFilter = None
+        self.treeFilterTimer.stop()
+        self.treeIndexTimer.start()
+
+    def buildTreeFilter(self):
+        """Indexes the tree's titles while idle, so typing in the search box filters instantly."""
+        if self.treeFilter is None:
+            with self.profiler.phase("tree filter index"):
+                self.treeFilter = ItemFilter.for_tree(self.notebookTree)
+            self.startupWorkDone("tree filter index")
+            # Whatever was typed before the tree was filled, or while it changed
+            self.filterNotebookTree(self.searchBox.text())
+
+    def filterNotebookTree(self, text):
+        # Without an index the tree is still being filled or changed; building the index applies the text
+        if self.treeFilter is not None:
+            self.treeFilter.start(text)
+            self.runTreeFilter()
+
+    def runTreeFilter(self):
+        """Filters for one frame's budget, then lets the event loop run before going on."""
+        self.notebookTree.setUpdatesEnabled(False)
+        done = self.treeFilter.run(FRAME_BUDGET)
+        self.notebookTree.setUpdatesEnabled(True)
+        if not done:
+            self.treeFilterTimer.start()
+
+    def insertPicture(self):
+        paths, _ = QFileDialog.getOpenFileNames(
+            self, "Insert Picture", "", "Images (*.png *.jpg *.jpeg *.bmp *.gif *.tif *.tiff *.webp)")
+        for path in paths:
+            if not self.canvas.addPicture(path):
+                self.statusBar().showMessage(f"Could not read {os.path.basename(path)}")
+
+    def insertTable(self):
+        text, ok = QInputDialog.getText(self, "Insert Table", "Columns × rows:", text="3 × 4")
+        size = re.fullmatch(r"\s*(\d+)\s*[x×]\s*(\d+)\s*", text) if ok else None
+        if size is None:
+            return
+        columns, rows = int(size.group(1)), int(size.group(2))
+        if columns > 0 and rows > 0:
+            self.canvas.addTable(columns, rows)
+
+    def insertAttachment(self):
+        paths, _ = QFileDialog.getOpenFileNames(self, "Attach File")
+        page = self.pageStack.currentPage
+        for path in paths:
+            job = AttachmentImport(self.blobStore, path, self)
+            # The page may have scrolled away (and lost its canvas) by the time the file is stored
+            job.imported.connect(lambda path, key: self.pageStack.canvasForPage(page).addAttachment(
+                os.path.basename(path), key))
+            job.failed.connect(lambda path, error: self.statusBar().showMessage(f"Could not attach {path}: {error}"))
+            job.finished.connect(job.deleteLater)
+            job.start()
+
+    def treeItemPath(self, item):
+        """Maps a notebook, section or page item to its directory on disk."""
+        names = []
+        while item is not None:
+            names.insert(0, item.text(0))
+            item = item.parent()
+        if len(names) == 3:
+            return NotebookStore.page_dir(self.notebookRoot, *names)
+        return os.path.join(self.notebookRoot, *names)
+
+    def showNotebookTreeMenu(self, pos):
+        item = self.notebookTree.itemAt(pos)
+        if item is None:
+            return
+        menu = QMenu(self)
+        onDisk = os.path.exists(self.treeItemPath(item))
+        for fmt in PageExporter.FORMATS:
+            action = menu.addAction(f"Export as {fmt.upper()}...", lambda fmt=fmt: self.exportTreeItem(item, fmt))
+            action.setEnabled(onDisk)
+        menu.exec(self.notebookTree.viewport().mapToGlobal(pos))
+
+    def exportTreeItem(self, item, fmt):
+        """Exports the page, section or notebook behind a tree item in the background."""
+        source = self.treeItemPath(item)
+        pages = list(NotebookStore.iter_pages(source)) if os.path.exists(source) else []
+        if not pages:
+            self.statusBar().showMessage(f"Nothing to export in {item.text(0)}")
+            return
+        outDir = QFileDialog.getExistingDirectory(self, f"Export {item.text(0)} to")
+        if not outDir:
+            return
+
+        job = ExportJob(pages, os.path.dirname(source), outDir, fmt, self)
+        progress = QProgressDialog(f"Exporting {item.text(0)}...", "Cancel", 0, 100, self)
+        progress.setWindowModality(Qt.NonModal)
+        progress.setAutoReset(False)
+
+        def onProgress(done, total):
+            progress.setMaximum(total)
+            progress.setValue(done)
+
+        job.progress.connect(onProgress)
+        progress.canceled.connect(job.cancel)
+        job.done.connect(lambda files: self.statusBar().showMessage(f"Exported {len(files)} page(s) to {outDir}"))
+        job.failed.connect(lambda error: self.statusBar().showMessage(f"Export failed: {error}"))
+        job.cancelled.connect(lambda: self.statusBar().showMessage("Export cancelled"))
+        job.finished.connect(progress.close)
+        job.finished.connect(job.deleteLater)
+        progress.show()
+        job.start()
+
+    @property
+    def canvas(self):
+        """The canvas of the page last worked on, or of the one in view."""
+        return self.pageStack.currentCanvas()
+
     def setupContentArea(self):
         # Create content area
         self.contentArea = QWidget()
@@ -483,50 +1524,30 @@ class OneNoteApp(QMainWindow):
         # Page title
         pageTitleLayout = QHBoxLayout()
         pageTitle = QLineEdit("Untitled Page")
-        pageTitle.setStyleSheet("""
-            QLineEdit {
-                font-size: 24px;
-                font-weight: bold;
-                color: #7719AA;
-                border: none;
-                background-color: transparent;
-            }
-            QLineEdit:focus {
-                border-bottom: 1px solid #7719AA;
-            }
-        """)
+        pageTitle.setObjectName("pageTitle")
         pageTitleLayout.addWidget(pageTitle)
         pageTitleLayout.addStretch()
         contentLayout.addLayout(pageTitleLayout)
 
         # Create timestamp
         dateLabel = QLabel("Created: March 19, 2025 • Last Edited: Just now")
-        dateLabel.setStyleSheet("color: #707070; font-size: 11px;")
+        dateLabel.setObjectName("pageDate")
         contentLayout.addWidget(dateLabel)
         contentLayout.addSpacing(20)
 
-        # Canvas for drawing/writing
-        self.canvas = Canvas()
-        self.canvas.setStyleSheet("""
-            Canvas {
-                background-color: white;
-                border: 1px solid #E0E0E0;
-                border-radius: 4px;
-            }
-        """)
-
-        # Create scroll area for canvas
+        # The section's pages, each drawn on a Canvas while it is near the viewport
         scrollArea = QScrollArea()
-        scrollArea.setWidget(self.canvas)
+        self.pageStack = PageStack(scrollArea, self.blobStore, pageCount=3)
+        self.pageStack.pictureFailed.connect(
+            lambda source, error: self.statusBar().showMessage(f"Could not insert {os.path.basename(source)}: {error}"))
+        self.pageStack.pageExported.connect(lambda path: self.statusBar().showMessage(f"Exported page to {path}"))
+        self.pageStack.pageExportFailed.connect(
+            lambda path, error: self.statusBar().showMessage(f"Could not export to {path}: {error}"))
+        scrollArea.setWidget(self.pageStack)
         scrollArea.setWidgetResizable(True)
         scrollArea.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
         scrollArea.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-        scrollArea.setStyleSheet("""
-            QScrollArea {
-                border: none;
-                background-color: #F0F0F0;
-            }
-        """)
+        scrollArea.setObjectName("canvasScrollArea")
         contentLayout.addWidget(scrollArea, 1)
 
         # Add to splitter
@@ -538,8 +1559,12 @@ class OneNoteApp(QMainWindow):
 
 
 def main():
-    app = QApplication(sys.argv)
-    window = OneNoteApp()
+    profiler = StartupProfiler()
+    with profiler.phase("QApplication"):
+        app = QApplication(sys.argv)
+    with profiler.phase("OneNoteApp"):
+        window = OneNoteApp(profiler)
+    profiler.watch(window)
     window.show()
     sys.exit(app.exec())
 
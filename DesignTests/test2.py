@@ -1,8 +1,17 @@
+import os
 import sys
 from PySide6.QtWidgets import *
 from PySide6.QtGui import *
 from PySide6.QtCore import *
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import NotebookStore
+import Theme
+from LargeTextEdit import LargeTextEdit
+from PageTextStore import PageTextStore
+from TitleFilter import ItemFilter
+
 
 class AdvancedOneNoteUI(QMainWindow):
     def __init__(self):
@@ -126,14 +135,30 @@ class AdvancedOneNoteUI(QMainWindow):
         work.addChild(QTreeWidgetItem(["Projects"]))
         work.addChild(QTreeWidgetItem(["Meetings"]))
 
-        # Pages section
+        # Pages section, filtered by title as you type
+        pages = QWidget()
+        pages_layout = QVBoxLayout(pages)
+        pages_layout.setContentsMargins(0, 0, 0, 0)
+        page_filter_box = QLineEdit()
+        page_filter_box.setPlaceholderText("Filter pages")
+        page_filter_box.setObjectName("searchBox")
+        pages_layout.addWidget(page_filter_box)
+
         page_list = QListWidget()
         page_list.setObjectName("pageList")
         page_list.addItems(["Daily Notes", "Meeting Minutes", "Ideas Board", "Tasks"])
+        pages_layout.addWidget(page_list)
+        self.page_list = page_list
+        self.page_filter_box = page_filter_box
+        self.page_filter = None
+        page_filter_box.textChanged.connect(self.filter_pages)
+        model = page_list.model()
+        for signal in (model.rowsInserted, model.rowsRemoved, model.dataChanged, model.modelReset):
+            signal.connect(self.page_list_changed)
 
         # Add to splitter
         splitter.addWidget(notebook_tree)
-        splitter.addWidget(page_list)
+        splitter.addWidget(pages)
         splitter.setSizes([200, 200])
 
         container_layout = QVBoxLayout(container)
@@ -141,6 +166,20 @@ class AdvancedOneNoteUI(QMainWindow):
         sidebar.setWidget(container)
         self.addDockWidget(Qt.LeftDockWidgetArea, sidebar)
 
+    def page_list_changed(self):
+        # The index no longer matches the pages; build it again and keep the current filter applied
+        self.page_filter = None
+        if self.page_filter_box.text():
+            self.filter_pages(self.page_filter_box.text())
+
+    def filter_pages(self, text):
+        # The index is built on first use and reused for every later keystroke
+        if self.page_filter is None:
+            self.page_filter = ItemFilter.for_list(self.page_list)
+        self.page_list.setUpdatesEnabled(False)
+        self.page_filter.apply(text)
+        self.page_list.setUpdatesEnabled(True)
+
     def create_notebook_area(self, parent_layout):
         # Main notebook container
         notebook_container = QWidget()
@@ -162,87 +201,23 @@ class AdvancedOneNoteUI(QMainWindow):
         header_layout.addStretch()
         header_layout.addWidget(date_label)
 
-        # Content area
-        content = QTextEdit()
+        # Content area, saved incrementally into the page's text store
+        page = NotebookStore.page_dir(NotebookStore.default_root(), "Personal Notebook", "Chapter 1", "Daily Notes")
+        content = LargeTextEdit(PageTextStore(os.path.join(page, NotebookStore.TEXT_DIR)))
         content.setPlaceholderText("Start typing your notes here...")
+        self.notes = content
 
         layout.addWidget(header)
         layout.addWidget(content)
         parent_layout.addWidget(notebook_container)
 
+    def closeEvent(self, event):
+        self.notes.save()
+        super().closeEvent(event)
+
     def apply_advanced_styles(self):
-        accent_color = "#5C2D91"  # OneNote purple
-        hover_color = "#E1D5E7"  # Light purple
-        selected_color = "#F3F0F5"  # Very light purple
-
-        self.setStyleSheet(f"""
-            QMainWindow {{
-                background-color: #FFFFFF;
-            }}
-            QTabBar::tab {{
-                background: #F5F5F5;
-                color: #333333;
-                border: 1px solid #DDDDDD;
-                padding: 8px 12px;
-                margin-right: 2px;
-                font-weight: bold;
-            }}
-            QTabBar::tab:selected {{
-                background: {accent_color};
-                color: white;
-                border-color: {accent_color};
-            }}
-            QDockWidget {{
-                titlebar-close-icon: url(none);
-                titlebar-normal-icon: url(none);
-                border: 1px solid #DDDDDD;
-            }}
-            QTreeWidget, QListWidget {{
-                border: none;
-                background: white;
-            }}
-            QTreeWidget::item, QListWidget::item {{
-                padding: 8px;
-                border-bottom: 1px solid #EEEEEE;
-            }}
-            QTreeWidget::item:hover, QListWidget::item:hover {{
-                background: {hover_color};
-            }}
-            QTreeWidget::item:selected, QListWidget::item:selected {{
-                background: {selected_color};
-                color: #333333;
-                border-left: 4px solid {accent_color};
-            }}
-            #pageTitle {{
-                font-size: 18px;
-                font-weight: bold;
-                color: {accent_color};
-            }}
-            #pageDate {{
-                font-size: 14px;
-                color: #666666;
-            }}
-            QTextEdit {{
-                background: white;
-                border: none;
-                padding: 15px;
-                font-size: 14px;
-            }}
-            QToolButton {{
-                background: transparent;
-                border: 1px solid transparent;
-                padding: 5px;
-                color: #333333;
-                border-radius: 4px;
-            }}
-            QToolButton:hover {{
-                background: {hover_color};
-                border: 1px solid #CCCCCC;
-            }}
-            QToolButton:pressed {{
-                background: {selected_color};
-            }}
-        """)
+        # All styling lives in the shared application-level theme
+        Theme.apply_theme(Theme.current_theme())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from PySide6.QtCore import QThread, Signal
+
+import PageExporter
+
+
+class ExportJob(QThread):
+    """Runs PageExporter in the background so the UI stays responsive."""
+
+    progress = Signal(int, int)
+    done = Signal(list)
+    failed = Signal(str)
+    cancelled = Signal()
+
+    def __init__(self, pages, source_root, out_dir, fmt, parent=None):
+        super().__init__(parent)
+        self.pages = list(pages)
+        self.source_root = source_root
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.cancel_requested = False
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    def run(self):
+        # Forking a process that runs Qt threads is unsafe, so workers are spawned
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(mp_context=context)
+        try:
+            written = PageExporter.export_pages(
+                self.pages, self.source_root, self.out_dir, self.fmt, executor,
+                progress=self.progress.emit, cancelled=lambda: self.cancel_requested)
+        except PageExporter.ExportCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.done.emit(written)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,279 @@
+"""Multi-resolution tile pyramids for pictures inserted into pages.
+
+An inserted image is decoded once, off the GUI thread, and cut into
+TILE_SIZE tiles at full resolution and at every halving down to a single
+tile. Pyramids are keyed by the SHA-256 of the image, which is also its
+BlobStore key, so the same picture pasted many times is only processed and
+stored once. Painting picks the
+level that matches the on-screen size and draws just the visible tiles,
+loaded in the background into a byte-bounded LRU cache.
+"""
+
+import hashlib
+import json
+import math
+import os
+from collections import OrderedDict
+from queue import Queue
+
+from PySide6.QtCore import Qt, QObject, QRect, QRectF, QRunnable, QThread, QThreadPool, Signal
+from PySide6.QtGui import QColor, QImage, QImageReader
+
+TILE_SIZE = 256
+JPEG_QUALITY = 90
+META_FILE = "pyramid.json"
+
+
+def cache_root():
+    return os.environ.get("PYNOTE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "pynote", "pyramids"))
+
+
+def file_key(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ImagePyramid:
+    """Metadata of a built pyramid; tiles live as files next to it."""
+
+    def __init__(self, key, width, height, levels, fmt, root=None):
+        self.key = key
+        self.width = width
+        self.height = height
+        self.levels = levels
+        self.format = fmt
+        self.path = os.path.join(root or cache_root(), key)
+
+    @classmethod
+    def load(cls, key, root=None):
+        """Returns the pyramid for key, or None if it hasn't been built yet."""
+        path = os.path.join(root or cache_root(), key, META_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(key, meta["width"], meta["height"], meta["levels"], meta["format"], root)
+
+    def level_size(self, level):
+        factor = 1 << level
+        return math.ceil(self.width / factor), math.ceil(self.height / factor)
+
+    def level_for_scale(self, scale):
+        """Coarsest level that still has at least one source pixel per screen pixel."""
+        if scale >= 1:
+            return 0
+        if scale <= 0:
+            return self.levels - 1
+        return min(self.levels - 1, int(math.floor(math.log2(1 / scale))))
+
+    def tile_path(self, level, col, row):
+        return os.path.join(self.path, str(level), f"{col}_{row}.{self.format}")
+
+    def tiles_in(self, level, rect):
+        """Yields (col, row) of tiles at level overlapping rect (QRectF in full-resolution pixels)."""
+        factor = 1 << level
+        width, height = self.level_size(level)
+        first_col = max(0, int(rect.left() / factor) // TILE_SIZE)
+        first_row = max(0, int(rect.top() / factor) // TILE_SIZE)
+        last_col = min((width - 1) // TILE_SIZE, int(math.ceil(rect.right() / factor)) // TILE_SIZE)
+        last_row = min((height - 1) // TILE_SIZE, int(math.ceil(rect.bottom() / factor)) // TILE_SIZE)
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                yield col, row
+
+    def tile_rect(self, level, col, row):
+        """Area covered by a tile, in full-resolution pixels."""
+        factor = 1 << level
+        width, height = self.level_size(level)
+        x, y = col * TILE_SIZE, row * TILE_SIZE
+        return QRectF(x * factor, y * factor,
+                      min(TILE_SIZE, width - x) * factor, min(TILE_SIZE, height - y) * factor)
+
+
+class PyramidBuilder(QThread):
+    """Builds pyramids one image at a time, so only one decoded image is in memory."""
+
+    built = Signal(str, str)  # source path, key
+    failed = Signal(str, str)  # source path, error
+
+    def __init__(self, root=None, blob_store=None, parent=None):
+        super().__init__(parent)
+        self.root = root or cache_root()
+        self.blob_store = blob_store
+        self.queue = Queue()
+
+    def enqueue(self, source):
+        self.queue.put(source)
+        if not self.isRunning():
+            self.start()
+
+    def stop(self):
+        self.queue.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            source = self.queue.get()
+            if source is None:
+                return
+            try:
+                self.built.emit(source, self.build(source))
+            except Exception as e:
+                self.failed.emit(source, str(e))
+
+    def build(self, source):
+        # With a blob store the original is kept (once) alongside the page, and
+        # each insertion holds a reference to it
+        key = self.blob_store.put_file(source) if self.blob_store else file_key(source)
+        if ImagePyramid.load(key, self.root) is not None:
+            return key  # already stored
+        try:
+            self._build_levels(source, key)
+        except Exception:
+            # The picture won't be inserted, so it mustn't hold on to the stored original
+            if self.blob_store:
+                self.blob_store.release(key)
+            raise
+        return key
+
+    def _build_levels(self, source, key):
+        reader = QImageReader(source)
+        reader.setAutoTransform(True)
+        image = reader.read()
+        if image.isNull():
+            raise ValueError(reader.errorString())
+        alpha = image.hasAlphaChannel()
+        image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied if alpha else QImage.Format_RGB32)
+        fmt = "png" if alpha else "jpg"
+        width, height = image.width(), image.height()
+
+        path = os.path.join(self.root, key)
+        level = 0
+        while True:
+            level_dir = os.path.join(path, str(level))
+            os.makedirs(level_dir, exist_ok=True)
+            for y in range(0, image.height(), TILE_SIZE):
+                for x in range(0, image.width(), TILE_SIZE):
+                    tile = image.copy(QRect(x, y, min(TILE_SIZE, image.width() - x),
+                                            min(TILE_SIZE, image.height() - y)))
+                    tile.save(os.path.join(level_dir, f"{x // TILE_SIZE}_{y // TILE_SIZE}.{fmt}"), None, JPEG_QUALITY)
+            if max(image.width(), image.height()) <= TILE_SIZE:
+                break
+            image = image.scaled(math.ceil(image.width() / 2), math.ceil(image.height() / 2),
+                                 Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            level += 1
+
+        # Written last, so a pyramid only counts as built once all tiles exist
+        meta_path = os.path.join(path, META_FILE)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"width": width, "height": height, "levels": level + 1, "format": fmt}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+
+class _TileLoader(QRunnable):
+    def __init__(self, cache, key, path):
+        super().__init__()
+        self.cache = cache
+        self.key = key
+        self.path = path
+
+    def run(self):
+        self.cache.loaded.emit(self.key, QImage(self.path))
+
+
+class TileCache(QObject):
+    """LRU cache of decoded tiles, bounded by bytes; misses load on a thread pool."""
+
+    loaded = Signal(object, QImage)
+    tileReady = Signal()
+
+    def __init__(self, max_bytes=256 << 20, parent=None):
+        super().__init__(parent)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.tiles = OrderedDict()
+        self.loading = set()
+        self.pool = QThreadPool(self)
+        self.loaded.connect(self.on_loaded)
+
+    def tile(self, pyramid, level, col, row, load=True):
+        """Returns the tile if cached; otherwise schedules a load (if asked) and returns None."""
+        key = (pyramid.key, level, col, row)
+        image = self.tiles.get(key)
+        if image is not None:
+            self.tiles.move_to_end(key)
+            return image
+        if load and key not in self.loading:
+            self.loading.add(key)
+            self.pool.start(_TileLoader(self, key, pyramid.tile_path(level, col, row)))
+        return None
+
+    def on_loaded(self, key, image):
+        self.loading.discard(key)
+        if image.isNull():
+            return
+        self.tiles[key] = image
+        self.bytes += image.sizeInBytes()
+        while self.bytes > self.max_bytes and len(self.tiles) > 1:
+            _, old = self.tiles.popitem(last=False)
+            self.bytes -= old.sizeInBytes()
+        self.tileReady.emit()
+
+
+class TileFiles:
+    """Tiles read straight from their files, with TileCache's tile() so paint_pyramid can use it.
+
+    For painting off the GUI thread, as exports do, where nothing can wait for the cache to load a tile.
+    """
+
+    def tile(self, pyramid, level, col, row, load=True):
+        image = QImage(pyramid.tile_path(level, col, row))
+        return None if image.isNull() else image
+
+
+def paint_pyramid(painter, pyramid, cache, target, exposed):
+    """Draws the visible part of a pyramid scaled into target (QRectF).
+
+    Tiles that aren't loaded yet are requested and, meanwhile, covered by the
+    best coarser tile already in the cache.
+    """
+    visible = target.intersected(QRectF(exposed))
+    if visible.isEmpty():
+        return
+    scale = target.width() / pyramid.width
+    level = pyramid.level_for_scale(scale)
+
+    # Source rectangle in full-resolution pixels
+    source = QRectF((visible.left() - target.left()) / scale, (visible.top() - target.top()) / scale,
+                    visible.width() / scale, visible.height() / scale)
+
+    # Always keep the single top tile around as the last-resort placeholder
+    cache.tile(pyramid, pyramid.levels - 1, 0, 0)
+
+    for col, row in pyramid.tiles_in(level, source):
+        tile_rect = pyramid.tile_rect(level, col, row)
+        dest = _to_target(tile_rect, target, scale)
+        image = cache.tile(pyramid, level, col, row)
+        if image is not None:
+            painter.drawImage(dest, image)
+            continue
+        for coarse in range(level + 1, pyramid.levels):
+            factor = 1 << coarse
+            ccol, crow = int(tile_rect.left() / factor) // TILE_SIZE, int(tile_rect.top() / factor) // TILE_SIZE
+            image = cache.tile(pyramid, coarse, ccol, crow, load=False)
+            if image is not None:
+                origin = pyramid.tile_rect(coarse, ccol, crow).topLeft()
+                part = QRectF((tile_rect.left() - origin.x()) / factor, (tile_rect.top() - origin.y()) / factor,
+                              tile_rect.width() / factor, tile_rect.height() / factor)
+                painter.drawImage(dest, image, part)
+                break
+        else:
+            painter.fillRect(dest, QColor(235, 235, 235))
+
+
+def _to_target(rect, target, scale):
+    return QRectF(target.left() + rect.left() * scale, target.top() + rect.top() * scale,
+                  rect.width() * scale, rect.height() * scale)
@@ -0,0 +1,230 @@
+from PySide6.QtCore import Qt, QPoint, QTimer
+from PySide6.QtGui import QTextCursor
+from PySide6.QtWidgets import QWidget, QHBoxLayout, QPlainTextEdit, QScrollBar
+
+from PageTextStore import PageTextStore
+
+
+class LargeTextEdit(QWidget):
+    """Typed-notes editor that keeps only a window of blocks around the viewport loaded.
+
+    The page text lives in a PageTextStore. The inner QPlainTextEdit holds at
+    most WINDOW_BLOCKS blocks, so typing and layout cost stay the same no
+    matter how long the page is. The outer scroll bar spans the whole page;
+    the window is moved when the viewport gets close to one of its edges.
+
+    A move edits the document in place, removing the blocks that leave the
+    window and inserting the ones that enter it, so undo history survives.
+    Each move is one undo step of its own; when undo or redo crosses it the
+    window is put back to where it was on that side of the move.
+    """
+
+    WINDOW_BLOCKS = 2000
+    MARGIN_BLOCKS = 400
+    AUTOSAVE_MS = 2000
+
+    def __init__(self, store=None, parent=None):
+        super().__init__(parent)
+        self.store = store or PageTextStore()
+        self.window_start = 0
+        self.window_lines = []  # store contents of the loaded window, used to diff edits
+        self.window_dirty = False
+        self.moves = []  # (undo steps after, window before, window after) of each move, oldest first
+        self.undone_moves = []
+
+        self.editor = QPlainTextEdit()
+        self.editor.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.editor.setFrameShape(QPlainTextEdit.NoFrame)
+        self.scrollbar = QScrollBar(Qt.Vertical)
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        layout.addWidget(self.editor)
+        layout.addWidget(self.scrollbar)
+
+        self.autosaveTimer = QTimer(self)
+        self.autosaveTimer.setSingleShot(True)
+        self.autosaveTimer.setInterval(self.AUTOSAVE_MS)
+        self.autosaveTimer.timeout.connect(self.save)
+
+        self.editor.textChanged.connect(self.on_text_changed)
+        self.editor.document().undoCommandAdded.connect(self.undone_moves.clear)
+        self.editor.verticalScrollBar().valueChanged.connect(self.on_editor_scrolled)
+        self.scrollbar.valueChanged.connect(self.on_scrollbar_moved)
+
+        self.load_window(0)
+
+    def setPlaceholderText(self, text):
+        self.editor.setPlaceholderText(text)
+
+    def set_store(self, store):
+        """Shows another page, saving the current one first."""
+        self.commit_window()
+        if self.store.path and self.store.is_modified():
+            self.store.save()
+        self.store = store
+        self.window_start = 0
+        self.window_lines = []
+        self.load_window(0)
+
+    def first_visible_block(self):
+        """Absolute block number of the first block in the viewport."""
+        return self.window_start + self.editor.cursorForPosition(QPoint(0, 0)).blockNumber()
+
+    def on_text_changed(self):
+        # Edits are only diffed against the store when the window moves or the
+        # page is saved, so a keystroke costs the same as in a tiny document
+        self.follow_undo()
+        self.window_dirty = True
+        self.update_scroll_range()
+        if self.store.path:
+            self.autosaveTimer.start()
+
+    def on_editor_scrolled(self, _value):
+        top = self.first_visible_block()
+        loaded = self.editor.document().blockCount()
+        near_start = self.window_start > 0 and top - self.window_start < self.MARGIN_BLOCKS
+        near_end = (self.window_start + loaded < self.total_blocks()
+                    and self.window_start + loaded - top < self.MARGIN_BLOCKS)
+        if near_start or near_end:
+            self.load_window(top)
+        else:
+            self.scrollbar.blockSignals(True)
+            self.scrollbar.setValue(top)
+            self.scrollbar.blockSignals(False)
+
+    def on_scrollbar_moved(self, value):
+        loaded = self.editor.document().blockCount()
+        if self.window_start <= value < self.window_start + loaded - self.MARGIN_BLOCKS or \
+                (self.window_start <= value and self.window_start + loaded >= self.total_blocks()):
+            self.scroll_editor_to(value - self.window_start)
+        else:
+            self.load_window(value)
+
+    def total_blocks(self):
+        """Block count of the page including unsaved edits in the window."""
+        loaded = self.editor.document().blockCount()
+        return self.store.block_count() - len(self.window_lines) + loaded
+
+    def update_scroll_range(self):
+        self.scrollbar.blockSignals(True)
+        self.scrollbar.setRange(0, max(0, self.total_blocks() - 1))
+        self.scrollbar.setPageStep(max(1, self.editor.viewport().height() // max(1, self.editor.fontMetrics().height())))
+        self.scrollbar.blockSignals(False)
+
+    def commit_window(self):
+        """Writes edits made in the window back to the store, touching only changed blocks."""
+        if not self.window_dirty:
+            return
+        new_lines = self.editor.toPlainText().split("\n")
+        old_lines = self.window_lines
+
+        # Trim the common prefix and suffix so only the edited span is replaced
+        prefix = 0
+        limit = min(len(old_lines), len(new_lines))
+        while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+            suffix += 1
+
+        self.store.replace_blocks(self.window_start + prefix,
+                                  self.window_start + len(old_lines) - suffix,
+                                  new_lines[prefix:len(new_lines) - suffix])
+        self.window_lines = new_lines
+        self.window_dirty = False
+
+    def follow_undo(self):
+        """Puts the window back in step with the document after undo or redo crossed a move."""
+        steps = self.editor.document().availableUndoSteps()
+        changed = False
+        while self.moves and steps < self.moves[-1][0]:
+            move = self.moves.pop()
+            self.undone_moves.append(move)
+            self.window_start, self.window_lines = move[1]
+            changed = True
+        while self.undone_moves and steps >= self.undone_moves[-1][0]:
+            move = self.undone_moves.pop()
+            self.moves.append(move)
+            self.window_start, self.window_lines = move[2]
+            changed = True
+        if changed:
+            self.window_dirty = True
+
+    def load_window(self, top):
+        """Loads the blocks around absolute block `top` and keeps `top` at the top of the view."""
+        self.commit_window()
+
+        total = self.store.block_count()
+        start = max(0, min(top - self.WINDOW_BLOCKS // 2, total - self.WINDOW_BLOCKS))
+        end = min(total, start + self.WINDOW_BLOCKS)
+        old_start, old_end = self.window_start, self.window_start + len(self.window_lines)
+        before = (old_start, self.window_lines)
+
+        self.editor.blockSignals(True)
+        if not self.window_lines:
+            # A new page: nothing to undo yet
+            self.window_lines = self.store.read_blocks(start, end)
+            self.editor.setPlainText("\n".join(self.window_lines))
+            self.moves.clear()
+            self.undone_moves.clear()
+        elif total and (start, end) != (old_start, old_end):
+            self.window_lines = self.store.read_blocks(start, end)
+            self.move_window(old_start, old_end, start, end)
+            self.moves.append((self.editor.document().availableUndoSteps(), before, (start, self.window_lines)))
+        self.editor.blockSignals(False)
+        self.window_start = start
+        # The document always holds at least one (empty) block; it only reaches
+        # the store when something is typed into it
+        if not self.window_lines:
+            self.window_lines = [""]
+
+        self.update_scroll_range()
+        self.scroll_editor_to(top - start)
+        self.scrollbar.blockSignals(True)
+        self.scrollbar.setValue(top)
+        self.scrollbar.blockSignals(False)
+
+    def move_window(self, old_start, old_end, start, end):
+        """Turns the document from blocks [old_start, old_end) into [start, end) as one undo step."""
+        document = self.editor.document()
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        if end <= old_start or start >= old_end:
+            cursor.select(QTextCursor.Document)
+            cursor.insertText("\n".join(self.window_lines))
+        else:
+            # Blocks kept in the window are not touched, nor is the text cursor in them
+            if end < old_end:
+                cursor.setPosition(document.findBlockByNumber(end - old_start).position() - 1)
+                cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+                cursor.removeSelectedText()
+            elif end > old_end:
+                cursor.movePosition(QTextCursor.End)
+                cursor.insertText("\n" + "\n".join(self.window_lines[old_end - start:]))
+            if start > old_start:
+                cursor.setPosition(0)
+                cursor.setPosition(document.findBlockByNumber(start - old_start).position(), QTextCursor.KeepAnchor)
+                cursor.removeSelectedText()
+            elif start < old_start:
+                cursor.setPosition(0)
+                cursor.insertText("\n".join(self.window_lines[:old_start - start]) + "\n")
+        cursor.endEditBlock()
+
+    def scroll_editor_to(self, block_number):
+        block = self.editor.document().findBlockByNumber(max(0, block_number))
+        bar = self.editor.verticalScrollBar()
+        bar.blockSignals(True)
+        bar.setValue(block.firstLineNumber())
+        bar.blockSignals(False)
+
+    def toPlainText(self):
+        self.commit_window()
+        return self.store.text()
+
+    def save(self):
+        """Saves the page; only chunks containing changed blocks are rewritten."""
+        self.commit_window()
+        if self.store.path and self.store.is_modified():
+            self.store.save()
@@ -0,0 +1,92 @@
+"""On-disk layout of notebooks.
+
+    <root>/<Notebook>/<Section>/<Page>.page/
+        strokes.log     PageReplica operation log
+        text/           PageTextStore chunks
+        thumbnail.png   preview, regenerated by maintenance.py
+    <root>/.blobs/      BlobStore shared by all notebooks (pictures, attachments)
+    <root>/.search.json word index of page titles and text, written by
+                        maintenance.py reindex; the app doesn't read it yet
+
+Notebooks and sections are plain directories, so the navigator tree maps
+one to one onto the file system.
+"""
+
+import os
+
+from StrokeLog import PageReplica
+
+PAGE_SUFFIX = ".page"
+STROKES_FILE = "strokes.log"
+TEXT_DIR = "text"
+THUMBNAIL_FILE = "thumbnail.png"
+BLOB_DIR = ".blobs"
+SEARCH_INDEX = ".search.json"
+
+
+def default_root():
+    return os.environ.get("PYNOTE_NOTEBOOKS", os.path.join(os.path.expanduser("~"), "PyNote"))
+
+
+def blob_root(root):
+    return os.path.join(root, BLOB_DIR)
+
+
+def search_index_path(root):
+    return os.path.join(root, SEARCH_INDEX)
+
+
+def is_page(path):
+    return path.endswith(PAGE_SUFFIX) and os.path.isdir(path)
+
+
+def page_title(page_dir):
+    return os.path.basename(page_dir)[:-len(PAGE_SUFFIX)]
+
+
+def page_dir(root, notebook, section, page):
+    return os.path.join(root, notebook, section, page + PAGE_SUFFIX)
+
+
+def iter_pages(path):
+    """Yields every page directory at or below path, in a stable order."""
+    if is_page(path):
+        yield path
+        return
+    for current, dirs, _ in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in list(dirs):
+            if name.endswith(PAGE_SUFFIX):
+                dirs.remove(name)
+                yield os.path.join(current, name)
+
+
+def notebook_tree(root):
+    """Returns [(notebook, [(section, [page title, ...]), ...]), ...] as found under root, sorted."""
+    def subdirs(path):
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return []
+        return sorted(n for n in names if not n.startswith(".") and os.path.isdir(os.path.join(path, n)))
+
+    tree = []
+    for notebook in subdirs(root):
+        sections = []
+        for section in subdirs(os.path.join(root, notebook)):
+            if section.endswith(PAGE_SUFFIX):
+                continue
+            pages = [n[:-len(PAGE_SUFFIX)] for n in subdirs(os.path.join(root, notebook, section))
+                     if n.endswith(PAGE_SUFFIX)]
+            sections.append((section, pages))
+        tree.append((notebook, sections))
+    return tree
+
+
+def load_strokes(page_dir, device_id="local"):
+    """Returns the page's current strokes, with shapes flattened to strokes."""
+    replica = PageReplica.load(os.path.join(page_dir, STROKES_FILE), device_id)
+    strokes = list(replica.strokes().values())
+    for shape in replica.shapes().values():
+        strokes.extend(shape.to_strokes())
+    return strokes
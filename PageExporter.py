@@ -0,0 +1,364 @@
+"""Exports pages to PNG, SVG and PDF without the GUI.
+
+The work for a page is cut into independent tasks that run in a process
+pool: horizontal bands of pixels for PNG, groups of strokes for SVG and PDF.
+Results are written to disk in order as they come back, and only a bounded
+number of tasks is in flight, so no full-resolution image of a page is ever
+held in memory.
+
+PNG bands are deflate-compressed in the workers and joined into a single
+zlib stream (the same trick pigz uses), so compression is parallel too.
+
+Pages open in the app keep their ink as pixels next to their shapes,
+pictures and tables; write_page() exports those by painting them.
+"""
+
+import os
+import struct
+import zlib
+
+from PySide6.QtCore import Qt, QMarginsF, QPointF, QRect, QSize, QSizeF
+from PySide6.QtGui import QColor, QImage, QPageSize, QPainter, QPdfWriter, QPen
+from PySide6.QtSvg import QSvgGenerator
+
+import NotebookStore
+from StrokeCodec import encode_strokes, decode_strokes
+
+FORMATS = ("png", "svg", "pdf")
+MARGIN = 20
+MIN_PAGE_SIZE = (800, 600)
+BAND_PIXELS = 4_000_000  # pixels rendered per PNG task
+STROKES_PER_TASK = 2000  # strokes per SVG/PDF task
+PDF_POINTS_PER_PIXEL = 0.75  # 96 dpi
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def output_path(page_dir, source_root, out_dir, fmt):
+    """Mirrors the notebook/section structure of the page under out_dir."""
+    relative = os.path.relpath(page_dir, source_root)
+    if relative == ".":
+        relative = os.path.basename(page_dir)
+    return os.path.join(out_dir, relative[:-len(NotebookStore.PAGE_SUFFIX)] + "." + fmt)
+
+
+def export_pages(pages, source_root, out_dir, fmt, executor, progress=None, cancelled=None,
+                 scale=1.0, max_in_flight=None):
+    """Exports page directories to out_dir; returns the files written.
+
+    progress(done, total) is called in units of 1/100 page. cancelled() is
+    polled between tasks; when it returns True the partial file is removed
+    and ExportCancelled is raised.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}")
+    max_in_flight = max_in_flight or 2 * (os.cpu_count() or 1)
+    pages = list(pages)
+    written = []
+    for index, page in enumerate(pages):
+        path = output_path(page, source_root, out_dir, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        def page_progress(fraction, index=index):
+            if progress:
+                progress(int((index + fraction) * 100), len(pages) * 100)
+
+        try:
+            strokes = NotebookStore.load_strokes(page)
+            writer = {"png": _write_png, "svg": _write_svg, "pdf": _write_pdf}[fmt]
+            writer(path, strokes, executor, scale, max_in_flight, page_progress, cancelled)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        written.append(path)
+    if progress:
+        progress(len(pages) * 100, len(pages) * 100)
+    return written
+
+
+def page_bounds(strokes):
+    """Returns (left, top, width, height) of the page in pixels."""
+    left, top = 0.0, 0.0
+    right, bottom = MIN_PAGE_SIZE
+    for stroke in strokes:
+        if len(stroke):
+            l, t, r, b = stroke.bounding_rect()
+            left, top = min(left, l - MARGIN), min(top, t - MARGIN)
+            right, bottom = max(right, r + MARGIN), max(bottom, b + MARGIN)
+    return left, top, right - left, bottom - top
+
+
+def write_page(path, fmt, width, height, paint):
+    """Writes a page of width x height pixels that paint(painter) draws, white underneath.
+
+    Runs in the calling thread; paint must only use what can be drawn off the GUI thread.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}")
+    if fmt == "png":
+        device = QImage(width, height, QImage.Format.Format_RGB32)
+    elif fmt == "svg":
+        device = QSvgGenerator()
+        device.setFileName(path)
+        device.setSize(QSize(width, height))
+        device.setViewBox(QRect(0, 0, width, height))
+    else:
+        device = QPdfWriter(path)
+        device.setResolution(round(72 / PDF_POINTS_PER_PIXEL))
+        device.setPageSize(QPageSize(QSizeF(width * PDF_POINTS_PER_PIXEL, height * PDF_POINTS_PER_PIXEL),
+                                     QPageSize.Unit.Point))
+        device.setPageMargins(QMarginsF(0, 0, 0, 0))
+    painter = QPainter(device)
+    if not painter.isActive():
+        raise OSError(f"Could not write {path}")
+    painter.setClipRect(QRect(0, 0, width, height))
+    painter.fillRect(QRect(0, 0, width, height), Qt.GlobalColor.white)
+    paint(painter)
+    painter.end()
+    if fmt == "png" and not device.save(path, "PNG"):
+        raise OSError(f"Could not write {path}")
+
+
+def _run_ordered(tasks, executor, max_in_flight, on_result, cancelled):
+    """Runs (fn, args) tasks in the pool and hands results to on_result in task order."""
+    tasks = iter(tasks)
+    in_flight = []
+    try:
+        while True:
+            while len(in_flight) < max_in_flight:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                in_flight.append(executor.submit(*task))
+            if not in_flight:
+                return
+            if cancelled and cancelled():
+                raise ExportCancelled()
+            on_result(in_flight.pop(0).result())
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def _strokes_in_rect(strokes, rects, top, bottom):
+    return [s for s, (_, t, _, b) in zip(strokes, rects) if b >= top and t <= bottom]
+
+
+# PNG
+
+def _png_chunk(f, kind, data):
+    f.write(struct.pack(">I", len(data)) + kind + data)
+    f.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+def _adler32_combine(adler1, adler2, len2):
+    """Adler-32 of A + B from the checksums of A and B (port of zlib's adler32_combine)."""
+    base = 65521
+    rem = len2 % base
+    sum1 = adler1 & 0xFFFF
+    sum2 = (rem * sum1) % base
+    sum1 += (adler2 & 0xFFFF) + base - 1
+    sum2 += (adler1 >> 16) + (adler2 >> 16) + base - rem
+    if sum1 >= base:
+        sum1 -= base
+    if sum1 >= base:
+        sum1 -= base
+    if sum2 >= base << 1:
+        sum2 -= base << 1
+    if sum2 >= base:
+        sum2 -= base
+    return sum1 | (sum2 << 16)
+
+
+def _write_png(path, strokes, executor, scale, max_in_flight, progress, cancelled):
+    left, top, width, height = page_bounds(strokes)
+    pixel_width, pixel_height = max(1, int(width * scale)), max(1, int(height * scale))
+    band_height = max(1, BAND_PIXELS // pixel_width)
+    bands = range(0, pixel_height, band_height)
+    rects = [s.bounding_rect() for s in strokes]
+
+    def tasks():
+        for y in bands:
+            rows = min(band_height, pixel_height - y)
+            band_top = top + y / scale
+            band_bottom = band_top + rows / scale
+            data = encode_strokes(_strokes_in_rect(strokes, rects, band_top, band_bottom), compress=False)
+            yield _render_png_band, data, left, band_top, pixel_width, rows, scale
+
+    checksum = [1]
+    done = [0]
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        _png_chunk(f, b"IHDR", struct.pack(">IIBBBBB", pixel_width, pixel_height, 8, 2, 0, 0, 0))
+        _png_chunk(f, b"IDAT", b"\x78\x9c")
+
+        def on_result(result):
+            deflated, adler, raw_length = result
+            _png_chunk(f, b"IDAT", deflated)
+            checksum[0] = _adler32_combine(checksum[0], adler, raw_length)
+            done[0] += 1
+            progress(done[0] / len(bands))
+
+        _run_ordered(tasks(), executor, max_in_flight, on_result, cancelled)
+        # Empty final deflate block, then the checksum of the whole stream
+        _png_chunk(f, b"IDAT", b"\x03\x00" + struct.pack(">I", checksum[0]))
+        _png_chunk(f, b"IEND", b"")
+
+
+def _render_png_band(data, left, top, width, rows, scale):
+    """Worker: rasterizes one band and returns it as a raw deflate segment."""
+    image = QImage(width, rows, QImage.Format.Format_RGB888)
+    image.fill(Qt.GlobalColor.white)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.scale(scale, scale)
+    painter.translate(-left, -top)
+    _paint_strokes(painter, decode_strokes(data).strokes())
+    painter.end()
+
+    bits = image.constBits()
+    line, row_bytes = image.bytesPerLine(), width * 3
+    raw = b"".join(b"\x00" + bytes(bits[y * line:y * line + row_bytes]) for y in range(rows))
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    deflated = compressor.compress(raw) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return deflated, zlib.adler32(raw), len(raw)
+
+
+def _paint_strokes(painter, strokes):
+    for stroke in strokes:
+        pen = QPen(QColor.fromRgba(stroke.color), stroke.width,
+                   Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
+        painter.setPen(pen)
+        painter.drawPolyline([QPointF(x, y) for x, y in zip(stroke.xs, stroke.ys)])
+
+
+def render_thumbnail(strokes, size):
+    """Renders the whole page into a QImage at most size pixels wide and high."""
+    left, top, width, height = page_bounds(strokes)
+    scale = min(size / width, size / height)
+    image = QImage(max(1, int(width * scale)), max(1, int(height * scale)), QImage.Format.Format_RGB32)
+    image.fill(Qt.GlobalColor.white)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.scale(scale, scale)
+    painter.translate(-left, -top)
+    _paint_strokes(painter, strokes)
+    painter.end()
+    return image
+
+
+# SVG
+
+def _stroke_groups(strokes):
+    for i in range(0, len(strokes), STROKES_PER_TASK):
+        yield encode_strokes(strokes[i:i + STROKES_PER_TASK], compress=False)
+
+
+def _write_svg(path, strokes, executor, scale, max_in_flight, progress, cancelled):
+    left, top, width, height = page_bounds(strokes)
+    groups = max(1, -(-len(strokes) // STROKES_PER_TASK))
+    done = [0]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width * scale:.0f}" '
+                f'height="{height * scale:.0f}" viewBox="{left:.2f} {top:.2f} {width:.2f} {height:.2f}">\n')
+        f.write(f'<rect x="{left:.2f}" y="{top:.2f}" width="{width:.2f}" height="{height:.2f}" fill="white"/>\n')
+
+        def on_result(fragment):
+            f.write(fragment)
+            done[0] += 1
+            progress(done[0] / groups)
+
+        tasks = ((_svg_fragment, data) for data in _stroke_groups(strokes))
+        _run_ordered(tasks, executor, max_in_flight, on_result, cancelled)
+        f.write("</svg>\n")
+
+
+def _svg_fragment(data):
+    """Worker: converts a group of strokes to SVG path elements."""
+    batch = decode_strokes(data)
+    parts = []
+    for i in range(len(batch)):
+        stroke = batch.stroke(i)
+        if not len(stroke):
+            continue
+        points = [f"{x:.2f} {y:.2f}" for x, y in zip(stroke.xs, stroke.ys)]
+        if len(points) == 1:
+            points.append(points[0])
+        color = stroke.color
+        parts.append(f'<path d="M {points[0]} L {" ".join(points[1:])}" fill="none" '
+                     f'stroke="#{color & 0xFFFFFF:06x}" stroke-opacity="{(color >> 24) / 255:.3f}" '
+                     f'stroke-width="{stroke.width:.2f}" stroke-linecap="round" stroke-linejoin="round"/>\n')
+    return "".join(parts)
+
+
+# PDF
+
+def _write_pdf(path, strokes, executor, scale, max_in_flight, progress, cancelled):
+    left, top, width, height = page_bounds(strokes)
+    k = PDF_POINTS_PER_PIXEL * scale
+    page_width, page_height = width * k, height * k
+    groups = max(1, -(-len(strokes) // STROKES_PER_TASK))
+    done = [0]
+    offsets = {}
+
+    with open(path, "wb") as f:
+        def begin(number):
+            offsets[number] = f.tell()
+            f.write(f"{number} 0 obj\n".encode("ascii"))
+
+        f.write(b"%PDF-1.4\n")
+        begin(1)
+        f.write(b"<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+        begin(2)
+        f.write(b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>\nendobj\n")
+        begin(3)
+        f.write(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+                f"/Contents 4 0 R >>\nendobj\n".encode("ascii"))
+        begin(4)
+        f.write(b"<< /Length 5 0 R >>\nstream\n")
+        stream_start = f.tell()
+        # Flip to a top-left origin in page pixels
+        f.write(f"{k:.4f} 0 0 {-k:.4f} {-left * k:.2f} {page_height + top * k:.2f} cm\n".encode("ascii"))
+
+        def on_result(fragment):
+            f.write(fragment)
+            done[0] += 1
+            progress(done[0] / groups)
+
+        tasks = ((_pdf_fragment, data) for data in _stroke_groups(strokes))
+        _run_ordered(tasks, executor, max_in_flight, on_result, cancelled)
+
+        stream_length = f.tell() - stream_start
+        f.write(b"\nendstream\nendobj\n")
+        begin(5)
+        f.write(f"{stream_length}\nendobj\n".encode("ascii"))
+
+        xref = f.tell()
+        f.write(b"xref\n0 6\n0000000000 65535 f \n")
+        for number in range(1, 6):
+            f.write(f"{offsets[number]:010d} 00000 n \n".encode("ascii"))
+        f.write(f"trailer\n<< /Size 6 /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii"))
+
+
+def _pdf_fragment(data):
+    """Worker: converts a group of strokes to PDF path operators."""
+    batch = decode_strokes(data)
+    parts = []
+    for i in range(len(batch)):
+        stroke = batch.stroke(i)
+        if not len(stroke):
+            continue
+        color = stroke.color
+        r, g, b = (color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF
+        parts.append(f"{r / 255:.3f} {g / 255:.3f} {b / 255:.3f} RG {stroke.width:.2f} w 1 J 1 j\n")
+        points = list(zip(stroke.xs, stroke.ys))
+        if len(points) == 1:
+            points.append(points[0])
+        parts.append(f"{points[0][0]:.2f} {points[0][1]:.2f} m\n")
+        parts.append("".join(f"{x:.2f} {y:.2f} l\n" for x, y in points[1:]))
+        parts.append("S\n")
+    return "".join(parts).encode("ascii")
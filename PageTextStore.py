@@ -0,0 +1,224 @@
+import json
+import os
+from bisect import bisect_right
+from collections import OrderedDict
+
+
+class _Chunk:
+    __slots__ = ("id", "count", "lines", "dirty")
+
+    def __init__(self, chunk_id, count, lines=None, dirty=False):
+        self.id = chunk_id
+        self.count = count
+        self.lines = lines
+        self.dirty = dirty
+
+
+class PageTextStore:
+    """Block (paragraph) based text storage for a page, split into chunk files.
+
+    Only the index is read on open; chunk files are loaded on demand and kept
+    in a small LRU cache. save() writes only the chunks that changed.
+
+    On disk a page is a directory holding index.json and one <id>.txt file per
+    chunk with its blocks separated by newlines.
+    """
+
+    CHUNK_BLOCKS = 256
+    INDEX_FILE = "index.json"
+
+    def __init__(self, path=None, cache_chunks=64):
+        self.path = path
+        self.cache_chunks = cache_chunks
+        self.chunks = []
+        self.next_id = 0
+        self.removed = []  # chunk ids whose files must be deleted on save
+        self._cache = OrderedDict()  # ids of loaded, clean chunks in LRU order
+        self._starts = None  # first block number of every chunk
+
+        if path and os.path.exists(os.path.join(path, self.INDEX_FILE)):
+            with open(os.path.join(path, self.INDEX_FILE), encoding="utf-8") as f:
+                index = json.load(f)
+            self.next_id = index["next_id"]
+            self.chunks = [_Chunk(c["id"], c["lines"]) for c in index["chunks"]]
+
+    @classmethod
+    def from_text(cls, text, path=None):
+        """Creates a store holding the given text; nothing is written until save()."""
+        store = cls(path)
+        store.removed = [c.id for c in store.chunks]
+        store.chunks = []
+        lines = text.split("\n") if text else []
+        for i in range(0, len(lines), cls.CHUNK_BLOCKS):
+            store.chunks.append(store._new_chunk(lines[i:i + cls.CHUNK_BLOCKS]))
+        return store
+
+    def block_count(self):
+        starts = self._chunk_starts()
+        return starts[-1] + self.chunks[-1].count if self.chunks else 0
+
+    def is_modified(self):
+        return bool(self.removed) or any(c.dirty for c in self.chunks)
+
+    def read_blocks(self, start, end):
+        """Returns the text of blocks [start, end) as a list of strings."""
+        end = min(end, self.block_count())
+        if start >= end:
+            return []
+        starts = self._chunk_starts()
+        ci = bisect_right(starts, start) - 1
+        result = []
+        while ci < len(self.chunks) and starts[ci] < end:
+            lines = self._lines(ci)
+            result.extend(lines[max(0, start - starts[ci]):end - starts[ci]])
+            ci += 1
+        return result
+
+    def text(self):
+        return "\n".join(self.read_blocks(0, self.block_count()))
+
+    def replace_blocks(self, start, end, lines):
+        """Replaces blocks [start, end) with lines; only the chunks touched become dirty."""
+        total = self.block_count()
+        start, end = min(start, total), min(max(end, start), total)
+        if not self.chunks:
+            self.chunks = [self._new_chunk([])]
+            self._starts = None
+        starts = self._chunk_starts()
+
+        first = max(0, bisect_right(starts, start) - 1)
+        if end > start:
+            last = bisect_right(starts, end - 1) - 1
+        else:
+            last = first
+
+        merged = []
+        for ci in range(first, last + 1):
+            merged.extend(self._lines(ci))
+        offset = starts[first]
+        merged[start - offset:end - offset] = list(lines)
+
+        # Fold small results into the following chunk so repeated deletes
+        # don't fragment the page into many tiny files
+        while len(merged) < self.CHUNK_BLOCKS // 2 and last + 1 < len(self.chunks):
+            last += 1
+            merged.extend(self._lines(last))
+
+        replaced = self.chunks[first:last + 1]
+        for chunk in replaced:
+            self._cache.pop(chunk.id, None)
+
+        # Keep slightly oversized chunks as one piece so typing a few new
+        # paragraphs doesn't keep re-splitting and renaming chunk files
+        if len(merged) <= 2 * self.CHUNK_BLOCKS:
+            pieces = [merged] if merged else []
+        else:
+            pieces = [merged[i:i + self.CHUNK_BLOCKS] for i in range(0, len(merged), self.CHUNK_BLOCKS)]
+
+        new_chunks = []
+        for i, piece in enumerate(pieces):
+            if i == 0:
+                chunk = replaced[0]
+                chunk.lines, chunk.count, chunk.dirty = piece, len(piece), True
+                new_chunks.append(chunk)
+            else:
+                new_chunks.append(self._new_chunk(piece))
+        keep = {c.id for c in new_chunks}
+        self.removed.extend(c.id for c in replaced if c.id not in keep)
+
+        self.chunks[first:last + 1] = new_chunks
+        self._starts = None
+
+    def save(self, path=None):
+        """Writes dirty chunks and the index; unchanged chunk files are left alone."""
+        if path is not None and path != self.path:
+            # Saving somewhere new needs every chunk, not just the dirty ones
+            for ci in range(len(self.chunks)):
+                self._lines(ci)
+                self.chunks[ci].dirty = True
+            self.path = path
+            self.removed = []
+        if not self.path:
+            raise ValueError("PageTextStore has no path to save to")
+        os.makedirs(self.path, exist_ok=True)
+
+        for chunk in self.chunks:
+            if chunk.dirty:
+                self._write(self._chunk_path(chunk.id), "\n".join(chunk.lines))
+                chunk.dirty = False
+                self._remember(chunk)
+
+        index = {
+            "version": 1,
+            "next_id": self.next_id,
+            "chunks": [{"id": c.id, "lines": c.count} for c in self.chunks],
+        }
+        self._write(os.path.join(self.path, self.INDEX_FILE), json.dumps(index))
+
+        for chunk_id in self.removed:
+            try:
+                os.remove(self._chunk_path(chunk_id))
+            except FileNotFoundError:
+                pass
+        self.removed = []
+
+    def verify(self):
+        """Returns a list of problems: chunk files that are missing or disagree with the index."""
+        problems = []
+        for chunk in self.chunks:
+            if chunk.dirty:
+                continue
+            try:
+                with open(self._chunk_path(chunk.id), encoding="utf-8") as f:
+                    data = f.read()
+            except OSError as e:
+                problems.append(f"chunk {chunk.id}: {e}")
+                continue
+            # Compared even when the index says 0: a written chunk always holds at least one block
+            count = len(data.split("\n"))
+            if count != chunk.count:
+                problems.append(f"chunk {chunk.id}: {count} blocks, index says {chunk.count}")
+        return problems
+
+    def _new_chunk(self, lines):
+        chunk = _Chunk(self.next_id, len(lines), lines, dirty=True)
+        self.next_id += 1
+        return chunk
+
+    def _chunk_starts(self):
+        if self._starts is None:
+            starts, total = [], 0
+            for chunk in self.chunks:
+                starts.append(total)
+                total += chunk.count
+            self._starts = starts
+        return self._starts
+
+    def _chunk_path(self, chunk_id):
+        return os.path.join(self.path, f"{chunk_id}.txt")
+
+    def _lines(self, ci):
+        chunk = self.chunks[ci]
+        if chunk.lines is None:
+            with open(self._chunk_path(chunk.id), encoding="utf-8") as f:
+                data = f.read()
+            chunk.lines = data.split("\n") if chunk.count else []
+        if not chunk.dirty:
+            self._remember(chunk)
+        return chunk.lines
+
+    def _remember(self, chunk):
+        """Marks a clean chunk as recently used and unloads the oldest ones."""
+        self._cache[chunk.id] = chunk
+        self._cache.move_to_end(chunk.id)
+        while len(self._cache) > self.cache_chunks:
+            _, old = self._cache.popitem(last=False)
+            if not old.dirty:
+                old.lines = None
+
+    @staticmethod
+    def _write(path, data):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
@@ -0,0 +1,177 @@
+"""Pen button gestures and the actions bound to them.
+
+Raw evdev key events are turned into ToolCommands by a ButtonRecognizer
+that runs on the listener thread, next to the device, so the GUI only has
+to apply a finished command. Each button can bind these gestures:
+
+    press           a short click
+    double_press    two clicks within DOUBLE_PRESS_TIME
+    hold            kept down for HOLD_TIME; the action lasts until release
+    down            the action starts on key-down and lasts until release,
+                    with no delay; overrides the others. Meant for
+                    BTN_TOOL_RUBBER, which goes down as soon as the eraser
+                    end of the pen comes into proximity
+
+A press fires as soon as it can no longer become anything else: on key-down
+when the button has nothing but a press bound, on release when it can also be
+held, and DOUBLE_PRESS_TIME after release when it can also be double-pressed.
+
+Bindings are kept as {button name: {gesture: action}} in a JSON file.
+"""
+
+import json
+import os
+from collections import namedtuple
+
+BUTTONS = {
+    321: "BTN_TOOL_RUBBER",
+    331: "BTN_STYLUS",
+    332: "BTN_STYLUS2",
+}
+GESTURES = ("press", "double_press", "hold", "down")
+# Tools stay selected; one-shot actions don't change the tool
+TOOLS = ("pen", "eraser", "highlighter", "lasso")
+ONE_SHOT_ACTIONS = ("undo", "redo")
+ACTIONS = TOOLS + ONE_SHOT_ACTIONS
+
+HOLD_TIME = 0.35  # seconds
+DOUBLE_PRESS_TIME = 0.3
+
+DEFAULT_BINDINGS = {
+    "BTN_STYLUS": {"press": "undo", "double_press": "redo", "hold": "eraser"},
+    "BTN_STYLUS2": {"press": "lasso"},
+    # Flipping the pen over to its eraser end
+    "BTN_TOOL_RUBBER": {"down": "eraser"},
+}
+
+# active is False only for the command that ends a held action
+ToolCommand = namedtuple("ToolCommand", "action button gesture active timestamp")
+
+
+def bindings_path():
+    return os.environ.get("PYNOTE_PEN_BINDINGS",
+                          os.path.join(os.path.expanduser("~"), ".config", "pynote", "pen_bindings.json"))
+
+
+def load_bindings(path=None):
+    """Returns the saved bindings, or the defaults if there are none."""
+    try:
+        with open(path or bindings_path(), encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return {button: dict(gestures) for button, gestures in DEFAULT_BINDINGS.items()}
+    return {button: {gesture: action for gesture, action in gestures.items()
+                     if gesture in GESTURES and action in ACTIONS}
+            for button, gestures in saved.items() if button in BUTTONS.values()}
+
+
+def save_bindings(bindings, path=None):
+    path = path or bindings_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(bindings, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+class ButtonRecognizer:
+    """Turns key events of pen buttons into ToolCommands.
+
+    feed() takes one event and poll() the current time; both return the
+    commands that became due. Timestamps are in seconds on one clock.
+    """
+
+    def __init__(self, bindings, hold_time=HOLD_TIME, double_press_time=DOUBLE_PRESS_TIME):
+        self.bindings = bindings
+        self.hold_time = hold_time
+        self.double_press_time = double_press_time
+        self.down = {}  # button -> time it went down
+        self.held = set()  # buttons whose hold action is active
+        self.clicked = {}  # button -> release time of a click that may become a double press
+
+    def set_bindings(self, bindings):
+        self.bindings = bindings
+        self.down.clear()
+        self.held.clear()
+        self.clicked.clear()
+
+    def next_deadline(self):
+        """Returns when poll() next needs calling, or None if nothing is pending."""
+        deadlines = [t + self.hold_time for b, t in self.down.items()
+                     if b not in self.held and "hold" in self._gestures(b)]
+        deadlines += [t + self.double_press_time for t in self.clicked.values()]
+        return min(deadlines, default=None)
+
+    def feed(self, code, value, timestamp):
+        button = BUTTONS.get(code)
+        if button is None or value == 2:  # not a pen button, or auto-repeat
+            return []
+        gestures = self._gestures(button)
+        commands = self.poll(timestamp)
+
+        if "down" in gestures:
+            return commands + self._command(button, "down", timestamp, active=value == 1)
+        if value == 1:
+            self.down[button] = timestamp
+            if "hold" not in gestures and "double_press" not in gestures:
+                commands += self._command(button, "press", timestamp)
+            return commands
+
+        pressed_at = self.down.pop(button, None)
+        if pressed_at is None:
+            return commands
+        if button in self.held:
+            self.held.discard(button)
+            return commands + self._command(button, "hold", timestamp, active=False)
+        if "hold" not in gestures and "double_press" not in gestures:
+            return commands  # fired on key-down
+        if "double_press" not in gestures:
+            return commands + self._command(button, "press", timestamp)
+        if self.clicked.pop(button, None) is not None:
+            return commands + self._command(button, "double_press", timestamp)
+        self.clicked[button] = timestamp
+        return commands
+
+    def poll(self, now):
+        commands = []
+        for button, pressed_at in list(self.down.items()):
+            if (button not in self.held and "hold" in self._gestures(button)
+                    and now - pressed_at >= self.hold_time):
+                # A click followed by a hold counts as a hold
+                self.clicked.pop(button, None)
+                self.held.add(button)
+                commands += self._command(button, "hold", pressed_at + self.hold_time)
+        for button, released_at in list(self.clicked.items()):
+            if button not in self.down and now - released_at >= self.double_press_time:
+                del self.clicked[button]
+                commands += self._command(button, "press", released_at + self.double_press_time)
+        return commands
+
+    def _gestures(self, button):
+        return self.bindings.get(button, {})
+
+    def _command(self, button, gesture, timestamp, active=True):
+        action = self._gestures(button).get(gesture)
+        return [ToolCommand(action, button, gesture, active, timestamp)] if action else []
+
+
+class ToolState:
+    """The selected tool, including tools that are only active while a button is down or held."""
+
+    def __init__(self, tool="pen"):
+        self.selected = tool
+        self.held = {}  # button -> tool held on it, in the order the holds began
+
+    @property
+    def tool(self):
+        return next(reversed(self.held.values()), self.selected)
+
+    def apply(self, command):
+        """Applies a command; returns the tool now in effect."""
+        if command.action in TOOLS:
+            if command.gesture not in ("hold", "down"):
+                self.selected = command.action
+            elif command.active:
+                self.held[command.button] = command.action
+            else:
+                self.held.pop(command.button, None)
+        return self.tool
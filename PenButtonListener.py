@@ -1,32 +1,65 @@
+import select
+import time
+
 import evdev
 from PySide6.QtCore import QThread, Signal
 
+from PenBindings import ButtonRecognizer, load_bindings
+
 class PenButtonListener(QThread):
     button_pressed = Signal(tuple)
+    # Gestures are recognized here, next to the device, so the GUI thread
+    # only receives finished PenBindings.ToolCommands
+    command_ready = Signal(object)
+
+    POLL_INTERVAL = 0.1  # seconds between checks of self.running when idle
 
-    def __init__(self, parent=None):
+    def __init__(self, bindings=None, parent=None):
         super().__init__(parent)
         self.running = True
+        self.recognizer = ButtonRecognizer(bindings if bindings is not None else load_bindings())
+        self.pending_bindings = None
         self.device_path = self.find_pen_device()
 
     def find_pen_device(self):
         devices = [evdev.InputDevice(path) for path in evdev.list_devices()]
-        print(evdev.list_devices())
         for device in devices:
-            print(device.name)
             if "Pen" in device.name:  # Adjust this based on `evtest` output
                 return device.path
         return None
 
+    def set_bindings(self, bindings):
+        """Replaces the bindings; picked up by the listener thread before its next event."""
+        self.pending_bindings = bindings
+
     def run(self):
         if not self.device_path:
             self.button_pressed.emit((-1, -1))
             return
 
         device = evdev.InputDevice(self.device_path)
-        for event in device.read_loop():
-            if event.type == evdev.ecodes.EV_KEY:
-                self.button_pressed.emit((event.value, event.code))
+        while self.running:
+            if self.pending_bindings is not None:
+                bindings, self.pending_bindings = self.pending_bindings, None
+                self.recognizer.set_bindings(bindings)
+
+            # Sleep until the device has input or a press/hold decision is due.
+            # evdev timestamps use the wall clock, so deadlines do too
+            deadline = self.recognizer.next_deadline()
+            timeout = self.POLL_INTERVAL if deadline is None else min(self.POLL_INTERVAL, max(0.0, deadline - time.time()))
+            readable, _, _ = select.select([device.fd], [], [], timeout)
+
+            commands = []
+            if readable:
+                for event in device.read():
+                    if event.type == evdev.ecodes.EV_KEY:
+                        self.button_pressed.emit((event.value, event.code))
+                        commands += self.recognizer.feed(event.code, event.value, event.timestamp())
+            commands += self.recognizer.poll(time.time())
+            for command in commands:
+                self.command_ready.emit(command)
+        device.close()
 
     def stop(self):
-        self.running = False
\ No newline at end of file
+        self.running = False
+        self.wait()
@@ -1,12 +1,12 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QGridLayout, QLabel, QComboBox
 
+import PenBindings
 from PenButtonListener import PenButtonListener
 
 
 class PenControlApp(QWidget):
     def __init__(self):
         super().__init__()
-        self.init_ui()
         self.event_codes = {
             320: "BTN_TOOL_PEN",
             321: "BTN_TOOL_RUBBER",
@@ -14,25 +14,62 @@ class PenControlApp(QWidget):
             331: "BTN_STYLUS",
             332: "BTN_STYLUS2"
         }
-        self.listener = PenButtonListener()
+        self.bindings = PenBindings.load_bindings()
+        self.tool_state = PenBindings.ToolState()
+        self.init_ui()
+        self.listener = PenButtonListener(self.bindings)
         self.listener.button_pressed.connect(self.on_button_pressed)
+        self.listener.command_ready.connect(self.on_command)
         self.listener.start()
 
     def init_ui(self):
         self.setWindowTitle("Lenovo Pen Button Assign")
-        self.setGeometry(100, 100, 300, 200)
+        self.setGeometry(100, 100, 460, 240)
         self.layout = QVBoxLayout()
 
         self.label = QLabel("Press your pen button.")
         self.layout.addWidget(self.label)
+        self.tool_label = QLabel(f"Tool: {self.tool_state.tool}")
+        self.layout.addWidget(self.tool_label)
+
+        # One row per button, one column per gesture
+        grid = QGridLayout()
+        for column, gesture in enumerate(PenBindings.GESTURES, start=1):
+            grid.addWidget(QLabel(gesture.replace("_", " ").capitalize()), 0, column)
+        for row, button in enumerate(PenBindings.BUTTONS.values(), start=1):
+            grid.addWidget(QLabel(button), row, 0)
+            for column, gesture in enumerate(PenBindings.GESTURES, start=1):
+                combo = QComboBox()
+                combo.addItems(("",) + PenBindings.ACTIONS)
+                combo.setCurrentText(self.bindings.get(button, {}).get(gesture, ""))
+                combo.currentTextChanged.connect(
+                    lambda action, button=button, gesture=gesture: self.set_binding(button, gesture, action))
+                grid.addWidget(combo, row, column)
+        self.layout.addLayout(grid)
 
         self.setLayout(self.layout)
 
+    def set_binding(self, button, gesture, action):
+        gestures = self.bindings.setdefault(button, {})
+        if action:
+            gestures[gesture] = action
+        else:
+            gestures.pop(gesture, None)
+        PenBindings.save_bindings(self.bindings)
+        self.listener.set_bindings({b: dict(g) for b, g in self.bindings.items()})
+
     def on_button_pressed(self, info):
+        if info == (-1, -1):
+            self.label.setText("No pen found.")
+            return
         info = info[0], self.event_codes.get(info[1])
-        print(info)
         self.label.setText(str(info))
 
+    def on_command(self, command):
+        """Shows the tool a recognized gesture selects; the notebook window applies the same commands."""
+        tool = self.tool_state.apply(command)
+        self.tool_label.setText(f"Tool: {tool}  ({command.button} {command.gesture} → {command.action})")
+
     def closeEvent(self, event):
         self.listener.stop()
         event.accept()
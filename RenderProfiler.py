@@ -0,0 +1,132 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+
+class RenderProfiler:
+    """Times painting and input handling and writes them as a Chrome trace.
+
+    Enabled by setting the PYNOTE_PROFILE_RENDER environment variable to the
+    path the trace should be written to on exit (or to 1 for
+    render-trace.json); open it in chrome://tracing or Perfetto. When
+    disabled, traced() returns functions unchanged and traced_item() item
+    classes unchanged, so instrumented code runs at full speed.
+
+    Spans go into a fixed-size ring buffer, so a long session keeps only its
+    most recent events. Each frame also records how many items of each type it
+    painted, and per-function call counts and total times are kept for the
+    whole session.
+    """
+
+    def __init__(self, enabled=None, path=None, capacity=200_000):
+        setting = os.environ.get("PYNOTE_PROFILE_RENDER", "")
+        if enabled is None:
+            enabled = bool(setting)
+        self.enabled = enabled
+        self.path = path or (setting if setting not in ("", "1") else "render-trace.json")
+        self.events = [None] * capacity  # (name, category, start, duration, thread) or a frame's counts
+        self.next = 0
+        self.wrapped = False
+        self.stats = {}  # name -> [calls, total seconds]
+        self.frame_items = {}  # item type -> items painted in the current frame
+        self.frame_depth = 0
+        self.origin = time.perf_counter()
+        if enabled:
+            atexit.register(self.dump)
+
+    def traced(self, category, name=None, frame=False, item=False):
+        """Decorates a function to be recorded as a span.
+
+        frame marks a top-level paint: item counts are collected per frame.
+        item marks an item's paint method: calls count as items painted.
+        """
+        def decorate(function):
+            if not self.enabled:
+                return function
+            label = name or function.__qualname__
+            stats = self.stats.setdefault(label, [0, 0.0])
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if frame:
+                    if self.frame_depth == 0:
+                        self.frame_items = {}
+                    self.frame_depth += 1
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    end = time.perf_counter()
+                    stats[0] += 1
+                    stats[1] += end - start
+                    self._push((label, category, start, end - start, threading.get_ident()))
+                    if item:
+                        self.frame_items[label] = self.frame_items.get(label, 0) + 1
+                    if frame:
+                        self.frame_depth -= 1
+                        if self.frame_depth == 0:
+                            self._push(("items painted", dict(self.frame_items), end))
+            return wrapper
+        return decorate
+
+    def traced_item(self, item_class, name=None):
+        """Returns item_class, or while enabled a subclass whose paint calls are recorded as items.
+
+        A Python paint() override sends every paint of every such item through
+        the interpreter, so plain Qt item classes only get one when profiling.
+        """
+        if not self.enabled:
+            return item_class
+        record = self.traced("item", name=name or f"{item_class.__name__}.paint", item=True)
+
+        class TracedItem(item_class):
+            @record
+            def paint(self, painter, option, widget=None):
+                item_class.paint(self, painter, option, widget)
+
+        TracedItem.__name__ = TracedItem.__qualname__ = f"Traced{item_class.__name__}"
+        return TracedItem
+
+    def count_items(self, kind, count=1):
+        """Adds to the items painted this frame, for items drawn without their own paint method."""
+        if self.enabled and count:
+            self.frame_items[kind] = self.frame_items.get(kind, 0) + count
+
+    def summary(self):
+        lines = ["Render profile:", f"  {'calls':>8}  {'total ms':>10}  {'mean ms':>8}  name"]
+        for name, (calls, total) in sorted(self.stats.items(), key=lambda s: -s[1][1]):
+            if calls:
+                lines.append(f"  {calls:8d}  {total * 1000:10.1f}  {total * 1000 / calls:8.3f}  {name}")
+        return "\n".join(lines)
+
+    def dump(self, path=None):
+        """Writes the buffered events as a Chrome trace (JSON object format)."""
+        pid = os.getpid()
+        events = self.events[self.next:] + self.events[:self.next] if self.wrapped else self.events[:self.next]
+        trace = []
+        for event in events:
+            if len(event) == 3:
+                name, counts, at = event
+                trace.append({"name": name, "ph": "C", "ts": (at - self.origin) * 1e6, "pid": pid,
+                              "args": counts})
+            else:
+                name, category, start, duration, thread = event
+                trace.append({"name": name, "cat": category, "ph": "X", "ts": (start - self.origin) * 1e6,
+                              "dur": duration * 1e6, "pid": pid, "tid": thread})
+        with open(path or self.path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+        print(self.summary())
+
+    def _push(self, event):
+        self.events[self.next] = event
+        self.next += 1
+        if self.next == len(self.events):
+            self.next = 0
+            self.wrapped = True
+
+
+profiler = RenderProfiler()
+traced = profiler.traced
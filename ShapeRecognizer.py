@@ -0,0 +1,214 @@
+"""Turns freehand strokes into clean shapes when the pen is lifted.
+
+Every candidate kind is fitted to the stroke and scored with a confidence in
+[0, 1] from its mean residual, relative to the size of the fitted shape. The
+best fit at or above THRESHOLD replaces the ink; anything less certain is kept
+as drawn. Fits start from one pass of running sums over the point columns
+(length-weighted means and covariance, which give the centre and the main
+axis) followed by a single residual pass per candidate, so recognition stays
+well inside a frame even for long strokes.
+
+Arrows are recognized when drawn in one go: the shaft, then the head
+doubling back from the tip.
+"""
+
+import math
+
+from PySide6.QtCore import QRectF
+from PySide6.QtGui import QPainterPath, QTransform
+
+from Stroke import Shape, arrow_head
+
+THRESHOLD = 0.75
+MIN_SIZE = 12.0  # strokes smaller than this are never recognized
+CLOSED_GAP = 0.2  # end-to-start gap, as a fraction of the path length, up to which a stroke is closed
+LINE_TOLERANCE = 0.08  # mean residual, as a fraction of the length, at which a line scores 0
+CLOSED_TOLERANCE = 0.25  # mean residual, as a fraction of the half short side, at which a closed shape scores 0
+SNAP_ANGLE = math.radians(8)  # fitted rotations this close to the axes are snapped to them
+
+# Ribbon buttons to shape kinds
+TOOLS = {"Rectangle": "rect", "Circle": "ellipse", "Line": "line", "Arrow": "arrow"}
+
+
+def recognize(stroke, kinds=Shape.KINDS, threshold=THRESHOLD):
+    """Returns the best-fitting Shape for the stroke, or None if no fit is confident enough."""
+    best, best_confidence = None, threshold
+    for kind in kinds:
+        shape, confidence = fit(stroke, kind)
+        if shape is not None and confidence >= best_confidence:
+            best, best_confidence = shape, confidence
+    return best
+
+
+def fit(stroke, kind):
+    """Fits one kind of shape to the stroke; returns (shape, confidence) or (None, 0.0)."""
+    xs, ys = stroke.xs, stroke.ys
+    if len(xs) < 3:
+        return None, 0.0
+    if max(max(xs) - min(xs), max(ys) - min(ys)) < MIN_SIZE:
+        return None, 0.0
+    closed = math.hypot(xs[-1] - xs[0], ys[-1] - ys[0]) <= CLOSED_GAP * _path_length(xs, ys)
+    if kind == "line":
+        return (None, 0.0) if closed else _fit_line(xs, ys, stroke)
+    if kind == "arrow":
+        return (None, 0.0) if closed else _fit_arrow(xs, ys, stroke)
+    if kind == "rect":
+        return _fit_rect(xs, ys, stroke) if closed else (None, 0.0)
+    if kind == "ellipse":
+        return _fit_ellipse(xs, ys, stroke) if closed else (None, 0.0)
+    raise ValueError(f"Unknown shape kind {kind!r}")
+
+
+def shape_from_drag(kind, x1, y1, x2, y2, color=0xFF000000, width=3.0):
+    """Builds the shape a shape tool draws for a drag from (x1, y1) to (x2, y2)."""
+    if kind in ("line", "arrow"):
+        return Shape(kind, (x1, y1, x2, y2), color, width)
+    return Shape(kind, ((x1 + x2) / 2, (y1 + y2) / 2, abs(x2 - x1), abs(y2 - y1), 0.0), color, width)
+
+
+def painter_path(shape):
+    """Returns a QPainterPath drawing the shape, for stroking with the shape's pen."""
+    path = QPainterPath()
+    if shape.kind in ("line", "arrow"):
+        x1, y1, x2, y2 = shape.params
+        path.moveTo(x1, y1)
+        path.lineTo(x2, y2)
+        if shape.kind == "arrow":
+            left, tip, right = arrow_head(x1, y1, x2, y2, shape.width)
+            path.moveTo(*left)
+            path.lineTo(*tip)
+            path.lineTo(*right)
+        return path
+    cx, cy, w, h, angle = shape.params
+    rect = QRectF(-w / 2, -h / 2, w, h)
+    if shape.kind == "rect":
+        path.addRect(rect)
+    else:
+        path.addEllipse(rect)
+    transform = QTransform()
+    transform.translate(cx, cy)
+    transform.rotateRadians(angle)
+    return transform.map(path)
+
+
+def _path_length(xs, ys):
+    return sum(math.hypot(xs[i + 1] - xs[i], ys[i + 1] - ys[i]) for i in range(len(xs) - 1))
+
+
+def _moments(xs, ys):
+    """Arc-length weighted centroid and principal angle of a polyline.
+
+    Weighting each segment's midpoint by its length makes the result
+    independent of how fast the pen moved.
+    """
+    sw = sx = sy = sxx = syy = sxy = 0.0
+    for i in range(len(xs) - 1):
+        w = math.hypot(xs[i + 1] - xs[i], ys[i + 1] - ys[i])
+        mx, my = (xs[i] + xs[i + 1]) / 2, (ys[i] + ys[i + 1]) / 2
+        sw += w
+        sx += w * mx
+        sy += w * my
+        sxx += w * mx * mx
+        syy += w * my * my
+        sxy += w * mx * my
+    if sw == 0:
+        return xs[0], ys[0], 0.0
+    cx, cy = sx / sw, sy / sw
+    vxx, vyy, vxy = sxx / sw - cx * cx, syy / sw - cy * cy, sxy / sw - cx * cy
+    return cx, cy, 0.5 * math.atan2(2 * vxy, vxx - vyy)
+
+
+def _rotate(xs, ys, cx, cy, angle):
+    """Returns the points in a frame centred on (cx, cy) and rotated by -angle."""
+    cos, sin = math.cos(angle), math.sin(angle)
+    us = [(x - cx) * cos + (y - cy) * sin for x, y in zip(xs, ys)]
+    vs = [(y - cy) * cos - (x - cx) * sin for x, y in zip(xs, ys)]
+    return us, vs
+
+
+def _snap(angle):
+    """Normalizes a rotation of a symmetric shape to (-pi/4, pi/4] and snaps it to the axes."""
+    angle = (angle + math.pi / 4) % (math.pi / 2) - math.pi / 4
+    return 0.0 if abs(angle) < SNAP_ANGLE else angle
+
+
+def _confidence(error, scale, tolerance):
+    if scale <= 0:
+        return 0.0
+    return max(0.0, 1.0 - error / (tolerance * scale))
+
+
+def _fit_line(xs, ys, stroke):
+    cx, cy, angle = _moments(xs, ys)
+    us, vs = _rotate(xs, ys, cx, cy, angle)
+    u0, u1 = min(us), max(us)
+    length = u1 - u0
+    # Orient the line the way it was drawn
+    if us[0] > us[-1]:
+        u0, u1 = u1, u0
+    cos, sin = math.cos(angle), math.sin(angle)
+    params = (cx + u0 * cos, cy + u0 * sin, cx + u1 * cos, cy + u1 * sin)
+    error = sum(abs(v) for v in vs) / len(vs)
+    return Shape("line", params, stroke.color, stroke.width), _confidence(error, length, LINE_TOLERANCE)
+
+
+def _fit_arrow(xs, ys, stroke):
+    # The tip is where the stroke first gets (about) as far from its start as
+    # it ever does; a head drawn as a V comes back to it later
+    distances = [math.hypot(x - xs[0], y - ys[0]) for x, y in zip(xs, ys)]
+    farthest = max(distances)
+    tip = next(i for i, d in enumerate(distances) if d >= 0.98 * farthest)
+    while tip + 1 < len(xs) and distances[tip + 1] >= distances[tip]:
+        tip += 1
+    if tip < 2 or len(xs) - tip < 3:
+        return None, 0.0
+    shaft, confidence = _fit_line(xs[:tip + 1], ys[:tip + 1], stroke)
+    x1, y1, x2, y2 = shaft.params
+    length = math.hypot(x2 - x1, y2 - y1)
+    if length == 0:
+        return None, 0.0
+
+    # The head must double back from the tip and be short next to the shaft
+    ux, uy = (x2 - x1) / length, (y2 - y1) / length
+    head = range(tip, len(xs))
+    reach = max(math.hypot(xs[i] - xs[tip], ys[i] - ys[tip]) for i in head)
+    back = sum((xs[i] - xs[tip]) * ux + (ys[i] - ys[tip]) * uy for i in head) / len(head)
+    if not 0.08 * length <= reach <= 0.5 * length or back > -0.3 * reach:
+        return None, 0.0
+    return Shape("arrow", (x1, y1, xs[tip], ys[tip]), stroke.color, stroke.width), confidence
+
+
+def _box_fit(xs, ys, cx, cy, angle):
+    """Fits a box rotated by angle; returns (centre x, centre y, width, height, mean residual)."""
+    us, vs = _rotate(xs, ys, cx, cy, angle)
+    u0, u1, v0, v1 = min(us), max(us), min(vs), max(vs)
+    error = sum(min(abs(u - u0), abs(u - u1), abs(v - v0), abs(v - v1)) for u, v in zip(us, vs)) / len(us)
+    cos, sin = math.cos(angle), math.sin(angle)
+    mu, mv = (u0 + u1) / 2, (v0 + v1) / 2
+    return cx + mu * cos - mv * sin, cy + mu * sin + mv * cos, u1 - u0, v1 - v0, error
+
+
+def _fit_rect(xs, ys, stroke):
+    cx, cy, angle = _moments(xs, ys)
+    # The principal axis of a near-square is arbitrary, so also try the page axes
+    angles = [_snap(angle)] + ([0.0] if _snap(angle) else [])
+    (bx, by, w, h, error), angle = min(((_box_fit(xs, ys, cx, cy, a), a) for a in angles),
+                                       key=lambda fit: fit[0][4])
+    confidence = _confidence(error, min(w, h) / 2, CLOSED_TOLERANCE)
+    return Shape("rect", (bx, by, w, h, angle), stroke.color, stroke.width), confidence
+
+
+def _fit_ellipse(xs, ys, stroke):
+    cx, cy, angle = _moments(xs, ys)
+    angle = _snap(angle)
+    us, vs = _rotate(xs, ys, cx, cy, angle)
+    u0, u1, v0, v1 = min(us), max(us), min(vs), max(vs)
+    rx, ry = (u1 - u0) / 2, (v1 - v0) / 2
+    if rx <= 0 or ry <= 0:
+        return None, 0.0
+    mu, mv = (u0 + u1) / 2, (v0 + v1) / 2
+    # Radial residual in units of the radius at that point
+    error = sum(abs(math.hypot((u - mu) / rx, (v - mv) / ry) - 1) for u, v in zip(us, vs)) / len(us)
+    cos, sin = math.cos(angle), math.sin(angle)
+    params = (cx + mu * cos - mv * sin, cy + mu * sin + mv * cos, 2 * rx, 2 * ry, angle)
+    return Shape("ellipse", params, stroke.color, stroke.width), _confidence(error, 1.0, CLOSED_TOLERANCE)
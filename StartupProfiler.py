@@ -0,0 +1,73 @@
+import os
+import time
+from contextlib import contextmanager
+
+from PySide6.QtCore import QObject, QEvent
+
+
+class StartupProfiler(QObject):
+    """Records named startup phases and reports the time-to-first-frame breakdown.
+
+    Enabled by setting the PYNOTE_PROFILE_STARTUP environment variable. When
+    disabled, phase() and mark() are cheap no-ops so the calls can stay in place.
+    The report is printed by finish(), once the work deferred past the first
+    frame is done too, so it covers both sides of the first frame.
+    """
+
+    def __init__(self, enabled=None, parent=None):
+        super().__init__(parent)
+        if enabled is None:
+            enabled = bool(os.environ.get("PYNOTE_PROFILE_STARTUP"))
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.phases = []  # (name, start offset, duration) in seconds
+        self.first_frame = None
+        self.finished = False
+        self._window = None
+
+    @contextmanager
+    def phase(self, name):
+        """Times the enclosed block as one named phase."""
+        if not self.enabled:
+            yield
+            return
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.phases.append((name, begin - self.start, end - begin))
+
+    def mark(self, name):
+        """Records an instantaneous event (e.g. a deferred build finishing)."""
+        if self.enabled:
+            self.phases.append((name, time.perf_counter() - self.start, 0.0))
+
+    def watch(self, window):
+        """Reports once the given window has painted its first frame."""
+        if not self.enabled:
+            return
+        self._window = window
+        window.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if obj is self._window and event.type() == QEvent.Type.Paint and self.first_frame is None:
+            self.first_frame = time.perf_counter() - self.start
+            obj.removeEventFilter(self)
+        return False
+
+    def finish(self):
+        """Prints the report; called when the startup work deferred past the first frame is done."""
+        if self.enabled and not self.finished:
+            self.finished = True
+            print(self.report())
+
+    def report(self):
+        """Returns the recorded phases as a human readable table."""
+        lines = ["Startup profile:"]
+        events = [(offset, f"{duration * 1000:8.1f} ms", name) for name, offset, duration in self.phases]
+        if self.first_frame is not None:
+            events.append((self.first_frame, f"{'':>11}", "first frame"))
+        for offset, duration, name in sorted(events, key=lambda e: e[0]):
+            lines.append(f"  {offset * 1000:8.1f} ms  {duration}  {name}")
+        return "\n".join(lines)
@@ -0,0 +1,140 @@
+import math
+from array import array
+
+
+class Stroke:
+    """A freehand pen stroke stored as flat coordinate columns.
+
+    Kept free of Qt types so strokes can be encoded, synced and rendered in
+    worker processes without a QApplication.
+    """
+
+    __slots__ = ("xs", "ys", "pressures", "color", "width")
+
+    def __init__(self, xs=None, ys=None, pressures=None, color=0xFF000000, width=3.0):
+        self.xs = array("f", xs or ())
+        self.ys = array("f", ys or ())
+        self.pressures = array("f", pressures or ())
+        self.color = color  # 0xAARRGGBB
+        self.width = width
+
+    @classmethod
+    def from_points(cls, points, color=0xFF000000, width=3.0):
+        """Builds a stroke from (x, y) or (x, y, pressure) tuples."""
+        stroke = cls(color=color, width=width)
+        for point in points:
+            stroke.add_point(*point)
+        return stroke
+
+    def add_point(self, x, y, pressure=1.0):
+        self.xs.append(x)
+        self.ys.append(y)
+        self.pressures.append(pressure)
+
+    def __len__(self):
+        return len(self.xs)
+
+    def points(self):
+        return list(zip(self.xs, self.ys))
+
+    def bounding_rect(self):
+        """Returns (left, top, right, bottom), grown by half the pen width."""
+        if not self.xs:
+            return (0.0, 0.0, 0.0, 0.0)
+        half = self.width / 2
+        return (min(self.xs) - half, min(self.ys) - half, max(self.xs) + half, max(self.ys) + half)
+
+    def copy(self):
+        stroke = Stroke(color=self.color, width=self.width)
+        stroke.xs, stroke.ys, stroke.pressures = array("f", self.xs), array("f", self.ys), array("f", self.pressures)
+        return stroke
+
+    def translate(self, dx, dy):
+        self.xs = array("f", (x + dx for x in self.xs))
+        self.ys = array("f", (y + dy for y in self.ys))
+
+    def __eq__(self, other):
+        return (isinstance(other, Stroke) and self.xs == other.xs and self.ys == other.ys
+                and self.pressures == other.pressures and self.color == other.color
+                and self.width == other.width)
+
+
+class Shape:
+    """A parametric primitive that replaces a recognized freehand stroke.
+
+    params by kind:
+        line, arrow:    (x1, y1, x2, y2); an arrow points at (x2, y2)
+        rect, ellipse:  (cx, cy, width, height, angle in radians)
+    """
+
+    KINDS = ("line", "arrow", "rect", "ellipse")
+    __slots__ = ("kind", "params", "color", "width")
+
+    def __init__(self, kind, params, color=0xFF000000, width=3.0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown shape kind {kind!r}")
+        self.kind = kind
+        self.params = tuple(float(p) for p in params)
+        self.color = color
+        self.width = width
+
+    def outline(self, segments=64):
+        """Returns the shape as lists of (x, y) polylines, e.g. for exporters."""
+        if self.kind == "line":
+            x1, y1, x2, y2 = self.params
+            return [[(x1, y1), (x2, y2)]]
+        if self.kind == "arrow":
+            x1, y1, x2, y2 = self.params
+            return [[(x1, y1), (x2, y2)], arrow_head(x1, y1, x2, y2, self.width)]
+        cx, cy, w, h, angle = self.params
+        cos, sin = math.cos(angle), math.sin(angle)
+        if self.kind == "rect":
+            local = [(-w / 2, -h / 2), (w / 2, -h / 2), (w / 2, h / 2), (-w / 2, h / 2), (-w / 2, -h / 2)]
+        else:
+            local = [(w / 2 * math.cos(t), h / 2 * math.sin(t))
+                     for t in (2 * math.pi * i / segments for i in range(segments + 1))]
+        return [[(cx + x * cos - y * sin, cy + x * sin + y * cos) for x, y in local]]
+
+    def to_strokes(self):
+        return [Stroke.from_points(line, self.color, self.width) for line in self.outline()]
+
+    def bounding_rect(self):
+        points = [p for line in self.outline() for p in line]
+        half = self.width / 2
+        return (min(x for x, _ in points) - half, min(y for _, y in points) - half,
+                max(x for x, _ in points) + half, max(y for _, y in points) + half)
+
+    def translate(self, dx, dy):
+        p = list(self.params)
+        p[0] += dx
+        p[1] += dy
+        if self.kind in ("line", "arrow"):
+            p[2] += dx
+            p[3] += dy
+        self.params = tuple(p)
+
+    def copy(self):
+        return Shape(self.kind, self.params, self.color, self.width)
+
+    def to_dict(self):
+        return {"kind": self.kind, "params": list(self.params), "color": self.color, "width": self.width}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["kind"], data["params"], data["color"], data["width"])
+
+    def __eq__(self, other):
+        return isinstance(other, Shape) and self.to_dict() == other.to_dict()
+
+
+def arrow_head(x1, y1, x2, y2, pen_width=3.0):
+    """Returns the polyline of an arrow head at (x2, y2) for a shaft from (x1, y1)."""
+    length = math.hypot(x2 - x1, y2 - y1) or 1.0
+    size = min(length / 3, max(10.0, pen_width * 4))
+    ux, uy = (x2 - x1) / length, (y2 - y1) / length
+    spread = math.radians(28)
+    left = (x2 - size * (ux * math.cos(spread) - uy * math.sin(spread)),
+            y2 - size * (uy * math.cos(spread) + ux * math.sin(spread)))
+    right = (x2 - size * (ux * math.cos(spread) + uy * math.sin(spread)),
+             y2 - size * (uy * math.cos(spread) - ux * math.sin(spread)))
+    return [left, (x2, y2), right]
@@ -0,0 +1,345 @@
+"""Conflict-free operation log for syncing a page between devices.
+
+Every change to a page is an Operation stamped with the device that made it,
+a per-device sequence number and a Lamport clock. All operations commute:
+
+- add: creates a stroke whose id is the (device, seq) of the add
+- shape: like add, for a parametric Shape (a recognized rectangle, line...)
+- erase: tombstones a stroke or shape; erasing wins over any add or move
+- move: translates a stroke or shape; offsets are integers in codec units and are
+  summed, so order doesn't matter
+- text: sets a text block; the highest (lamport, device) wins
+- noop: takes the place of an operation compact() found no longer affects
+  the page, so every device's sequence numbers stay contiguous
+
+so replicas that have applied the same set of operations show the same page,
+whatever order the operations arrived in. A replica's version vector (the
+highest seq it has seen from each device) is enough to work out which
+operations a peer is missing, so a sync only touches the delta.
+"""
+
+import json
+import os
+import socket
+import struct
+import time
+from collections import namedtuple
+
+from Stroke import Shape
+from StrokeCodec import XY_SCALE, encode_strokes, decode_strokes
+
+Operation = namedtuple("Operation", "device seq lamport kind target data")
+
+ADD, SHAPE, ERASE, MOVE, TEXT, NOOP = "add", "shape", "erase", "move", "text", "noop"
+
+_FRAME = struct.Struct("<I")
+
+
+class PageReplica:
+    """One device's copy of a page, built from its operation log.
+
+    device_id must be a string that is unique per machine.
+    """
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.clock = 0  # Lamport clock
+        self.log = {}  # device -> list of its operations, index = seq - 1
+        self.pending = {}  # (device, seq) -> operation that arrived before its predecessor
+
+        self._strokes = {}
+        self._shapes = {}
+        self._offsets = {}
+        self._erased = set()
+        self._texts = {}  # block id -> (lamport, device, text)
+
+    # Local edits
+
+    def add_stroke(self, stroke):
+        """Adds a stroke and returns its id."""
+        # Store the stroke exactly as peers will decode it, so every replica
+        # holds identical coordinates
+        stroke = decode_strokes(encode_strokes([stroke], compress=False)).stroke(0)
+        op = self._local(ADD, None, stroke)
+        return (op.device, op.seq)
+
+    def add_shape(self, shape):
+        """Adds a parametric shape and returns its id; erase/move take it like a stroke id."""
+        op = self._local(SHAPE, None, Shape.from_dict(shape.to_dict()))
+        return (op.device, op.seq)
+
+    def erase_stroke(self, stroke_id):
+        self._local(ERASE, tuple(stroke_id), None)
+
+    def move_stroke(self, stroke_id, dx, dy):
+        self._local(MOVE, tuple(stroke_id), (round(dx * XY_SCALE), round(dy * XY_SCALE)))
+
+    def set_text(self, block_id, text):
+        self._local(TEXT, block_id, text)
+
+    # Page state
+
+    def stroke_ids(self):
+        return [sid for sid in self._strokes if sid not in self._erased]
+
+    def stroke(self, stroke_id):
+        """Returns the stroke with all moves applied, or None if it was erased."""
+        if stroke_id in self._erased or stroke_id not in self._strokes:
+            return None
+        stroke = self._strokes[stroke_id]
+        dx, dy = self._offsets.get(stroke_id, (0, 0))
+        if dx or dy:
+            stroke = stroke.copy()
+            stroke.translate(dx / XY_SCALE, dy / XY_SCALE)
+        return stroke
+
+    def strokes(self):
+        return {sid: self.stroke(sid) for sid in self.stroke_ids()}
+
+    def shape_ids(self):
+        return [sid for sid in self._shapes if sid not in self._erased]
+
+    def shape(self, shape_id):
+        """Returns the shape with all moves applied, or None if it was erased."""
+        if shape_id in self._erased or shape_id not in self._shapes:
+            return None
+        shape = self._shapes[shape_id]
+        dx, dy = self._offsets.get(shape_id, (0, 0))
+        if dx or dy:
+            shape = shape.copy()
+            shape.translate(dx / XY_SCALE, dy / XY_SCALE)
+        return shape
+
+    def shapes(self):
+        return {sid: self.shape(sid) for sid in self.shape_ids()}
+
+    def texts(self):
+        return {block: text for block, (_, _, text) in self._texts.items()}
+
+    # Sync
+
+    def version_vector(self):
+        return {device: len(ops) for device, ops in self.log.items()}
+
+    def ops_since(self, version_vector):
+        """Returns the operations a replica with the given version vector is missing."""
+        missing = []
+        for device, ops in self.log.items():
+            missing.extend(ops[version_vector.get(device, 0):])
+        return missing
+
+    def apply(self, ops):
+        """Merges remote operations; returns how many were new.
+
+        Costs time proportional to the number of operations given, not to
+        the size of the page.
+        """
+        applied = 0
+        for op in ops:
+            if op.seq <= len(self.log.get(op.device, ())):
+                continue
+            self.pending[(op.device, op.seq)] = op
+            # Operations from one device are applied in sequence order
+            while True:
+                nxt = self.pending.pop((op.device, len(self.log.get(op.device, ())) + 1), None)
+                if nxt is None:
+                    break
+                self._append(nxt)
+                applied += 1
+        return applied
+
+    def compact(self):
+        """Turns operations that no longer affect the page into noops; returns how many.
+
+        That drops the strokes and shapes of erased adds, moves of erased
+        items, repeated erases and superseded text. One erase per item stays
+        as its tombstone, since a peer may still have the item, and every
+        operation keeps its seq, so version vectors and syncs are unaffected.
+        """
+        latest = {block: (lamport, device) for block, (lamport, device, _) in self._texts.items()}
+        tombstones = set()
+        folded = 0
+        for ops in self.log.values():
+            for i, op in enumerate(ops):
+                if op.kind in (ADD, SHAPE):
+                    dead = (op.device, op.seq) in self._erased
+                elif op.kind == MOVE:
+                    dead = op.target in self._erased
+                elif op.kind == ERASE:
+                    dead = op.target in tombstones
+                    tombstones.add(op.target)
+                elif op.kind == TEXT:
+                    dead = (op.lamport, op.device) != latest[op.target]
+                else:
+                    dead = False
+                if dead:
+                    ops[i] = op._replace(kind=NOOP, target=None, data=None)
+                    folded += 1
+        for item_id in self._erased:
+            self._strokes.pop(item_id, None)
+            self._shapes.pop(item_id, None)
+            self._offsets.pop(item_id, None)
+        return folded
+
+    def save(self, path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(encode_ops(self.ops_since({})))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path, device_id):
+        replica = cls(device_id)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                replica.apply(decode_ops(f.read()))
+        return replica
+
+    def _local(self, kind, target, data):
+        op = Operation(self.device_id, len(self.log.get(self.device_id, ())) + 1,
+                       self.clock + 1, kind, target, data)
+        self._append(op)
+        return op
+
+    def _append(self, op):
+        self.log.setdefault(op.device, []).append(op)
+        self.clock = max(self.clock, op.lamport)
+
+        if op.kind == ADD:
+            self._strokes[(op.device, op.seq)] = op.data
+        elif op.kind == SHAPE:
+            self._shapes[(op.device, op.seq)] = op.data
+        elif op.kind == ERASE:
+            self._erased.add(op.target)
+        elif op.kind == MOVE:
+            dx, dy = self._offsets.get(op.target, (0, 0))
+            self._offsets[op.target] = (dx + op.data[0], dy + op.data[1])
+        elif op.kind == TEXT:
+            current = self._texts.get(op.target)
+            if current is None or (op.lamport, op.device) > current[:2]:
+                self._texts[op.target] = (op.lamport, op.device, op.data)
+        elif op.kind != NOOP:
+            raise ValueError(f"Unknown operation kind {op.kind!r}")
+
+
+def encode_ops(ops):
+    """Serializes operations; the strokes of all adds go into one StrokeCodec batch."""
+    strokes, meta = [], []
+    for op in ops:
+        data = op.data
+        if op.kind == ADD:
+            strokes.append(op.data)
+            data = None
+        elif op.kind == SHAPE:
+            data = op.data.to_dict()
+        meta.append([op.device, op.seq, op.lamport, op.kind, op.target, data])
+    header = json.dumps(meta).encode("utf-8")
+    return _FRAME.pack(len(header)) + header + encode_strokes(strokes)
+
+
+def decode_ops(data):
+    (length,) = _FRAME.unpack_from(data, 0)
+    meta = json.loads(bytes(data[_FRAME.size:_FRAME.size + length]))
+    batch = decode_strokes(data[_FRAME.size + length:])
+    ops, next_stroke = [], 0
+    for device, seq, lamport, kind, target, payload in meta:
+        if kind == ADD:
+            payload = batch.stroke(next_stroke)
+            next_stroke += 1
+        elif kind == SHAPE:
+            payload = Shape.from_dict(payload)
+        elif kind == MOVE:
+            payload = tuple(payload)
+        if isinstance(target, list):
+            target = tuple(target)
+        ops.append(Operation(device, seq, lamport, kind, target, payload))
+    return ops
+
+
+def sync(replica, transport, initiator):
+    """Exchanges missing operations with the replica on the other end of the transport.
+
+    Exactly one side must be the initiator. Returns the number of operations
+    received.
+    """
+    if initiator:
+        transport.send(json.dumps(replica.version_vector()).encode("utf-8"))
+        message = transport.recv()
+        (length,) = _FRAME.unpack_from(message, 0)
+        peer_vector = json.loads(bytes(message[_FRAME.size:_FRAME.size + length]))
+        # Work out what the peer lacks before merging, so its own operations aren't echoed back
+        outgoing = replica.ops_since(peer_vector)
+        received = replica.apply(decode_ops(message[_FRAME.size + length:]))
+        transport.send(encode_ops(outgoing))
+    else:
+        peer_vector = json.loads(transport.recv())
+        vector = json.dumps(replica.version_vector()).encode("utf-8")
+        transport.send(_FRAME.pack(len(vector)) + vector + encode_ops(replica.ops_since(peer_vector)))
+        received = replica.apply(decode_ops(transport.recv()))
+    return received
+
+
+class SocketTransport:
+    """Length-prefixed messages over a connected socket."""
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    @classmethod
+    def connect(cls, host, port, timeout=10.0):
+        return cls(socket.create_connection((host, port), timeout=timeout))
+
+    def send(self, message):
+        self.sock.sendall(_FRAME.pack(len(message)) + message)
+
+    def recv(self):
+        (length,) = _FRAME.unpack(self._read(_FRAME.size))
+        return self._read(length)
+
+    def close(self):
+        self.sock.close()
+
+    def _read(self, size):
+        buf = bytearray()
+        while len(buf) < size:
+            chunk = self.sock.recv(size - len(buf))
+            if not chunk:
+                raise ConnectionError("Peer closed the connection during sync")
+            buf += chunk
+        return bytes(buf)
+
+
+class DirectoryTransport:
+    """Messages as files in a shared directory (e.g. a synced folder)."""
+
+    def __init__(self, path, local_id, remote_id, timeout=30.0, poll_interval=0.05):
+        self.path = path
+        self.local_id = local_id
+        self.remote_id = remote_id
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.sent = 0
+        self.received = 0
+        os.makedirs(path, exist_ok=True)
+
+    def send(self, message):
+        self.sent += 1
+        name = os.path.join(self.path, f"{self.local_id}-{self.remote_id}-{self.sent}.msg")
+        with open(name + ".tmp", "wb") as f:
+            f.write(message)
+        os.replace(name + ".tmp", name)
+
+    def recv(self):
+        self.received += 1
+        name = os.path.join(self.path, f"{self.remote_id}-{self.local_id}-{self.received}.msg")
+        deadline = time.monotonic() + self.timeout
+        while not os.path.exists(name):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No sync message from {self.remote_id}")
+            time.sleep(self.poll_interval)
+        with open(name, "rb") as f:
+            message = f.read()
+        os.remove(name)
+        return message
+
+    def close(self):
+        pass
@@ -0,0 +1,142 @@
+"""Tables on a page that stay fast with thousands of rows.
+
+A table shows at most VISIBLE_ROWS rows at a time and scrolls inside its
+frame; only the rows and columns in view are laid out and painted. Every
+cell's text width is measured once, when the text is set, and column widths
+come from those cached measurements, so an edit costs one measurement and
+repaints one row. Only when the widest cell of a column shrinks is that
+column's width recomputed, from the cached numbers rather than the text.
+"""
+
+from PySide6.QtCore import Qt, QRectF
+from PySide6.QtGui import QColor, QFontMetricsF, QPen
+
+ROW_HEIGHT = 26
+VISIBLE_ROWS = 20
+CELL_PADDING = 6
+MIN_COLUMN_WIDTH = 60
+MAX_COLUMN_WIDTH = 320
+
+
+class TableModel:
+    def __init__(self, columns, rows, font):
+        self.font = font
+        self.metrics = QFontMetricsF(font)
+        self.cells = [[""] * columns for _ in range(rows)]
+        self.text_widths = [[0.0] * columns for _ in range(rows)]
+        self.column_widths = [MIN_COLUMN_WIDTH] * columns
+        self.offsets = None  # x of each column's left edge, plus the right edge; None when stale
+
+    @property
+    def rows(self):
+        return len(self.cells)
+
+    @property
+    def columns(self):
+        return len(self.column_widths)
+
+    def text(self, row, column):
+        return self.cells[row][column]
+
+    def set_cell(self, row, column, text):
+        """Sets a cell's text; returns True if that changed a column width."""
+        old = self.text_widths[row][column]
+        new = self.metrics.horizontalAdvance(text)
+        self.cells[row][column] = text
+        self.text_widths[row][column] = new
+
+        width, current = _fit(new), self.column_widths[column]
+        if width > current:
+            return self._set_column_width(column, width)
+        if width < current and _fit(old) == current:
+            # The widest cell may just have shrunk
+            widest = max(widths[column] for widths in self.text_widths)
+            return self._set_column_width(column, _fit(widest))
+        return False
+
+    def insert_row(self, index):
+        self.cells.insert(index, [""] * self.columns)
+        self.text_widths.insert(index, [0.0] * self.columns)
+
+    def width(self):
+        return self.column_offsets()[-1]
+
+    def height(self):
+        return self.rows * ROW_HEIGHT
+
+    def column_offsets(self):
+        if self.offsets is None:
+            offsets, x = [0.0], 0.0
+            for width in self.column_widths:
+                x += width
+                offsets.append(x)
+            self.offsets = offsets
+        return self.offsets
+
+    def cell_at(self, x, y):
+        """Returns (row, column) at a point in table coordinates, or None."""
+        row = int(y // ROW_HEIGHT)
+        if x < 0 or not 0 <= row < self.rows:
+            return None
+        offsets = self.column_offsets()
+        for column in range(self.columns):
+            if x < offsets[column + 1]:
+                return row, column
+        return None
+
+    def cell_rect(self, row, column):
+        offsets = self.column_offsets()
+        return QRectF(offsets[column], row * ROW_HEIGHT, offsets[column + 1] - offsets[column], ROW_HEIGHT)
+
+    def _set_column_width(self, column, width):
+        if width == self.column_widths[column]:
+            return False
+        self.column_widths[column] = width
+        self.offsets = None
+        return True
+
+
+def _fit(text_width):
+    return min(MAX_COLUMN_WIDTH, max(MIN_COLUMN_WIDTH, text_width + 2 * CELL_PADDING))
+
+
+def frame_height(model):
+    return min(model.rows, VISIBLE_ROWS) * ROW_HEIGHT
+
+
+def paint_table(painter, model, frame, scroll, exposed):
+    """Draws the part of a table that is visible in frame, scrolled down by scroll pixels."""
+    visible = frame.intersected(QRectF(exposed))
+    if visible.isEmpty():
+        return
+    painter.save()
+    painter.setClipRect(visible)
+    painter.setFont(model.font)
+    painter.setBrush(Qt.NoBrush)
+
+    first_row = max(0, int((visible.top() - frame.top() + scroll) // ROW_HEIGHT))
+    last_row = min(model.rows - 1, int((visible.bottom() - frame.top() + scroll) // ROW_HEIGHT))
+    offsets = model.column_offsets()
+    left, right = visible.left() - frame.left(), visible.right() - frame.left()
+    columns = [c for c in range(model.columns) if offsets[c + 1] > left and offsets[c] < right]
+
+    grid = QPen(QColor(200, 200, 200))
+    for row in range(first_row, last_row + 1):
+        top = frame.top() + row * ROW_HEIGHT - scroll
+        for column in columns:
+            cell = QRectF(frame.left() + offsets[column], top, model.column_widths[column], ROW_HEIGHT)
+            painter.setPen(grid)
+            painter.drawRect(cell)
+            text = model.cells[row][column]
+            if text:
+                painter.setPen(Qt.black)
+                text_rect = cell.adjusted(CELL_PADDING, 0, -CELL_PADDING, 0)
+                painter.drawText(text_rect, Qt.AlignVCenter | Qt.AlignLeft,
+                                 model.metrics.elidedText(text, Qt.ElideRight, text_rect.width()))
+
+    # Scroll position indicator for tables taller than their frame
+    if model.height() > frame.height():
+        ratio = frame.height() / model.height()
+        thumb = QRectF(frame.right() - 4, frame.top() + scroll * ratio, 3, max(12.0, frame.height() * ratio))
+        painter.fillRect(thumb, QColor(0, 0, 0, 80))
+    painter.restore()
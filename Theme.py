@@ -0,0 +1,282 @@
+from functools import lru_cache
+from string import Template
+
+from PySide6.QtGui import QColor, QPalette
+from PySide6.QtWidgets import QApplication
+
+# Design tokens. Every color used by the UI comes from one of these tables.
+LIGHT = {
+    "accent": "#5C2D91",  # OneNote purple
+    "accent_text": "#FFFFFF",
+    "window": "#FFFFFF",
+    "panel": "#F5F5F5",
+    "surface": "#FFFFFF",
+    "control": "#F0F0F0",
+    "control_hover": "#E8E8E8",
+    "control_pressed": "#D8D8D8",
+    "border": "#DDDDDD",
+    "divider": "#E0E0E0",
+    "text": "#333333",
+    "muted": "#707070",
+    "hover": "#E1D5E7",  # Light purple
+    "selected": "#F3F0F5",  # Very light purple
+    "scroll_handle": "#CDCDCD",
+}
+
+DARK = {
+    "accent": "#9A6BD1",
+    "accent_text": "#FFFFFF",
+    "window": "#1E1E1E",
+    "panel": "#252526",
+    "surface": "#2D2D30",
+    "control": "#333337",
+    "control_hover": "#3E3E42",
+    "control_pressed": "#4A4A50",
+    "border": "#3F3F46",
+    "divider": "#3F3F46",
+    "text": "#E6E6E6",
+    "muted": "#A0A0A0",
+    "hover": "#3C2F4D",
+    "selected": "#4B3866",
+    "scroll_handle": "#5A5A5E",
+}
+
+THEMES = {"light": LIGHT, "dark": DARK}
+
+_STYLESHEET = Template("""
+    QMainWindow {
+        background-color: $window;
+    }
+    QWidget {
+        color: $text;
+    }
+    QSplitter::handle {
+        background-color: $control;
+    }
+    QTabWidget::pane {
+        border-top: 1px solid $border;
+        background-color: $panel;
+    }
+    QTabBar::tab {
+        background: $control;
+        color: $text;
+        border: 1px solid $border;
+        border-bottom: none;
+        min-width: 80px;
+        padding: 5px 10px;
+        margin-right: 2px;
+        border-top-left-radius: 4px;
+        border-top-right-radius: 4px;
+        font-weight: bold;
+    }
+    QTabBar::tab:selected {
+        background: $accent;
+        color: $accent_text;
+        border-color: $accent;
+    }
+    QScrollBar:vertical {
+        border: none;
+        background: $control;
+        width: 10px;
+        margin: 0px;
+    }
+    QScrollBar::handle:vertical {
+        background: $scroll_handle;
+        min-height: 20px;
+        border-radius: 5px;
+    }
+    QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {
+        height: 0px;
+    }
+    QLineEdit {
+        padding: 5px;
+        border: 1px solid $border;
+        border-radius: 4px;
+        background-color: $surface;
+    }
+    QComboBox {
+        border: 1px solid $border;
+        border-radius: 3px;
+        padding: 3px;
+    }
+    QPushButton {
+        background-color: $control;
+        border: 1px solid $border;
+        border-radius: 4px;
+        padding: 5px 10px;
+    }
+    QPushButton:hover {
+        background-color: $control_hover;
+    }
+    QPushButton:pressed {
+        background-color: $control_pressed;
+    }
+    QToolButton {
+        background: transparent;
+        border: 1px solid transparent;
+        padding: 5px;
+        border-radius: 4px;
+    }
+    QToolButton:hover {
+        background: $hover;
+        border: 1px solid $border;
+    }
+    QToolButton:pressed {
+        background: $selected;
+    }
+    QDockWidget {
+        titlebar-close-icon: url(none);
+        titlebar-normal-icon: url(none);
+        border: 1px solid $border;
+    }
+    QTreeWidget, QListWidget {
+        border: none;
+        background: $surface;
+        font-size: 12px;
+    }
+    QTreeWidget::item, QListWidget::item {
+        padding: 8px;
+        border-bottom: 1px solid $divider;
+    }
+    QTreeWidget::item:hover, QListWidget::item:hover {
+        background: $hover;
+    }
+    QTreeWidget::item:selected, QListWidget::item:selected {
+        background: $selected;
+        color: $text;
+        border-left: 4px solid $accent;
+    }
+    QTextEdit, QPlainTextEdit {
+        background: $surface;
+        border: none;
+        padding: 15px;
+        font-size: 14px;
+    }
+    QStatusBar {
+        background-color: $panel;
+        border-top: 1px solid $border;
+    }
+    RibbonButton {
+        background-color: transparent;
+        border: none;
+        border-radius: 4px;
+        padding: 5px;
+        text-align: bottom;
+        font-size: 11px;
+    }
+    RibbonButton:hover {
+        background-color: $hover;
+    }
+    RibbonButton:pressed {
+        background-color: $selected;
+    }
+    RibbonGroup {
+        background-color: transparent;
+        border: none;
+        border-right: 1px solid $divider;
+        padding-right: 8px;
+        margin-right: 2px;
+    }
+    #ribbonGroupTitle {
+        color: $muted;
+        font-size: 10px;
+    }
+    #fileTab {
+        background-color: $accent;
+    }
+    #fileButton {
+        color: $accent_text;
+        font-size: 14px;
+        background-color: transparent;
+        border: none;
+    }
+    #notebookPanel, #notebookPanel QTreeWidget {
+        background-color: $panel;
+    }
+    #searchBox {
+        padding: 8px;
+    }
+    #addPageButton {
+        background-color: $surface;
+        color: $accent;
+        border: 1px solid $divider;
+        padding: 8px;
+        font-weight: bold;
+        text-align: left;
+    }
+    #addPageButton:hover {
+        background-color: $panel;
+    }
+    #pageTitle {
+        font-size: 18px;
+        font-weight: bold;
+        color: $accent;
+        border: none;
+        background-color: transparent;
+    }
+    QLineEdit#pageTitle {
+        font-size: 24px;
+    }
+    QLineEdit#pageTitle:focus {
+        border-bottom: 1px solid $accent;
+    }
+    #pageDate {
+        font-size: 11px;
+        color: $muted;
+    }
+    Canvas {
+        background-color: white;
+        border: 1px solid $divider;
+        border-radius: 4px;
+    }
+    #canvasScrollArea {
+        border: none;
+        background-color: $control;
+    }
+""")
+
+
+@lru_cache(maxsize=None)
+def stylesheet(name):
+    """Returns the application stylesheet for a theme, built once per theme."""
+    return _STYLESHEET.substitute(THEMES[name])
+
+
+@lru_cache(maxsize=None)
+def palette(name):
+    """Returns a QPalette matching the theme for widgets the stylesheet doesn't cover."""
+    tokens = THEMES[name]
+    pal = QPalette()
+    pal.setColor(QPalette.ColorRole.Window, QColor(tokens["window"]))
+    pal.setColor(QPalette.ColorRole.WindowText, QColor(tokens["text"]))
+    pal.setColor(QPalette.ColorRole.Base, QColor(tokens["surface"]))
+    pal.setColor(QPalette.ColorRole.AlternateBase, QColor(tokens["panel"]))
+    pal.setColor(QPalette.ColorRole.Text, QColor(tokens["text"]))
+    pal.setColor(QPalette.ColorRole.PlaceholderText, QColor(tokens["muted"]))
+    pal.setColor(QPalette.ColorRole.Button, QColor(tokens["control"]))
+    pal.setColor(QPalette.ColorRole.ButtonText, QColor(tokens["text"]))
+    pal.setColor(QPalette.ColorRole.Highlight, QColor(tokens["accent"]))
+    pal.setColor(QPalette.ColorRole.HighlightedText, QColor(tokens["accent_text"]))
+    return pal
+
+
+def apply_theme(name, app=None):
+    """Applies a theme to the whole application in a single repolish pass.
+
+    Widgets must not carry their own stylesheets, otherwise Qt re-parses them
+    per widget on every switch.
+    """
+    app = app or QApplication.instance()
+    app.setPalette(palette(name))
+    app.setStyleSheet(stylesheet(name))
+    app.setProperty("theme", name)
+
+
+def current_theme(app=None):
+    app = app or QApplication.instance()
+    return app.property("theme") or "light"
+
+
+def toggle_theme(app=None):
+    """Switches between the light and dark theme."""
+    apply_theme("dark" if current_theme(app) == "light" else "light", app)
@@ -0,0 +1,219 @@
+"""Filtering navigator items by title as the user types.
+
+A TitleIndex keeps, for every distinct title word in sorted order, the
+items whose titles contain it, all in one list. The items with a word
+starting with a given prefix are then a contiguous slice of that list,
+found by binary search over the distinct words. A query matches titles
+that have, for each of its words, a word starting with it. The ancestors
+of matching items stay visible, so a match is always shown in context.
+
+While the query only gets narrower each keystroke intersects the previous
+result with its new slices, and every step is kept: deleting characters
+pops back to the kept result instead of searching again.
+
+ItemFilter applies the result to widget items. It only touches items whose
+visibility changed, and of a hidden branch only its highest item, since the
+view hides everything below it. A short query can still change tens of
+thousands of items, so the work is done in slices of at most a frame budget
+between which the event loop runs; a new keystroke abandons the rest.
+"""
+
+import re
+from bisect import bisect_left
+from itertools import accumulate, chain, compress, filterfalse, islice
+from time import perf_counter
+
+_WORD = re.compile(r"\w+")
+_AFTER_PREFIX = "\U0010ffff"
+CHUNK = 4096  # items handled between checks of the time budget
+WIDGET_CHUNK = 256  # setHidden calls between checks; each costs far more than a set operation
+FRAME_BUDGET = 0.008  # seconds of filtering per event loop pass, leaving the rest of a 16 ms frame
+
+
+def words(text):
+    return _WORD.findall(text.casefold())
+
+
+def _chunks(items, size=CHUNK):
+    it = iter(items)
+    return iter(lambda: list(islice(it, size)), [])
+
+
+class TitleIndex:
+    def __init__(self, titles, parents=None):
+        """titles[i] is the title of item i; parents[i] is its parent's index, or -1."""
+        self.size = len(titles)
+        self.parents = list(parents) if parents is not None else [-1] * self.size
+        postings = {}
+        for i, title in enumerate(titles):
+            for word in set(words(title)):
+                postings.setdefault(word, []).append(i)
+        self.words = sorted(postings)
+        # self.ids[self.starts[k]:self.starts[k + 1]] are the items with the word self.words[k]
+        self.starts = list(accumulate(map(len, map(postings.__getitem__, self.words)), initial=0))
+        self.ids = list(chain.from_iterable(map(postings.__getitem__, self.words)))
+        self.path = []  # (slices, matches, visible items) of each narrowing step of the last query
+
+    def prefix_range(self, prefix):
+        """Returns the slice of self.ids holding the items with a word starting with prefix."""
+        lo = bisect_left(self.words, prefix)
+        hi = bisect_left(self.words, prefix + _AFTER_PREFIX, lo)
+        return self.starts[lo], self.starts[hi]
+
+    def matches(self, query):
+        """Returns the set of items matching query, or None if the query is empty (all match)."""
+        visible = self.visible(query)
+        return self.path[-1][1] if visible is not None else None
+
+    def visible(self, query):
+        """Returns the matching items plus all their ancestors, or None if everything is visible."""
+        search = self.search(query)
+        while True:
+            try:
+                next(search)
+            except StopIteration as done:
+                return done.value
+
+    def search(self, query):
+        """Generator doing the work of visible() in chunks; yields between them and returns the result."""
+        slices = frozenset(map(self.prefix_range, words(query)))
+        if not slices:
+            return None
+        # Keep the steps this query narrows; a deleted character leaves the earlier ones on top
+        while self.path and not _narrows(slices, self.path[-1][0]):
+            self.path.pop()
+        if self.path and self.path[-1][0] == slices:
+            return self.path[-1][2]
+
+        if self.path:
+            last_slices, result, _ = self.path[-1]
+            new = slices - last_slices
+        else:
+            result, new = None, slices
+        for lo, hi in sorted(new, key=lambda r: r[1] - r[0]):
+            narrowed = set()
+            for chunk in _chunks(self.ids[lo:hi]):
+                narrowed.update(chunk if result is None else result.intersection(chunk))
+                yield
+            result = narrowed
+            if not result:
+                break
+        visible = set(result)
+        # One level at a time; siblings share parents, so each level is a lot smaller
+        level = result
+        while level:
+            above = set()
+            for chunk in _chunks(level):
+                above.update(map(self.parents.__getitem__, chunk))
+                yield
+            above.discard(-1)
+            above = above - visible  # not -=, which would go through all of visible
+            visible |= above
+            level = above
+        self.path.append((slices, result, visible))
+        return visible
+
+
+def _narrows(slices, last_slices):
+    """True if every slice of last_slices contains one of slices, so the matches can only shrink."""
+    return all(any(lo <= new_lo and new_hi <= hi for new_lo, new_hi in slices) for lo, hi in last_slices)
+
+
+class ItemFilter:
+    """Shows only the items (anything with setHidden and isHidden) whose titles match a query.
+
+    start() sets the query and run() does the work, within a time budget if given; apply() does both.
+    """
+
+    def __init__(self, items, titles, parents=None):
+        self.items = items
+        self.index = TitleIndex(titles, parents)
+        self.children = [[] for _ in items]
+        for i, parent in enumerate(self.index.parents):
+            if parent != -1:
+                self.children[parent].append(i)
+        self.top = frozenset(i for i, parent in enumerate(self.index.parents) if parent == -1)
+        # hidden[i] is item i's hidden flag; an item below a hidden one may keep a stale flag.
+        # Bytes rather than a set, which would stall now and then to grow while items are hidden
+        self.hidden = bytearray(item.isHidden() for item in items)
+        self.shown = None  # the visible items, or None while any item may be showing
+        self.job = None
+
+    @classmethod
+    def for_tree(cls, tree):
+        items, titles, parents = [], [], []
+        stack = [(tree.topLevelItem(i), -1) for i in reversed(range(tree.topLevelItemCount()))]
+        while stack:
+            item, parent = stack.pop()
+            index = len(items)
+            items.append(item)
+            titles.append(item.text(0))
+            parents.append(parent)
+            stack.extend((item.child(i), index) for i in reversed(range(item.childCount())))
+        return cls(items, titles, parents)
+
+    @classmethod
+    def for_list(cls, list_widget):
+        items = [list_widget.item(i) for i in range(list_widget.count())]
+        return cls(items, [item.text() for item in items])
+
+    def apply(self, query):
+        self.start(query)
+        self.run()
+
+    def start(self, query):
+        """Starts filtering by query, abandoning the rest of the previous query's work."""
+        if self.job is not None:
+            self.job.close()
+        self.job = self._filter(query)
+
+    def run(self, budget=None):
+        """Works on the query for about budget seconds (or until done); returns True once it is applied."""
+        if self.job is None:
+            return True
+        deadline = perf_counter() + budget if budget is not None else None
+        for _ in self.job:
+            if deadline is not None and perf_counter() > deadline:
+                return False
+        self.job = None
+        return True
+
+    def _filter(self, query):
+        visible = yield from self.index.search(query)
+        if visible is self.shown and visible is not None:
+            return  # e.g. "mee" -> "meet" when "meeting" is the only word starting with either
+        shown, self.shown = self.shown, None  # until every change below is made
+        hidden = self.hidden.__getitem__
+        if visible is None:
+            show, hide = compress(range(len(self.items)), self.hidden), []
+        else:
+            show, hide = [], []
+            for chunk in _chunks(visible):
+                show.extend(filter(hidden, chunk))
+                yield
+            # Hide the items that went away whose parent stays, and the children of items that
+            # came back which don't match; whatever is below them goes with them
+            for chunk in _chunks(range(len(self.items)) if shown is None else shown):
+                gone = list(filterfalse(visible.__contains__, chunk))
+                stays = map(visible.__contains__, map(self.index.parents.__getitem__, gone))
+                hide.extend(filterfalse(hidden, compress(gone, stays)))
+                hide.extend(filterfalse(hidden, filter(self.top.__contains__, gone)))
+                yield
+            if shown is not None:
+                for part in _chunks(visible):
+                    came = filterfalse(shown.__contains__, part)
+                    for chunk in _chunks(chain.from_iterable(map(self.children.__getitem__, came))):
+                        hide.extend(filterfalse(hidden, filterfalse(visible.__contains__, chunk)))
+                        yield
+                    yield
+        for chunk in _chunks(show, WIDGET_CHUNK):
+            for i in chunk:
+                self.items[i].setHidden(False)
+                self.hidden[i] = False
+            yield
+        for chunk in _chunks(hide, WIDGET_CHUNK):
+            for i in chunk:
+                self.items[i].setHidden(True)
+                self.hidden[i] = True
+            yield
+        self.shown = visible
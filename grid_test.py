@@ -1,32 +1,89 @@
+import math
 import sys
+from array import array
 
-from PySide6.QtCore import Qt, QPointF, QRectF
-from PySide6.QtGui import QPainter, QPen, QColor
-from PySide6.QtWidgets import QApplication, QWidget, QGraphicsScene, QGraphicsView, QVBoxLayout, QPushButton, QGraphicsPixmapItem, \
-    QGraphicsItem
+from PySide6.QtCore import Qt, QLineF, QPointF, QRectF
+from PySide6.QtGui import QPainter, QPainterPath, QPen, QColor
+from PySide6.QtWidgets import QApplication, QWidget, QGraphicsScene, QGraphicsView, QVBoxLayout, QPushButton, \
+    QGraphicsItem, QGraphicsLineItem, QGraphicsPathItem
+
+from RenderProfiler import profiler, traced
+
+CHUNK_SIZE = 1024  # side of a square storage chunk, in scene units
+CHUNK_MARGIN = 1  # chunks around the viewport that are kept as scene items
+SCENE_MARGIN = 4000  # the scene rect always reaches at least this far past the viewport
+
+
+def chunk_of(x, y):
+    return math.floor(x / CHUNK_SIZE), math.floor(y / CHUNK_SIZE)
+
+
+class InkChunks:
+    """Finished strokes, split into CHUNK_SIZE squares so any area can be looked up directly.
+
+    Each chunk holds, per pen, the polylines that fall into it as flat
+    x, y arrays, which take far less memory than one scene item per segment.
+    """
+
+    def __init__(self):
+        self.chunks = {}  # (col, row) -> {(rgba, width): [array of x, y, x, y, ...]}
+
+    def add_stroke(self, points, color, width):
+        """Stores a stroke given as a list of QPointF; returns the chunks it touched."""
+        pen = (color.rgba(), width)
+        touched = set()
+        run, run_chunk = None, None
+        for start, end in zip(points, points[1:]):
+            chunk = chunk_of((start.x() + end.x()) / 2, (start.y() + end.y()) / 2)
+            if chunk != run_chunk:
+                # Segments are filed under the chunk of their midpoint; a stroke
+                # that crosses a border continues as a new polyline there
+                run = array("f", (start.x(), start.y()))
+                run_chunk = chunk
+                self.chunks.setdefault(chunk, {}).setdefault(pen, []).append(run)
+                touched.add(chunk)
+            run.extend((end.x(), end.y()))
+        return touched
+
+    def pens(self, chunk):
+        return self.chunks.get(chunk, {})
+
+    def clear(self):
+        self.chunks.clear()
+
+
+# The strokes of one pen in one chunk, and a segment of the stroke being drawn: plain Qt items
+# unless profiling, when their paint calls are traced
+InkItem = profiler.traced_item(QGraphicsPathItem, "InkItem.paint")
+SegmentItem = profiler.traced_item(QGraphicsLineItem, "SegmentItem.paint")
 
 
 class GridItem(QGraphicsItem):
     """A vector-based grid that dynamically redraws based on zoom level."""
 
-    def __init__(self, grid_size=20):
+    def __init__(self, grid_size=20, rect=QRectF()):
         super().__init__()
         self.grid_size = grid_size
         self.grid_pen = QPen(QColor(0, 0, 50, 255), 1)  # Thin pen
+        self.rect = QRectF(rect)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
 
     def boundingRect(self):
-        """Defines the bounding area of the grid (large enough to cover the scene)."""
-        return QRectF(0, 0, 8000, 6000)
+        """Defines the bounding area of the grid (kept equal to the scene rect)."""
+        return self.rect
+
+    def set_rect(self, rect):
+        """Follows the scene rect as the canvas grows."""
+        self.prepareGeometryChange()
+        self.rect = QRectF(rect)
 
+    @traced("item", name="GridItem.paint", item=True)
     def paint(self, painter, option, widget=None):
         """Draws the grid dynamically within the visible scene area."""
         painter.setPen(self.grid_pen)
 
-        # Ensure widget is a QGraphicsView
-        if isinstance(widget, QGraphicsView):
-            rect = widget.mapToScene(widget.viewport().rect()).boundingRect()
-        else:
-            rect = self.boundingRect()
+        # Only the exposed part: the grid is as large as the (unbounded) scene
+        rect = option.exposedRect
 
         left = int(rect.left()) - (int(rect.left()) % self.grid_size)
         top = int(rect.top()) - (int(rect.top()) % self.grid_size)
@@ -58,23 +115,42 @@ class DrawEraseCanvas(QGraphicsView):
         self.scene.setBackgroundBrush(QColor(255, 255, 255))
         self.setScene(self.scene)
 
+        # The canvas has no edges: the scene rect grows whenever the viewport
+        # gets near it, and the grid follows
+        initial_rect = QRectF(0, 0, 8000, 6000)
+        self.setSceneRect(initial_rect)
+
         # Create and add the vector-based grid
-        self.grid = GridItem(grid_size=20)
+        self.grid = GridItem(grid_size=20, rect=initial_rect)
         self.scene.addItem(self.grid)
 
         self.setRenderHint(QPainter.RenderHint.Antialiasing)
         self.drawing = False
         self.pen_color = QColor(0, 0, 0)
         self.pen_width = 3
-        self.setSceneRect(0, 0, 8000, 6000)
 
         self.last_point = QPointF()
         self.setMouseTracking(True)
 
+        # Finished strokes live in chunks; only chunks near the viewport have scene items
+        self.ink = InkChunks()
+        self.chunk_items = {}  # chunk -> its QGraphicsPathItems
+        self.stroke_points = []
+        self.stroke_items = []  # segments of the stroke being drawn
+        self.horizontalScrollBar().valueChanged.connect(self.update_viewport)
+        self.verticalScrollBar().valueChanged.connect(self.update_viewport)
+
         # Panning
         self.panning = False
         self.last_pan_point = QPointF()
 
+    if profiler.enabled:
+        # Only overridden when profiling, so painting otherwise stays in C++
+        @traced("frame", name="DrawEraseCanvas frame", frame=True)
+        def paintEvent(self, event):
+            super().paintEvent(event)
+
+    @traced("event")
     def wheelEvent(self, event):
         """Zoom in/out with the mouse wheel and adjust the grid spacing."""
         factor = 1.1 if event.angleDelta().y() > 0 else 0.9
@@ -87,23 +163,84 @@ class DrawEraseCanvas(QGraphicsView):
             new_grid_size = self.grid.grid_size / factor
 
         self.grid.set_grid_size(new_grid_size)
+        self.update_viewport()
+
+    @traced("event")
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_viewport()
+
+    def visible_scene_rect(self):
+        return self.mapToScene(self.viewport().rect()).boundingRect()
+
+    @traced("scene")
+    def update_viewport(self):
+        """Grows the scene rect ahead of the viewport and (de)materializes chunks around it."""
+        wanted = self.visible_scene_rect().adjusted(-SCENE_MARGIN, -SCENE_MARGIN, SCENE_MARGIN, SCENE_MARGIN)
+        if not self.sceneRect().contains(wanted):
+            rect = self.sceneRect().united(wanted)
+            self.setSceneRect(rect)
+            self.grid.set_rect(rect)
+
+        visible = self.visible_scene_rect()
+        first_col, first_row = chunk_of(visible.left(), visible.top())
+        last_col, last_row = chunk_of(visible.right(), visible.bottom())
+        first_col, first_row = first_col - CHUNK_MARGIN, first_row - CHUNK_MARGIN
+        last_col, last_row = last_col + CHUNK_MARGIN, last_row + CHUNK_MARGIN
+
+        def near(chunk):
+            return first_col <= chunk[0] <= last_col and first_row <= chunk[1] <= last_row
+
+        for chunk in [c for c in self.chunk_items if not near(c)]:
+            self.dematerialize(chunk)
+        # Zoomed far out, walking the stored chunks is cheaper than walking the range
+        if (last_col - first_col + 1) * (last_row - first_row + 1) > len(self.ink.chunks):
+            candidates = [c for c in self.ink.chunks if near(c)]
+        else:
+            candidates = [(col, row) for col in range(first_col, last_col + 1)
+                          for row in range(first_row, last_row + 1) if (col, row) in self.ink.chunks]
+        for chunk in candidates:
+            if chunk not in self.chunk_items:
+                self.materialize(chunk)
+
+    def materialize(self, chunk):
+        items = []
+        for (rgba, width), polylines in self.ink.pens(chunk).items():
+            path = QPainterPath()
+            for line in polylines:
+                path.moveTo(line[0], line[1])
+                for i in range(2, len(line), 2):
+                    path.lineTo(line[i], line[i + 1])
+            item = InkItem(path)
+            item.setPen(QPen(QColor.fromRgba(rgba), width, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap,
+                             Qt.PenJoinStyle.RoundJoin))
+            self.scene.addItem(item)
+            items.append(item)
+        self.chunk_items[chunk] = items
+
+    def dematerialize(self, chunk):
+        for item in self.chunk_items.pop(chunk):
+            self.scene.removeItem(item)
 
+    @traced("event")
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
             self.drawing = True
             self.last_point = self.mapToScene(event.position().toPoint())
+            self.stroke_points = [self.last_point]
         elif event.button() == Qt.MouseButton.MiddleButton:
             self.panning = True
             self.last_pan_point = event.position()
 
+    @traced("event")
     def mouseMoveEvent(self, event):
         if self.drawing:
             current_point = self.mapToScene(event.position().toPoint())
-            self.scene.addLine(
-                self.last_point.x(), self.last_point.y(),
-                current_point.x(), current_point.y(),
-                QPen(self.pen_color, self.pen_width)
-            )
+            item = SegmentItem(QLineF(self.last_point, current_point))
+            item.setPen(QPen(self.pen_color, self.pen_width))
+            self.scene.addItem(item)
+            self.stroke_items.append(item)
+            self.stroke_points.append(current_point)
             self.last_point = current_point
         elif self.panning:
             delta = event.position() - self.last_pan_point
@@ -111,18 +248,32 @@ class DrawEraseCanvas(QGraphicsView):
             self.horizontalScrollBar().setValue(int(self.horizontalScrollBar().value() - delta.x()))
             self.verticalScrollBar().setValue(int(self.verticalScrollBar().value() - delta.y()))
 
+    @traced("event")
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
             self.drawing = False
+            self.finish_stroke()
         elif event.button() == Qt.MouseButton.MiddleButton:
             self.panning = False
 
+    @traced("scene")
+    def finish_stroke(self):
+        """Moves the drawn stroke from its temporary segment items into the chunk store."""
+        for item in self.stroke_items:
+            self.scene.removeItem(item)
+        self.stroke_items = []
+        touched = self.ink.add_stroke(self.stroke_points, self.pen_color, self.pen_width)
+        self.stroke_points = []
+        for chunk in touched:
+            if chunk in self.chunk_items:
+                self.dematerialize(chunk)
+        self.update_viewport()
+
     def erase(self):
         """Erase only drawings while keeping the grid background."""
-        for item in self.scene.items():
-            if isinstance(item, QGraphicsPixmapItem):  # Avoid clearing the grid
-                continue
-            self.scene.removeItem(item)
+        for chunk in list(self.chunk_items):
+            self.dematerialize(chunk)
+        self.ink.clear()
 
     def set_pen_color(self, color):
         self.pen_color = color
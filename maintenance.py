@@ -0,0 +1,228 @@
+"""Batch maintenance of a notebook directory, without the GUI.
+
+    python maintenance.py [--root DIR] [--jobs N] reindex thumbnails compact verify
+    python maintenance.py convert --format pdf --out DIR
+
+Operations run in the order given. Per-page work is spread over a process
+pool, one task per page (or per blob), and progress is shown on stderr.
+verify exits with status 1 if it found any problem.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import NotebookStore
+import PageExporter
+from BlobStore import BlobStore
+from PageTextStore import PageTextStore
+from StrokeLog import PageReplica, decode_ops
+
+OPERATIONS = ("reindex", "thumbnails", "compact", "verify", "convert")
+THUMBNAIL_SIZE = 256
+_WORD = re.compile(r"\w+")
+
+
+class Progress:
+    """A single self-updating status line (or a line every few seconds when not on a terminal)."""
+
+    def __init__(self, label, total):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.start = self.last = time.monotonic()
+        self.tty = sys.stderr.isatty()
+
+    def update(self, done, total=None):
+        self.done = done
+        self.total = total or self.total
+        now = time.monotonic()
+        if self.tty or now - self.last >= 5 or self.done == self.total:
+            self.last = now
+            end = "\r" if self.tty and self.done < self.total else "\n"
+            sys.stderr.write(f"{self.label}: {self.done}/{self.total} ({now - self.start:.1f} s){end}")
+            sys.stderr.flush()
+
+    def step(self):
+        self.update(self.done + 1)
+
+
+def run_pool(executor, label, function, items, *args):
+    """Runs function(item, *args) for every item; yields results as they finish."""
+    items = list(items)
+    progress = Progress(label, len(items))
+    if not items:
+        progress.update(0)
+        return
+    futures = [executor.submit(function, item, *args) for item in items]
+    for future in as_completed(futures):
+        progress.step()
+        yield future.result()
+
+
+# Workers
+
+def index_page(page_dir):
+    """Returns (page dir, title, words of its title and text)."""
+    title = NotebookStore.page_title(page_dir)
+    words = set(_WORD.findall(title.casefold()))
+    text_dir = os.path.join(page_dir, NotebookStore.TEXT_DIR)
+    if os.path.isdir(text_dir):
+        words.update(_WORD.findall(PageTextStore(text_dir).text().casefold()))
+    return page_dir, title, sorted(words)
+
+
+def make_thumbnail(page_dir, size):
+    image = PageExporter.render_thumbnail(NotebookStore.load_strokes(page_dir), size)
+    image.save(os.path.join(page_dir, NotebookStore.THUMBNAIL_FILE))
+
+
+def compact_page(page_dir):
+    """Rewrites a page's files at their smallest; returns (bytes before, bytes after)."""
+    before = _tree_size(page_dir)
+
+    # Erased strokes, their moves and overwritten text become noops; a log without any is left alone
+    log = os.path.join(page_dir, NotebookStore.STROKES_FILE)
+    if os.path.exists(log):
+        replica = PageReplica.load(log, "maintenance")
+        if replica.compact():
+            replica.save(log)
+
+    text_dir = os.path.join(page_dir, NotebookStore.TEXT_DIR)
+    if os.path.isdir(text_dir):
+        store = PageTextStore(text_dir)
+        blocks = store.block_count()
+        # Edits leave chunks smaller than they need to be; re-chunk only then
+        if len(store.chunks) > -(-blocks // PageTextStore.CHUNK_BLOCKS):
+            PageTextStore.from_text(store.text(), text_dir).save()
+        # Leftovers of interrupted saves
+        live = {f"{c.id}.txt" for c in PageTextStore(text_dir).chunks} | {PageTextStore.INDEX_FILE}
+        for name in os.listdir(text_dir):
+            if name not in live:
+                os.remove(os.path.join(text_dir, name))
+    return before, _tree_size(page_dir)
+
+
+def verify_page(page_dir):
+    """Returns a list of problems found in a page's files."""
+    problems = []
+    log = os.path.join(page_dir, NotebookStore.STROKES_FILE)
+    if os.path.exists(log):
+        try:
+            with open(log, "rb") as f:
+                PageReplica("maintenance").apply(decode_ops(f.read()))
+        except Exception as e:
+            problems.append(f"{log}: cannot decode ({e})")
+
+    text_dir = os.path.join(page_dir, NotebookStore.TEXT_DIR)
+    if os.path.isdir(text_dir):
+        try:
+            problems.extend(f"{text_dir}: {problem}" for problem in PageTextStore(text_dir).verify())
+        except (OSError, ValueError, KeyError) as e:
+            problems.append(f"{text_dir}: unreadable index ({e})")
+    return problems
+
+
+def verify_blob(key, blob_root):
+    return None if BlobStore(blob_root).verify(key) else f"blob {key}: content does not match its hash"
+
+
+def _tree_size(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+# Operations
+
+def reindex(root, pages, executor):
+    index = {"pages": [], "words": {}}
+    # Numbered in path order, not in the order the workers finish, so the index is the same every run
+    for page_dir, title, words in sorted(run_pool(executor, "reindex", index_page, pages)):
+        number = len(index["pages"])
+        index["pages"].append({"path": os.path.relpath(page_dir, root), "title": title})
+        for word in words:
+            index["words"].setdefault(word, []).append(number)
+    path = NotebookStore.search_index_path(root)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(path + ".tmp", path)
+    print(f"reindex: {len(index['pages'])} pages, {len(index['words'])} words")
+    return 0
+
+
+def thumbnails(root, pages, executor, size=THUMBNAIL_SIZE):
+    for _ in run_pool(executor, "thumbnails", make_thumbnail, pages, size):
+        pass
+    return 0
+
+
+def compact(root, pages, executor):
+    before = after = 0
+    for page_before, page_after in run_pool(executor, "compact", compact_page, pages):
+        before += page_before
+        after += page_after
+    print(f"compact: pages {before} -> {after} bytes")
+    return 0
+
+
+def verify(root, pages, executor):
+    problems = []
+    for page_problems in run_pool(executor, "verify pages", verify_page, pages):
+        problems.extend(page_problems)
+    blob_root = NotebookStore.blob_root(root)
+    if os.path.isdir(blob_root):
+        keys = list(BlobStore(blob_root).keys())
+        problems.extend(p for p in run_pool(executor, "verify blobs", verify_blob, keys, blob_root) if p)
+    for problem in problems:
+        print(problem)
+    print(f"verify: {len(problems)} problems")
+    return 1 if problems else 0
+
+
+def convert(root, pages, executor, fmt, out_dir, scale=1.0):
+    progress = Progress(f"convert to {fmt}", len(pages))
+    # export_pages counts in hundredths of a page
+    written = PageExporter.export_pages(pages, root, out_dir, fmt, executor, scale=scale,
+                                        progress=lambda done, total: progress.update(done // 100, total // 100))
+    print(f"convert: wrote {len(written)} files to {out_dir}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain a PyNote notebook directory.")
+    parser.add_argument("operations", nargs="+", choices=OPERATIONS, metavar="operation",
+                        help="one or more of: " + ", ".join(OPERATIONS))
+    parser.add_argument("--root", default=NotebookStore.default_root(), help="notebook directory")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--thumbnail-size", type=int, default=THUMBNAIL_SIZE)
+    parser.add_argument("--format", choices=PageExporter.FORMATS, default="pdf", help="convert: output format")
+    parser.add_argument("--out", help="convert: output directory")
+    parser.add_argument("--scale", type=float, default=1.0, help="convert: scale factor")
+    args = parser.parse_args(argv)
+    if "convert" in args.operations and not args.out:
+        parser.error("convert needs --out")
+    if not os.path.isdir(args.root):
+        parser.error(f"{args.root} is not a directory")
+
+    pages = list(NotebookStore.iter_pages(args.root))
+    status = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for operation in args.operations:
+            if operation == "reindex":
+                status |= reindex(args.root, pages, executor)
+            elif operation == "thumbnails":
+                status |= thumbnails(args.root, pages, executor, args.thumbnail_size)
+            elif operation == "compact":
+                status |= compact(args.root, pages, executor)
+            elif operation == "verify":
+                status |= verify(args.root, pages, executor)
+            elif operation == "convert":
+                status |= convert(args.root, pages, executor, args.format, args.out, args.scale)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())